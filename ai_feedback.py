@@ -1,18 +1,30 @@
 from __future__ import annotations
-import os
 import json
-import requests
+import os
+import statistics
 from datetime import date, timedelta
 from fastapi import APIRouter, Depends, Request, HTTPException
 from fastapi.responses import HTMLResponse
 from sqlmodel import Session, select
 from starlette.templating import Jinja2Templates
 from collections import defaultdict
-from models import Student, Journal, Attendance, TestRecord, Feedback
+from models import Journal, Attendance, TestRecord, Feedback
 from db import get_session
+from dependencies import StudentAccess, get_student_access
+from metrics import inc
+from tracing import span, traced
+import gemini
+from gemini import GeminiError, GeminiUnavailable
 
 router = APIRouter(prefix="/insights", tags=["Insights"])
 
+# Tokens of student data a prompt may carry; longer histories are compacted to fit
+INSIGHTS_PROMPT_TOKENS = int(os.getenv("INSIGHTS_PROMPT_TOKENS", "2000"))
+# Days over which a record's weight for inclusion halves
+INSIGHTS_RECENCY_DAYS = float(os.getenv("INSIGHTS_RECENCY_DAYS", "14"))
+# A test this many standard deviations from the subject's average is kept as unusual
+INSIGHTS_ANOMALY_Z = float(os.getenv("INSIGHTS_ANOMALY_Z", "1.5"))
+
 # -------- Templates wiring (set from main.py) --------
 _templates: Jinja2Templates | None = None
 
@@ -22,11 +34,6 @@ def init_templates(templates: Jinja2Templates) -> None:
     _templates = templates
 
 
-# Gemini API setup (using direct HTTP requests)
-GEMINI_API_KEY = os.getenv("GOOGLE_API_KEY")
-GEMINI_API_URL = "https://generativelanguage.googleapis.com/v1beta/models/gemini-1.5-flash:generateContent"
-
-
 # ---------------- Context ----------------
 def get_start_end_dates(period: str) -> tuple[date, date]:
     """
@@ -48,6 +55,7 @@ def get_start_end_dates(period: str) -> tuple[date, date]:
     return start_date, end_date
 
 
+@traced()
 def collect_student_context(session: Session, student_id: int, start_date: date, end_date: date):
     """
     Collects student's academic data within a given date range.
@@ -84,47 +92,208 @@ def collect_student_context(session: Session, student_id: int, start_date: date,
     return context
 
 
-def format_data_for_ai(context: dict) -> str:
+# ---------------- Prompt ----------------
+def estimate_tokens(text: str) -> int:
+    """Rough token count, about four characters per token for English text; no tokenizer call."""
+    return (len(text) + 3) // 4
+
+
+def _journal_line(j: Journal) -> str:
+    return f"- Date: {j.entry_date}, Subject: {j.subject}, Journal: {j.journal}, Remarks: {j.remarks}"
+
+
+def _test_line(t: TestRecord) -> str:
+    return f"- Date: {t.test_date}, Subject: {t.subject}, Topic: {t.topic}, Marks: {t.marks_attained}/{t.total_marks}, Remarks: {t.remarks}"
+
+
+def _percentage(t: TestRecord) -> float | None:
+    return 100 * t.marks_attained / t.total_marks if t.total_marks else None
+
+
+def _unusual(t: TestRecord, stats: dict[str, tuple[float, float]]) -> bool:
+    mean, deviation = stats.get(t.subject, (0.0, 0.0))
+    percentage = _percentage(t)
+    return percentage is not None and deviation > 0 and abs(percentage - mean) / deviation >= INSIGHTS_ANOMALY_Z
+
+
+def _attendance_lines(attendance: list) -> list[str]:
+    attendance_summary = defaultdict(int)
+    for a in attendance:
+        attendance_summary[a.status.lower()] += 1
+    return [
+        "Attendance Records:",
+        f"  - Total Present: {attendance_summary['present']}",
+        f"  - Total Absent: {attendance_summary['absent']}",
+        f"  - Total Late: {attendance_summary['late']}",
+        "\n",
+    ]
+
+
+def _lines_cost(lines: list[str]) -> float:
+    return sum(len(line) + 1 for line in lines) / 4  # estimate_tokens() of each line and its newline, unrounded
+
+
+def _digest_counts(tests: int, average: float | None, journals: int) -> str:
+    parts = [f"{tests} tests, average {average:.0f}%"] if tests else []
+    if journals:
+        parts.append(f"{journals} journal entries")
+    return "; ".join(parts)
+
+
+def _subject_digests(journals: list, tests: list, budget: float) -> tuple[list[str], dict[str, tuple[float, float]]]:
+    """
+    One statistics line per subject over every record, within `budget` tokens, and each
+    subject's (mean, std dev) test percentage. With too many subjects for full lines, they
+    shrink to counts and averages, and if even those do not fit, the subjects with the
+    fewest records are merged into a single line.
+    """
+    tests_by_subject, journals_by_subject = defaultdict(list), defaultdict(list)
+    for t in tests:
+        if (percentage := _percentage(t)) is not None:
+            tests_by_subject[t.subject].append((t.test_date, percentage))
+    for j in journals:
+        journals_by_subject[j.subject].append(j.entry_date)
+
+    subjects = sorted(tests_by_subject.keys() | journals_by_subject.keys())
+    full, short, stats = {}, {}, {}
+    for subject in subjects:
+        parts = []
+        scores = sorted(tests_by_subject.get(subject, ()))
+        values = [percentage for _, percentage in scores]
+        if scores:
+            mean = statistics.fmean(values)
+            stats[subject] = (mean, statistics.pstdev(values))
+            parts.append(f"{len(values)} tests, average {mean:.0f}% (range {min(values):.0f}-{max(values):.0f}%)")
+            if len(values) >= 4:
+                half = len(values) // 2
+                change = round(statistics.fmean(values[half:]) - statistics.fmean(values[:half]))
+                parts.append(f"recent half of tests {change:+d} points against the earlier half")
+            parts.append(f"latest on {scores[-1][0]}: {scores[-1][1]:.0f}%")
+        dates = journals_by_subject.get(subject, ())
+        if dates:
+            parts.append(f"{len(dates)} journal entries from {min(dates)} to {max(dates)}")
+        full[subject] = f"- {subject}: " + "; ".join(parts)
+        short[subject] = f"- {subject}: " + _digest_counts(len(values), stats[subject][0] if scores else None, len(dates))
+
+    for lines in (full, short):
+        if _lines_cost(list(lines.values())) <= budget:
+            return list(lines.values()), stats
+
+    # the subjects with the most records keep their own line; the rest share one
+    by_size = sorted(subjects, key=lambda s: len(tests_by_subject.get(s, ())) + len(journals_by_subject.get(s, ())),
+                     reverse=True)
+    for kept in range(len(subjects) - 1, -1, -1):
+        merged = by_size[kept:]
+        values = [percentage for s in merged for _, percentage in tests_by_subject.get(s, ())]
+        other = (f"- {len(merged)} other subjects: "
+                 + _digest_counts(len(values), statistics.fmean(values) if values else None,
+                                  sum(len(journals_by_subject.get(s, ())) for s in merged)))
+        own = set(by_size[:kept])
+        lines = [short[s] for s in subjects if s in own] + [other]
+        if _lines_cost(lines) <= budget:
+            break
+    return lines, stats
+
+
+def _select_records(journals: list, tests: list, stats: dict,
+                    budget: float) -> tuple[dict[tuple[date, int], str], dict[tuple[date, int], str]]:
+    """
+    The prompt lines of the journals and tests (by date and position) to quote within `budget` tokens:
+    each subject's latest test, then by recency, an unusual result counting double.
+    """
+    dates = [j.entry_date for j in journals] + [t.test_date for t in tests]
+    newest = max(dates) if dates else date.today()
+
+    def recency(day: date) -> float:
+        return 0.5 ** ((newest - day).days / INSIGHTS_RECENCY_DAYS)
+
+    latest = {}
+    for t in tests:
+        if t.subject not in latest or t.test_date >= latest[t.subject].test_date:
+            latest[t.subject] = t
+
+    candidates = [(recency(j.entry_date), "journal", (j.entry_date, i), _journal_line(j))
+                  for i, j in enumerate(journals)]
+    for i, t in enumerate(tests):
+        line, unusual = _test_line(t), _unusual(t, stats)
+        if unusual:
+            line += f" (unusual: subject average {stats[t.subject][0]:.0f}%)"
+        score = recency(t.test_date) * (2 if unusual else 1) + (2 if latest[t.subject] is t else 0)
+        candidates.append((score, "test", (t.test_date, i), line))
+
+    chosen = {"journal": {}, "test": {}}
+    for _, kind, key, line in sorted(candidates, key=lambda c: c[0], reverse=True):
+        cost = _lines_cost([line])
+        if cost <= budget:
+            chosen[kind][key] = line
+            budget -= cost
+    return chosen["journal"], chosen["test"]
+
+
+def _compact(context: dict, budget: int) -> str:
+    """Per-subject digests of the whole window, plus as many recent or unusual records as the budget allows."""
+    journals, tests = context["journals"], context["tests"]
+    heading = "Subject Summaries (every record in the period):"
+    # the digests may fill half the budget, however many subjects there are; quoted records get the rest
+    digests, stats = _subject_digests(journals, tests, budget / 2 - _lines_cost([heading, "\n"]))
+    prompt_parts = [heading, *digests, "\n"]
+    if context["attendance"]:
+        prompt_parts += _attendance_lines(context["attendance"])
+
+    sections = (("Journal Entries", len(journals)), ("Test Records", len(tests)))
+    headings = [f"{title} ({count} most recent or notable of {count}; the rest are summarized above):\n\n\n"
+                for title, count in sections]  # longest they can be, with the section's closing blank line
+    remaining = budget - (len("\n".join(prompt_parts)) + 1 + len("".join(headings))) / 4
+    selections = _select_records(journals, tests, stats, remaining)
+
+    # quoted records keep their chronological order
+    for (title, count), selected in zip(sections, selections):
+        if selected:
+            prompt_parts.append(f"{title} ({len(selected)} most recent or notable of {count}; the rest are summarized above):")
+            prompt_parts += [selected[key] for key in sorted(selected)]
+            prompt_parts.append("\n")
+
+    return "\n".join(prompt_parts)
+
+
+@traced()
+def format_data_for_ai(context: dict, budget: int = INSIGHTS_PROMPT_TOKENS) -> str:
     """
     Formats the collected data into a structured string for the AI model.
+
+    Every record is quoted while that fits in `budget` tokens. Past that, the
+    prompt carries per-subject digests of the whole window and only the most
+    recent and unusual records, so its size (and Gemini's latency) stays
+    roughly the same however long the student's history is, and however many
+    subjects it covers.
     """
     prompt_parts = []
 
     if context["journals"]:
         prompt_parts.append("Journal Entries:")
-        for j in context["journals"]:
-            prompt_parts.append(
-                f"- Date: {j.entry_date}, Subject: {j.subject}, Journal: {j.journal}, Remarks: {j.remarks}"
-            )
+        prompt_parts += [_journal_line(j) for j in context["journals"]]
         prompt_parts.append("\n")
 
     if context["tests"]:
         prompt_parts.append("Test Records:")
-        for t in context["tests"]:
-            prompt_parts.append(
-                f"- Date: {t.test_date}, Subject: {t.subject}, Topic: {t.topic}, Marks: {t.marks_attained}/{t.total_marks}, Remarks: {t.remarks}"
-            )
+        prompt_parts += [_test_line(t) for t in context["tests"]]
         prompt_parts.append("\n")
 
     if context["attendance"]:
-        prompt_parts.append("Attendance Records:")
-        attendance_summary = defaultdict(int)
-        for a in context["attendance"]:
-            attendance_summary[a.status.lower()] += 1
-
-        prompt_parts.append(f"  - Total Present: {attendance_summary['present']}")
-        prompt_parts.append(f"  - Total Absent: {attendance_summary['absent']}")
-        prompt_parts.append(f"  - Total Late: {attendance_summary['late']}")
-        prompt_parts.append("\n")
+        prompt_parts += _attendance_lines(context["attendance"])
 
-    return "\n".join(prompt_parts)
+    prompt = "\n".join(prompt_parts)
+    if estimate_tokens(prompt) <= budget:
+        return prompt
+    return _compact(context, budget)
 
 
 def call_gemini_api(summary_for_ai: str):
     """
     Calls the Gemini API to get feedback based on the provided data.
+    Raises GeminiError when Gemini cannot answer (see gemini.py).
     """
-    if not GEMINI_API_KEY:
+    if not gemini.GEMINI_API_KEY:
         return {"error": "API key not set."}
 
     prompt = f"""
@@ -140,10 +309,6 @@ def call_gemini_api(summary_for_ai: str):
     {summary_for_ai}
     """
 
-    headers = {
-        "Content-Type": "application/json"
-    }
-
     payload = {
         "contents": [
             {
@@ -157,16 +322,9 @@ def call_gemini_api(summary_for_ai: str):
         }
     }
 
-    try:
-        response = requests.post(
-            f"{GEMINI_API_URL}?key={GEMINI_API_KEY}",
-            headers=headers,
-            json=payload
-        )
-        response.raise_for_status()
-
-        feedback_data = response.json()
+    feedback_data = gemini.generate(payload, caller="insights")
 
+    try:
         # Extract the JSON string from the response
         generated_json_string = feedback_data["candidates"][0]["content"]["parts"][0]["text"]
 
@@ -174,30 +332,83 @@ def call_gemini_api(summary_for_ai: str):
         parsed_data = json.loads(generated_json_string)
         return parsed_data
 
-    except requests.exceptions.HTTPError as err:
-        return {"error": f"HTTP Error: {err}"}
-    except requests.exceptions.RequestException as e:
-        return {"error": f"Request Error: {e}"}
-    except (json.JSONDecodeError, KeyError) as e:
+    except (json.JSONDecodeError, KeyError, IndexError) as e:
         return {"error": f"Failed to parse AI response: {e}"}
-    except Exception as e:
-        return {"error": f"An unexpected error occurred: {e}"}
+
+
+def last_feedback(session: Session, student_id: int, period: str) -> Feedback | None:
+    """The student's most recent saved feedback, preferring the requested period."""
+    return session.exec(
+        select(Feedback)
+        .where(Feedback.student_id == student_id)
+        .order_by((Feedback.period == period).desc(), Feedback.end_date.desc(), Feedback.id.desc())
+    ).first()
+
+
+def _stale_feedback(session: Session, student_id: int, period: str, error: GeminiError) -> dict:
+    """What to answer when Gemini cannot: the last saved report, if there is one, flagged as such."""
+    cached = last_feedback(session, student_id, period)
+    if cached is None:
+        if isinstance(error, GeminiUnavailable):
+            return {"ai_feedback": f"AI insights are temporarily unavailable. Try again in {error.retry_after:.0f} seconds."}
+        return {"ai_feedback": f"AI insights could not be generated: {error}"}
+    inc("cache_requests_total", (("cache", "ai_feedback"), ("outcome", "stale")))
+    return {
+        "ai_feedback": cached.feedback_text,
+        "stale": True,
+        "notice": f"AI insights are temporarily unavailable; showing the report for "
+                  f"{cached.start_date:%d %b %Y} to {cached.end_date:%d %b %Y}.",
+    }
+
+
+def generate_feedback(session: Session, student_id: int, period: str, start_date: date, end_date: date,
+                      replaces: Feedback | None = None) -> dict:
+    """Asks Gemini for a new report and saves it in place of `replaces`; the endpoints' response body."""
+    context = collect_student_context(session, student_id, start_date, end_date)
+    if not context or (not context["journals"] and not context["tests"] and not context["attendance"]):
+        return {"ai_feedback": "No data available for this period."}
+
+    summary_for_ai = format_data_for_ai(context)
+
+    try:
+        feedback_data = call_gemini_api(summary_for_ai)
+    except GeminiError as e:
+        return _stale_feedback(session, student_id, period, e)
+
+    if "error" in feedback_data:
+        return {"ai_feedback": feedback_data["error"]}
+
+    feedback_json_text = json.dumps(feedback_data)
+
+    new_feedback = Feedback(
+        student_id=student_id,
+        period=period,
+        start_date=start_date,
+        end_date=end_date,
+        feedback_text=feedback_json_text
+    )
+
+    with span("feedback.commit"):
+        # the old report is only dropped once its replacement exists
+        if replaces is not None:
+            session.delete(replaces)
+        session.add(new_feedback)
+        session.commit()
+        session.refresh(new_feedback)
+
+    return {"ai_feedback": new_feedback.feedback_text}
 
 
 # ---------------- Endpoints ----------------
 @router.get("/{student_id}", response_class=HTMLResponse)
-def get_insights_page(request: Request, student_id: int, session: Session = Depends(get_session)):
-    student = session.get(Student, student_id)
-    if not student:
-        raise HTTPException(status_code=404, detail="Student not found.")
-
+def get_insights_page(request: Request, student_id: int, access: StudentAccess = Depends(get_student_access)):
     return _templates.TemplateResponse(
         "insights.html",
-        {"request": request, "student": student}
+        {"request": request, "student": access.student}
     )
 
 
-@router.get("/student/{student_id}/{period}/data")
+@router.get("/student/{student_id}/{period}/data", dependencies=[Depends(get_student_access)])
 def get_student_data(student_id: int, period: str, session: Session = Depends(get_session)):
     try:
         start_date, end_date = get_start_end_dates(period)
@@ -222,7 +433,7 @@ def get_student_data(student_id: int, period: str, session: Session = Depends(ge
     }
 
 
-@router.post("/student/{student_id}/{period}/ai")
+@router.post("/student/{student_id}/{period}/ai", dependencies=[Depends(get_student_access)])
 def get_insights_ai(student_id: int, period: str, session: Session = Depends(get_session)):
     try:
         start_date, end_date = get_start_end_dates(period)
@@ -240,45 +451,23 @@ def get_insights_ai(student_id: int, period: str, session: Session = Depends(get
     ).first()
 
     if existing_feedback:
+        inc("cache_requests_total", (("cache", "ai_feedback"), ("outcome", "hit")))
         return {"ai_feedback": existing_feedback.feedback_text}
 
-    # If no existing feedback, generate new
-    context = collect_student_context(session, student_id, start_date, end_date)
-    if not context or (not context["journals"] and not context["tests"] and not context["attendance"]):
-        return {"ai_feedback": "No data available for this period."}
-
-    summary_for_ai = format_data_for_ai(context)
-
-    feedback_data = call_gemini_api(summary_for_ai)
-
-    if "error" in feedback_data:
-        return {"ai_feedback": feedback_data["error"]}
+    inc("cache_requests_total", (("cache", "ai_feedback"), ("outcome", "miss")))
 
-    feedback_json_text = json.dumps(feedback_data)
-
-    new_feedback = Feedback(
-        student_id=student_id,
-        period=period,
-        start_date=start_date,
-        end_date=end_date,
-        feedback_text=feedback_json_text
-    )
-
-    session.add(new_feedback)
-    session.commit()
-    session.refresh(new_feedback)
-
-    return {"ai_feedback": new_feedback.feedback_text}
+    # If no existing feedback, generate new
+    return generate_feedback(session, student_id, period, start_date, end_date)
 
 
-@router.post("/student/{student_id}/{period}/ai/refresh")
+@router.post("/student/{student_id}/{period}/ai/refresh", dependencies=[Depends(get_student_access)])
 def refresh_insights_ai(student_id: int, period: str, session: Session = Depends(get_session)):
     try:
         start_date, end_date = get_start_end_dates(period)
     except HTTPException as e:
         return {"ai_feedback": e.detail}
 
-    # Delete existing feedback to force a refresh
+    # Replace existing feedback, keeping it if Gemini cannot produce a new one
     existing_feedback = session.exec(
         select(Feedback).where(
             Feedback.student_id == student_id,
@@ -288,34 +477,5 @@ def refresh_insights_ai(student_id: int, period: str, session: Session = Depends
         )
     ).first()
 
-    if existing_feedback:
-        session.delete(existing_feedback)
-        session.commit()
-
     # Generate new feedback and save it
-    context = collect_student_context(session, student_id, start_date, end_date)
-    if not context or (not context["journals"] and not context["tests"] and not context["attendance"]):
-        return {"ai_feedback": "No data available for this period."}
-
-    summary_for_ai = format_data_for_ai(context)
-
-    feedback_data = call_gemini_api(summary_for_ai)
-
-    if "error" in feedback_data:
-        return {"ai_feedback": feedback_data["error"]}
-
-    feedback_json_text = json.dumps(feedback_data)
-
-    new_feedback = Feedback(
-        student_id=student_id,
-        period=period,
-        start_date=start_date,
-        end_date=end_date,
-        feedback_text=feedback_json_text
-    )
-
-    session.add(new_feedback)
-    session.commit()
-    session.refresh(new_feedback)
-
-    return {"ai_feedback": new_feedback.feedback_text}
\ No newline at end of file
+    return generate_feedback(session, student_id, period, start_date, end_date, replaces=existing_feedback)
\ No newline at end of file
@@ -1,23 +1,48 @@
+"""
+AI test question generation, streamed to the page as Gemini writes it.
+
+    POST /student/5/generate-questions       ->  chunked HTML, questions appended as they arrive
+    GET  /student/5/question-papers/12       ->  the saved paper (or the rest of it, while still streaming)
+
+Each request starts a generation that belongs to the server, not to the
+connection: a worker thread reads Gemini's streamGenerateContent events and
+hands every piece to the event loop, where any number of pages can follow it.
+When the tutor closes the tab the generation carries on, and the finished (or,
+if Gemini fails midway, partial) text is saved to its QuestionPaper row.
+
+Generations can take minutes, so they run on their own pool of
+QUESTION_WORKERS threads rather than the one shared by every sync route;
+when all are busy, new papers wait their turn.
+"""
 from __future__ import annotations
-import os
+import asyncio
+import logging
 import json
-import requests
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, Iterator
 from fastapi import APIRouter, Depends, Request, HTTPException, Form
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, StreamingResponse
 from fastapi.templating import Jinja2Templates
+from markupsafe import Markup, escape
 from sqlmodel import Session, select
-from db import get_session
-from models import Student, Tutor, User, Feedback
-from dependencies import get_current_user
+from starlette.concurrency import run_in_threadpool
+from db import engine, get_session
+from models import Student, Feedback, QuestionPaper
+from dependencies import StudentAccess, get_student_access
+from tracing import traced
+import gemini
+from gemini import GeminiError, GeminiUnavailable
 
 router = APIRouter(
     prefix="/student/{student_id}",
     tags=["Test Questions"]
 )
 
-# Gemini API setup (using direct HTTP requests)
-GEMINI_API_KEY = os.getenv("GOOGLE_API_KEY")
-GEMINI_API_URL = "https://generativelanguage.googleapis.com/v1beta/models/gemini-1.5-flash:generateContent"
+logger = logging.getLogger(__name__)
+
+_writers = ThreadPoolExecutor(max_workers=int(os.getenv("QUESTION_WORKERS", "8")),
+                              thread_name_prefix="question-writer")
 
 _templates: Jinja2Templates | None = None
 
@@ -27,43 +52,150 @@ def init_templates(templates: Jinja2Templates) -> None:
     _templates = templates
 
 
-# Helper function to call the Gemini API
-def call_gemini_api(prompt: str) -> str:
-    if not GEMINI_API_KEY:
-        return "Error: GOOGLE_API_KEY environment variable not set."
+def _unavailable_message(error: GeminiUnavailable) -> str:
+    return f"Error: question generation is unavailable right now. Try again in {error.retry_after:.0f} seconds."
 
-    headers = {
-        "Content-Type": "application/json"
-    }
-    payload = {
-        "contents": [
-            {
-                "parts": [
-                    {"text": prompt}
-                ]
-            }
-        ]
-    }
-    params = {
-        "key": GEMINI_API_KEY
-    }
 
+class _Failure(str):
+    """Text yielded in place of the rest of the questions: why generation stopped early."""
+
+
+def stream_gemini_api(prompt: str) -> Iterator[str]:
+    """
+    The questions Gemini writes for `prompt`, piece by piece as they arrive.
+    When there are none, or Gemini stops early, the last piece is a _Failure saying why.
+    """
+    if not gemini.GEMINI_API_KEY:
+        yield _Failure("Error: GOOGLE_API_KEY environment variable not set.")
+        return
+
+    payload = {"contents": [{"parts": [{"text": prompt}]}]}
+
+    produced = False
+    try:
+        for piece in gemini.stream(payload, caller="questions"):
+            produced = True
+            yield piece
+    except GeminiUnavailable as e:
+        yield _Failure(_unavailable_message(e))
+        return
+    except GeminiError as e:
+        # after partial output, keep what was written and say why it stops there
+        yield _Failure(("\n\n" if produced else "") + f"API Call Error: {e}")
+        return
+
+    if not produced:
+        yield _Failure("No content generated by the AI.")
+
+
+# --- Generations in progress ---
+class _Generation:
+    """A paper being written; pieces are appended and followed on the event loop."""
+
+    def __init__(self, paper_id: int):
+        self.paper_id = paper_id
+        self.pieces: list[str] = []
+        self.done = False
+        self.task: asyncio.Task | None = None
+        self._changed = asyncio.Event()
+
+    def append(self, piece: str) -> None:
+        self.pieces.append(piece)
+        self._wake()
+
+    def finish(self) -> None:
+        self.done = True
+        self._wake()
+
+    def _wake(self) -> None:
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def follow(self) -> AsyncIterator[str]:
+        """Everything written so far, then each new piece until the paper is finished."""
+        sent = 0
+        while True:
+            changed = self._changed
+            if sent < len(self.pieces):
+                pieces = self.pieces[sent:]
+                sent += len(pieces)
+                yield "".join(pieces)
+            elif self.done:
+                return
+            else:
+                await changed.wait()
+
+
+# paper id -> generation; only touched on the event loop
+_generations: dict[int, _Generation] = {}
+
+
+def _save(paper_id: int, text: str, status: str) -> None:
+    with Session(engine) as session:
+        paper = session.get(QuestionPaper, paper_id)
+        if paper is not None:  # the student may have been deleted meanwhile
+            paper.text, paper.status = text, status
+            session.add(paper)
+            session.commit()
+
+
+def _write(generation: _Generation, prompt: str, loop: asyncio.AbstractEventLoop) -> None:
+    """Runs in a worker thread: streams from Gemini into the generation, then saves the text."""
+    pieces, status = [], "failed"
     try:
-        response = requests.post(GEMINI_API_URL, headers=headers, json=payload, params=params)
-        response.raise_for_status()  # Raise an HTTPError for bad responses (4xx or 5xx)
-        response_json = response.json()
+        failed = False
+        for piece in stream_gemini_api(prompt):
+            failed = failed or isinstance(piece, _Failure)
+            pieces.append(piece)
+            loop.call_soon_threadsafe(generation.append, piece)
+        status = "failed" if failed else "complete"
+    except Exception:
+        logger.exception("question generation %s failed", generation.paper_id)
+    finally:
+        _save(generation.paper_id, "".join(pieces), status)
+
+
+async def _run(generation: _Generation, prompt: str) -> None:
+    try:
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(_writers, _write, generation, prompt, loop)
+    finally:
+        generation.finish()
+        _generations.pop(generation.paper_id, None)
+
 
-        # Extract the text from the response
-        if 'candidates' in response_json and response_json['candidates']:
-            return response_json['candidates'][0]['content']['parts'][0]['text']
-        else:
-            return "No content generated by the AI."
+def start_generation(paper_id: int, prompt: str) -> _Generation:
+    """Starts writing the paper in the background; it runs to the end whoever is following it."""
+    generation = _Generation(paper_id)
+    generation.task = asyncio.create_task(_run(generation, prompt))
+    _generations[paper_id] = generation
+    return generation
 
-    except requests.exceptions.RequestException as e:
-        return f"API Call Error: {e}"
+
+# Placeholder the streamed questions replace: the page is rendered once and split around it
+_QUESTIONS_SLOT = "\ue000questions\ue000"
+
+
+def _stream_page(request: Request, student: Student, paper: QuestionPaper, generation: _Generation):
+    """The display page as chunked HTML: everything up to the questions, each piece escaped, then the rest."""
+    html = _templates.get_template("generated_questions_display.html").render({
+        "request": request, "student": student, "paper": paper, "questions": Markup(_QUESTIONS_SLOT),
+    })
+    head, tail = html.split(_QUESTIONS_SLOT, 1)
+
+    async def body():
+        yield head
+        async for piece in generation.follow():
+            yield str(escape(piece))
+        yield tail
+
+    # proxies must not buffer the response, or the tutor sees nothing until it ends
+    return StreamingResponse(body(), media_type="text/html",
+                             headers={"Cache-Control": "no-store", "X-Accel-Buffering": "no"})
 
 
 # Helper function to get the most recent performance insights
+@traced()
 def get_performance_insights(session: Session, student_id: int) -> str | None:
     """Fetches the most recent AI feedback for a student."""
     feedback = session.exec(
@@ -81,6 +213,15 @@ def get_performance_insights(session: Session, student_id: int) -> str | None:
     return None
 
 
+def _new_paper(session: Session, student_id: int, question_type: str, subject: str, topics: str) -> QuestionPaper:
+    """Saves the paper before it is generated, so the output has a home even if the tutor leaves."""
+    paper = QuestionPaper(student_id=student_id, question_type=question_type, subject=subject, topics=topics)
+    session.add(paper)
+    session.commit()
+    session.refresh(paper)
+    return paper
+
+
 # Helper function to construct the AI prompt
 def create_ai_prompt(student_data: dict, form_data: dict, performance_data: str | None = None) -> str:
     """Constructs the AI prompt based on the type of request."""
@@ -122,16 +263,9 @@ def create_ai_prompt(student_data: dict, form_data: dict, performance_data: str
 def generate_questions_page(
         student_id: int,
         request: Request,
-        session: Session = Depends(get_session),
-        user: User = Depends(get_current_user)
+        access: StudentAccess = Depends(get_student_access)
 ):
-    student = session.get(Student, student_id)
-    if not student:
-        raise HTTPException(status_code=404, detail="Student not found")
-
-    tutor = session.get(Tutor, student.tutor_id)
-    if not tutor or (user.user_type == "tutor" and tutor.id != user.tutor_id):
-        raise HTTPException(status_code=403, detail="Not authorized")
+    student = access.student
 
     return _templates.TemplateResponse(
         "generate_questions.html",
@@ -151,15 +285,9 @@ async def generate_questions(
         shortAnswerCount: int = Form(...),
         longAnswerCount: int = Form(...),
         session: Session = Depends(get_session),
-        user: User = Depends(get_current_user)
+        access: StudentAccess = Depends(get_student_access)
 ):
-    student = session.get(Student, student_id)
-    if not student:
-        raise HTTPException(status_code=404, detail="Student not found")
-
-    tutor = session.get(Tutor, student.tutor_id)
-    if not tutor or (user.user_type == "tutor" and tutor.id != user.tutor_id):
-        raise HTTPException(status_code=403, detail="Not authorized")
+    student = access.student
 
     # Gather student data
     student_data = {
@@ -177,9 +305,10 @@ async def generate_questions(
         "longAnswerCount": longAnswerCount
     }
 
+    # database work runs in the thread pool; this route is async only to start the stream
     performance_data = None
     if question_type == "performance":
-        performance_data = get_performance_insights(session, student_id)
+        performance_data = await run_in_threadpool(get_performance_insights, session, student_id)
         if not performance_data:
             # Handle case where no performance data exists
             return {
@@ -188,11 +317,31 @@ async def generate_questions(
     # Create the AI prompt
     ai_prompt = create_ai_prompt(student_data, form_data, performance_data)
 
-    # Call the AI model
-    generated_questions = call_gemini_api(ai_prompt)
+    paper = await run_in_threadpool(_new_paper, session, student_id, question_type, subject, topics)
+
+    # Stream the questions to the user as the AI writes them
+    generation = start_generation(paper.id, ai_prompt)
+    return _stream_page(request, student, paper, generation)
+
+
+@router.get("/question-papers/{paper_id}", response_class=HTMLResponse)
+def view_question_paper(
+        student_id: int,
+        paper_id: int,
+        request: Request,
+        session: Session = Depends(get_session),
+        access: StudentAccess = Depends(get_student_access)
+):
+    paper = session.get(QuestionPaper, paper_id)
+    if paper is None or paper.student_id != student_id:
+        raise HTTPException(status_code=404, detail="Question paper not found")
+
+    generation = _generations.get(paper_id)
+    if generation is not None:
+        # still being written by this worker: replay what exists and follow the rest
+        return _stream_page(request, access.student, paper, generation)
 
-    # Return the generated questions to the user
     return _templates.TemplateResponse(
         "generated_questions_display.html",
-        {"request": request, "student": student, "questions": generated_questions}
+        {"request": request, "student": access.student, "paper": paper, "questions": paper.text}
     )
\ No newline at end of file
@@ -0,0 +1,488 @@
+"""
+Versioned JSON API under /api/v1, alongside the HTML pages.
+
+    GET /api/v1/students?limit=50&fields=id,name
+    GET /api/v1/students/5/tests?cursor=<next_cursor of the previous page>
+    GET /api/v1/attendance/grid?year=2025&month=6
+
+List endpoints return {"items": [...], "next_cursor": "..." | null}. Pages are
+keyset-paginated on (sort column, id), so a deep page costs the same as the
+first one and rows written in between are neither skipped nor repeated.
+`fields` keeps only the named fields of each item.
+
+Rows are selected as plain columns and serialized straight to JSON bytes by
+pydantic-core, skipping FastAPI's jsonable_encoder pass; the response models
+still describe every endpoint in /docs. Access follows the HTML pages (an
+admin sees their tutors' students, a tutor their own) and responses carry the
+same data-version ETags, so an unchanged page revalidates with a 304.
+"""
+from __future__ import annotations
+import base64
+import json
+import os
+from datetime import date
+from functools import lru_cache
+from typing import Generic, TypeVar
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from pydantic import BaseModel, TypeAdapter
+from sqlalchemy import func, tuple_
+from starlette.responses import Response
+from sqlmodel import Session, select
+from models import Student, Journal, Attendance, TestRecord, UpcomingTest, User
+from db import get_session
+from dependencies import StudentAccess, get_current_user, get_student_access, get_tutor_ids
+from data_versions import student_scope, user_scope
+from conditional import page_etag, not_modified, with_etag
+from search import SEARCH_LIMIT, search
+
+router = APIRouter(prefix="/api/v1", tags=["API v1"])
+
+API_PAGE_SIZE = int(os.getenv("API_PAGE_SIZE", "50"))
+API_MAX_PAGE_SIZE = int(os.getenv("API_MAX_PAGE_SIZE", "500"))
+
+T = TypeVar("T")
+
+
+# ---------------- Response models ----------------
+class StudentOut(BaseModel):
+    id: int
+    name: str
+    grade: str
+    school: str | None = None
+    syllabus: str | None = None
+    focus_subjects: str | None = None
+    subject: str | None = None
+    remarks: str | None = None
+    tutor_id: int
+
+    @staticmethod
+    def columns():
+        return (Student.id, Student.name, Student.grade, Student.school, Student.syllabus,
+                Student.focus_subjects, Student.subject, Student.remarks, Student.tutor_id)
+
+
+class TestOut(BaseModel):
+    id: int
+    student_id: int
+    subject: str
+    topic: str
+    test_date: date
+    total_marks: int
+    marks_attained: int
+    remarks: str
+
+    @staticmethod
+    def columns():
+        return (TestRecord.id, TestRecord.student_id, TestRecord.subject, TestRecord.topic, TestRecord.test_date,
+                TestRecord.total_marks, TestRecord.marks_attained, TestRecord.remarks)
+
+
+class TestListOut(TestOut):
+    """A test with its student's name, for lists spanning many students."""
+    student_name: str
+
+    @staticmethod
+    def columns():
+        return (*TestOut.columns(), Student.name.label("student_name"))
+
+
+class JournalOut(BaseModel):
+    id: int
+    student_id: int
+    tutor_name: str
+    subject: str
+    journal: str
+    remarks: str
+    entry_date: date
+
+    @staticmethod
+    def columns():
+        return (Journal.id, Journal.student_id, Journal.tutor_name, Journal.subject, Journal.journal,
+                Journal.remarks, Journal.entry_date)
+
+
+class AttendanceOut(BaseModel):
+    id: int
+    student_id: int
+    attendance_date: date
+    status: str
+
+    @staticmethod
+    def columns():
+        return Attendance.id, Attendance.student_id, Attendance.attendance_date, Attendance.status
+
+
+class AttendanceGridRow(BaseModel):
+    """One student's month on the attendance grid: "YYYY-MM-DD" -> status for the days marked."""
+    student_id: int
+    name: str
+    days: dict[str, str]
+
+
+class AttendanceSummary(BaseModel):
+    """Attendance marked for one day, counted by status."""
+    day: date
+    present: int = 0
+    absent: int = 0
+
+
+class UpcomingTestOut(BaseModel):
+    id: int
+    student_id: int
+    student_name: str
+    subject: str
+    topics: str | None = None
+    test_date: date
+
+    @staticmethod
+    def columns():
+        return (UpcomingTest.id, UpcomingTest.student_id, Student.name.label("student_name"),
+                UpcomingTest.subject, UpcomingTest.topics, UpcomingTest.test_date)
+
+
+class SearchHitOut(BaseModel):
+    """A search match; title and snippet are HTML, escaped, with the matched terms in <mark>."""
+    kind: str
+    id: int
+    student_id: int
+    student_name: str
+    title: str
+    snippet: str
+    rank: float
+    url: str
+
+
+class Page(BaseModel, Generic[T]):
+    items: list[T]
+    next_cursor: str | None = None
+
+
+# ---------------- Serialization ----------------
+@lru_cache(maxsize=None)
+def _adapter(model) -> TypeAdapter:
+    return TypeAdapter(model)
+
+
+def _selected_fields(model, fields: str | None) -> set[str] | None:
+    """The `fields` query parameter as a set of field names; 400 for names the model does not have."""
+    if not fields:
+        return None
+    selected = {f.strip() for f in fields.split(",") if f.strip()}
+    unknown = selected - set(model.model_fields)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(sorted(unknown))}")
+    return selected
+
+
+def _json(model, value, include=None) -> Response:
+    return Response(_adapter(model).dump_json(value, include=include), media_type="application/json")
+
+
+def _page_response(model, items: list, next_cursor: str | None, fields: set[str] | None) -> Response:
+    include = {"items": {"__all__": fields}, "next_cursor": True} if fields else None
+    return _json(Page[model], Page[model].model_construct(items=items, next_cursor=next_cursor), include)
+
+
+# ---------------- Keyset pagination ----------------
+def _encode_cursor(values: tuple) -> str:
+    raw = json.dumps([v.isoformat() if isinstance(v, date) else v for v in values], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str, keys: tuple) -> tuple:
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        if len(values) != len(keys):
+            raise ValueError(cursor)
+        return tuple(
+            date.fromisoformat(v) if key.type.python_type is date else key.type.python_type(v)
+            for key, v in zip(keys, values)
+        )
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def _paginate(session: Session, model, statement, keys: tuple, descending: bool,
+              limit: int, cursor: str | None) -> tuple[list, str | None]:
+    """
+    One page of `statement` ordered by `keys` (ending in a unique column), as
+    model instances (rows without a model), and the cursor of the next page
+    (None on the last one).
+    """
+    if cursor:
+        after = _decode_cursor(cursor, keys)
+        position = tuple_(*keys)
+        statement = statement.where(position < tuple_(*after) if descending else position > tuple_(*after))
+    statement = statement.order_by(*(key.desc() if descending else key for key in keys)).limit(limit + 1)
+    rows = session.exec(statement).all()
+    items = [model.model_construct(**row._mapping) for row in rows[:limit]] if model else rows[:limit]
+    if len(rows) <= limit:
+        return items, None
+    last = rows[limit - 1]._mapping
+    return items, _encode_cursor(tuple(last[key.key] for key in keys))
+
+
+def _date_range(statement, column, since: date | None, until: date | None):
+    if since is not None:
+        statement = statement.where(column >= since)
+    if until is not None:
+        statement = statement.where(column <= until)
+    return statement
+
+
+# ---------------- Endpoints ----------------
+@router.get("/students", response_model=Page[StudentOut])
+def list_students(
+        request: Request,
+        limit: int = Query(API_PAGE_SIZE, ge=1, le=API_MAX_PAGE_SIZE),
+        cursor: str | None = None,
+        fields: str | None = Query(None, description="Comma-separated fields to return for each item"),
+        session: Session = Depends(get_session),
+        user: User = Depends(get_current_user),
+        tutor_ids: list[int] = Depends(get_tutor_ids),
+):
+    selected = _selected_fields(StudentOut, fields)
+    etag = page_etag(session, user, user_scope(user))
+    if (cached := not_modified(request, etag)) is not None:
+        return cached
+
+    items, next_cursor = _paginate(
+        session, StudentOut, select(*StudentOut.columns()).where(Student.tutor_id.in_(tutor_ids)),
+        keys=(Student.id,), descending=False, limit=limit, cursor=cursor,
+    )
+    return with_etag(_page_response(StudentOut, items, next_cursor, selected), etag)
+
+
+@router.get("/students/{student_id}", response_model=StudentOut)
+def get_student(
+        student_id: int,
+        request: Request,
+        fields: str | None = Query(None, description="Comma-separated fields to return"),
+        access: StudentAccess = Depends(get_student_access),
+        session: Session = Depends(get_session),
+        user: User = Depends(get_current_user),
+):
+    selected = _selected_fields(StudentOut, fields)
+    etag = page_etag(session, user, student_scope(student_id))
+    if (cached := not_modified(request, etag)) is not None:
+        return cached
+
+    student = StudentOut.model_validate(access.student, from_attributes=True)
+    return with_etag(_json(StudentOut, student, selected), etag)
+
+
+@router.get("/students/{student_id}/tests", response_model=Page[TestOut])
+def list_student_tests(
+        student_id: int,
+        request: Request,
+        since: date | None = None,
+        until: date | None = None,
+        limit: int = Query(API_PAGE_SIZE, ge=1, le=API_MAX_PAGE_SIZE),
+        cursor: str | None = None,
+        fields: str | None = Query(None, description="Comma-separated fields to return for each item"),
+        access: StudentAccess = Depends(get_student_access),
+        session: Session = Depends(get_session),
+        user: User = Depends(get_current_user),
+):
+    selected = _selected_fields(TestOut, fields)
+    etag = page_etag(session, user, student_scope(student_id))
+    if (cached := not_modified(request, etag)) is not None:
+        return cached
+
+    statement = select(*TestOut.columns()).where(TestRecord.student_id == student_id)
+    items, next_cursor = _paginate(
+        session, TestOut, _date_range(statement, TestRecord.test_date, since, until),
+        keys=(TestRecord.test_date, TestRecord.id), descending=True, limit=limit, cursor=cursor,
+    )
+    return with_etag(_page_response(TestOut, items, next_cursor, selected), etag)
+
+
+@router.get("/students/{student_id}/journals", response_model=Page[JournalOut])
+def list_student_journals(
+        student_id: int,
+        request: Request,
+        since: date | None = None,
+        until: date | None = None,
+        limit: int = Query(API_PAGE_SIZE, ge=1, le=API_MAX_PAGE_SIZE),
+        cursor: str | None = None,
+        fields: str | None = Query(None, description="Comma-separated fields to return for each item"),
+        access: StudentAccess = Depends(get_student_access),
+        session: Session = Depends(get_session),
+        user: User = Depends(get_current_user),
+):
+    selected = _selected_fields(JournalOut, fields)
+    etag = page_etag(session, user, student_scope(student_id))
+    if (cached := not_modified(request, etag)) is not None:
+        return cached
+
+    statement = select(*JournalOut.columns()).where(Journal.student_id == student_id)
+    items, next_cursor = _paginate(
+        session, JournalOut, _date_range(statement, Journal.entry_date, since, until),
+        keys=(Journal.entry_date, Journal.id), descending=True, limit=limit, cursor=cursor,
+    )
+    return with_etag(_page_response(JournalOut, items, next_cursor, selected), etag)
+
+
+@router.get("/students/{student_id}/attendance", response_model=Page[AttendanceOut])
+def list_student_attendance(
+        student_id: int,
+        request: Request,
+        since: date | None = None,
+        until: date | None = None,
+        limit: int = Query(API_PAGE_SIZE, ge=1, le=API_MAX_PAGE_SIZE),
+        cursor: str | None = None,
+        fields: str | None = Query(None, description="Comma-separated fields to return for each item"),
+        access: StudentAccess = Depends(get_student_access),
+        session: Session = Depends(get_session),
+        user: User = Depends(get_current_user),
+):
+    selected = _selected_fields(AttendanceOut, fields)
+    etag = page_etag(session, user, student_scope(student_id))
+    if (cached := not_modified(request, etag)) is not None:
+        return cached
+
+    statement = select(*AttendanceOut.columns()).where(Attendance.student_id == student_id)
+    items, next_cursor = _paginate(
+        session, AttendanceOut, _date_range(statement, Attendance.attendance_date, since, until),
+        keys=(Attendance.attendance_date, Attendance.id), descending=True, limit=limit, cursor=cursor,
+    )
+    return with_etag(_page_response(AttendanceOut, items, next_cursor, selected), etag)
+
+
+@router.get("/attendance/grid", response_model=Page[AttendanceGridRow])
+def attendance_grid(
+        request: Request,
+        year: int = Query(None, ge=1900, le=9999),
+        month: int = Query(None, ge=1, le=12),
+        limit: int = Query(API_PAGE_SIZE, ge=1, le=API_MAX_PAGE_SIZE),
+        cursor: str | None = None,
+        fields: str | None = Query(None, description="Comma-separated fields to return for each item"),
+        session: Session = Depends(get_session),
+        user: User = Depends(get_current_user),
+        tutor_ids: list[int] = Depends(get_tutor_ids),
+):
+    """The /attendance grid for one month (default: this month), a page of students at a time."""
+    selected = _selected_fields(AttendanceGridRow, fields)
+    etag = page_etag(session, user, user_scope(user))
+    if (cached := not_modified(request, etag)) is not None:
+        return cached
+
+    today = date.today()
+    year, month = year or today.year, month or today.month
+    first_day = date(year, month, 1)
+    next_month = date(year + month // 12, month % 12 + 1, 1)
+
+    students, next_cursor = _paginate(
+        session, None,
+        select(Student.id, Student.name).where(Student.tutor_id.in_(tutor_ids)),
+        keys=(Student.id,), descending=False, limit=limit, cursor=cursor,
+    )
+    days = {student.id: {} for student in students}
+    if days:
+        marked = session.exec(
+            select(Attendance.student_id, Attendance.attendance_date, Attendance.status)
+            .where(Attendance.student_id.in_(days))
+            .where(Attendance.attendance_date >= first_day, Attendance.attendance_date < next_month)
+        )
+        for student_id, attendance_date, status in marked:
+            days[student_id][attendance_date.isoformat()] = status.lower()
+
+    items = [AttendanceGridRow.model_construct(student_id=s.id, name=s.name, days=days[s.id]) for s in students]
+    return with_etag(_page_response(AttendanceGridRow, items, next_cursor, selected), etag)
+
+
+@router.get("/attendance/summary", response_model=AttendanceSummary)
+def attendance_summary(
+        request: Request,
+        day: date | None = Query(None, description="Defaults to today"),
+        session: Session = Depends(get_session),
+        user: User = Depends(get_current_user),
+        tutor_ids: list[int] = Depends(get_tutor_ids),
+):
+    """The dashboard's present/absent counters for one day."""
+    etag = page_etag(session, user, user_scope(user))
+    if (cached := not_modified(request, etag)) is not None:
+        return cached
+
+    day = day or date.today()
+    status = func.lower(Attendance.status)
+    counts = dict(session.exec(
+        select(status, func.count(Attendance.id))
+        .join(Student)
+        .where(Attendance.attendance_date == day)
+        .where(Student.tutor_id.in_(tutor_ids))
+        .group_by(status)
+    ).all())
+    summary = AttendanceSummary.model_construct(
+        day=day, present=counts.get("present", 0), absent=counts.get("absent", 0)
+    )
+    return with_etag(_json(AttendanceSummary, summary), etag)
+
+
+@router.get("/tests", response_model=Page[TestListOut])
+def list_tests(
+        request: Request,
+        since: date | None = None,
+        until: date | None = None,
+        limit: int = Query(API_PAGE_SIZE, ge=1, le=API_MAX_PAGE_SIZE),
+        cursor: str | None = None,
+        fields: str | None = Query(None, description="Comma-separated fields to return for each item"),
+        session: Session = Depends(get_session),
+        user: User = Depends(get_current_user),
+        tutor_ids: list[int] = Depends(get_tutor_ids),
+):
+    """Every test of the caller's students, newest first, as on /all_tests."""
+    selected = _selected_fields(TestListOut, fields)
+    etag = page_etag(session, user, user_scope(user))
+    if (cached := not_modified(request, etag)) is not None:
+        return cached
+
+    statement = select(*TestListOut.columns()).join(Student).where(Student.tutor_id.in_(tutor_ids))
+    items, next_cursor = _paginate(
+        session, TestListOut, _date_range(statement, TestRecord.test_date, since, until),
+        keys=(TestRecord.test_date, TestRecord.id), descending=True, limit=limit, cursor=cursor,
+    )
+    return with_etag(_page_response(TestListOut, items, next_cursor, selected), etag)
+
+
+@router.get("/upcoming-tests", response_model=Page[UpcomingTestOut])
+def list_upcoming_tests(
+        request: Request,
+        since: date | None = Query(None, description="Defaults to today"),
+        until: date | None = None,
+        limit: int = Query(API_PAGE_SIZE, ge=1, le=API_MAX_PAGE_SIZE),
+        cursor: str | None = None,
+        fields: str | None = Query(None, description="Comma-separated fields to return for each item"),
+        session: Session = Depends(get_session),
+        user: User = Depends(get_current_user),
+        tutor_ids: list[int] = Depends(get_tutor_ids),
+):
+    """Upcoming tests of the caller's students, soonest first."""
+    selected = _selected_fields(UpcomingTestOut, fields)
+    etag = page_etag(session, user, user_scope(user))
+    if (cached := not_modified(request, etag)) is not None:
+        return cached
+
+    statement = select(*UpcomingTestOut.columns()).join(Student).where(Student.tutor_id.in_(tutor_ids))
+    items, next_cursor = _paginate(
+        session, UpcomingTestOut, _date_range(statement, UpcomingTest.test_date, since or date.today(), until),
+        keys=(UpcomingTest.test_date, UpcomingTest.id), descending=False, limit=limit, cursor=cursor,
+    )
+    return with_etag(_page_response(UpcomingTestOut, items, next_cursor, selected), etag)
+
+
+@router.get("/search", response_model=list[SearchHitOut])
+def search_records(
+        q: str = Query(..., min_length=1),
+        limit: int = Query(SEARCH_LIMIT, ge=1, le=API_MAX_PAGE_SIZE),
+        fields: str | None = Query(None, description="Comma-separated fields to return for each item"),
+        session: Session = Depends(get_session),
+        tutor_ids: list[int] = Depends(get_tutor_ids),
+):
+    """Ranked full-text matches among the caller's students' journals, tests and remarks, best first."""
+    selected = _selected_fields(SearchHitOut, fields)
+    hits = [
+        SearchHitOut.model_construct(**hit._asdict(), url=hit.url)
+        for hit in search(session, q, tutor_ids, limit)
+    ]
+    return _json(list[SearchHitOut], hits, {"__all__": selected} if selected else None)
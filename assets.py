@@ -0,0 +1,463 @@
+"""
+Static asset pipeline.
+
+Source files under static/ are processed into static/build/ with a content
+hash in every filename, and a manifest maps the source path to the built one:
+
+    python -m assets            # build if any source changed (also run at startup)
+    python -m assets --force    # rebuild everything
+    python -m assets --clean    # also delete built files the manifest no longer uses
+
+    python -m assets --vendor   # download the pinned third-party files in VENDOR first
+
+Images get resized AVIF and WebP variants (never upscaled) and a fallback in
+the original format, resized to the widest variant. Stylesheets and scripts
+from css/, js/ and vendor/ get their url() references rewritten to the built
+files and gzip (plus brotli, when the brotli package is installed) siblings
+precompressed next to them. Our own CSS is minified; vendored CSS is purged of
+rules for classes that no template or script mentions.
+
+Templates reference sources by their path under static/ and get the built URLs
+from the helpers installed by init_templates():
+
+    <link href="{{ asset_url('css/pages/dashboard.css') }}" rel="stylesheet">
+    {{ picture('images/10088.jpg', alt='Classroom', sizes='(min-width: 992px) 50vw, 100vw') }}
+
+Vendored libraries that have not been downloaded resolve to their pinned CDN
+URL, so pages keep working before the first --vendor run.
+
+Built files never change under the same name, so ImmutableStaticFiles serves
+them with a one-year immutable Cache-Control.
+"""
+from __future__ import annotations
+import argparse
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import re
+import urllib.request
+from io import BytesIO
+from markupsafe import Markup, escape
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+from compression import accepted_encodings, brotli  # brotli is None without the optional package
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+STATIC_DIR = os.path.join(BASE_DIR, "static")
+BUILD_DIR = os.path.join(STATIC_DIR, "build")
+MANIFEST_PATH = os.path.join(BUILD_DIR, "manifest.json")
+STATIC_URL = "/static"
+
+IMAGE_DIR = "images"
+IMAGE_WIDTHS = [int(w) for w in os.getenv("ASSET_IMAGE_WIDTHS", "480,960,1600").split(",")]
+IMAGE_QUALITY = {"avif": 50, "webp": 75}
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+TEXT_DIRS = ("css", "js", "vendor")
+TEXT_EXTENSIONS = (".css", ".js")
+FONT_EXTENSIONS = (".woff2", ".woff", ".ttf")
+TEMPLATES_DIR = os.path.join(BASE_DIR, "templates")
+PURGE_VENDOR_CSS = os.getenv("ASSET_PURGE_CSS", "1") == "1"
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+_FONT_AWESOME = "https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.5.0"
+# Local path under static/ -> pinned upstream file
+VENDOR = {
+    "vendor/bootstrap/css/bootstrap.min.css": "https://cdn.jsdelivr.net/npm/bootstrap@5.3.3/dist/css/bootstrap.min.css",
+    "vendor/bootstrap/js/bootstrap.bundle.min.js": "https://cdn.jsdelivr.net/npm/bootstrap@5.3.3/dist/js/bootstrap.bundle.min.js",
+    "vendor/animate/animate.min.css": "https://cdnjs.cloudflare.com/ajax/libs/animate.css/4.1.1/animate.min.css",
+    "vendor/chartjs/chart.umd.min.js": "https://cdn.jsdelivr.net/npm/chart.js@4.4.1/dist/chart.umd.min.js",
+    "vendor/fontawesome/css/all.min.css": f"{_FONT_AWESOME}/css/all.min.css",
+    **{
+        f"vendor/fontawesome/webfonts/{font}.{ext}": f"{_FONT_AWESOME}/webfonts/{font}.{ext}"
+        for font in ("fa-solid-900", "fa-regular-400", "fa-brands-400", "fa-v4compatibility")
+        for ext in ("woff2", "ttf")
+    },
+}
+
+_manifest: dict | None = None
+
+
+# ---------------- Build ----------------
+def fingerprint(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()[:12]
+
+
+def _write_built(source: str, data: bytes, label: str = "", ext: str | None = None) -> str:
+    """Writes `data` to build/ under a fingerprinted name; returns its path relative to static/."""
+    directory, filename = os.path.split(source)
+    stem, source_ext = os.path.splitext(filename)
+    name = f"{stem}{label}.{fingerprint(data)}{ext or source_ext}"
+    target = os.path.join("build", directory, name)
+    full_path = os.path.join(STATIC_DIR, target)
+    if not os.path.exists(full_path):
+        _write_atomic(full_path, data)
+    return target.replace(os.sep, "/")
+
+
+def _write_atomic(full_path: str, data: bytes) -> None:
+    # names are content hashes, so workers building at the same time write identical files
+    os.makedirs(os.path.dirname(full_path), exist_ok=True)
+    temp_path = f"{full_path}.{os.getpid()}.tmp"
+    with open(temp_path, "wb") as f:
+        f.write(data)
+    os.replace(temp_path, full_path)
+
+
+def _precompress(built: str, data: bytes) -> None:
+    """Writes .gz and .br siblings of a built file when they are smaller than it."""
+    full_path = os.path.join(STATIC_DIR, built)
+    candidates = [(".gz", lambda: gzip.compress(data, compresslevel=9, mtime=0))]
+    if brotli is not None:
+        candidates.append((".br", lambda: brotli.compress(data, quality=11)))
+    for suffix, compress in candidates:
+        if not os.path.exists(full_path + suffix):
+            compressed = compress()
+            if len(compressed) < len(data):
+                _write_atomic(full_path + suffix, compressed)
+
+
+def _image_formats() -> list[str]:
+    from PIL import features
+    return [fmt for fmt in ("avif", "webp") if features.check(fmt)]
+
+
+def build_image(source: str) -> dict:
+    """One variant per format and width (widest last), plus the fallback <img> in the source format."""
+    from PIL import Image
+
+    with open(os.path.join(STATIC_DIR, source), "rb") as f:
+        original = f.read()
+    image = Image.open(BytesIO(original))
+    image.load()
+    width, height = image.size
+    widths = sorted({w for w in IMAGE_WIDTHS if w < width} | {min(width, max(IMAGE_WIDTHS))})
+
+    resized = {w: image if w == width else image.resize((w, round(height * w / width)), Image.LANCZOS)
+               for w in widths}
+
+    variants = {}
+    for fmt in _image_formats():
+        variants[fmt] = []
+        for w in widths:
+            out = BytesIO()
+            resized[w].save(out, fmt.upper(), quality=IMAGE_QUALITY[fmt])
+            variants[fmt].append([w, _write_built(source, out.getvalue(), f"-{w}w", f".{fmt}")])
+
+    fallback_width = widths[-1]
+    out = BytesIO()
+    resized[fallback_width].save(out, image.format, optimize=True, **({"quality": 82} if image.format == "JPEG" else {}))
+    return {
+        "url": _write_built(source, out.getvalue(), f"-{fallback_width}w"),
+        "width": fallback_width,
+        "height": resized[fallback_width].height,
+        "variants": variants,
+    }
+
+
+_URL = re.compile(r"""url\(\s*(['"]?)([^'")]+)\1\s*\)""")
+
+
+def _rewrite_urls(source: str, css: str, files: dict) -> str:
+    """Points relative url() references at the built copies of the files they name."""
+    def replace(match):
+        target = match.group(2)
+        if target.startswith(("data:", "http:", "https:", "/", "#")):
+            return match.group(0)
+        path = re.split(r"[?#]", target, maxsplit=1)[0]
+        resolved = os.path.normpath(os.path.join(os.path.dirname(source), path)).replace(os.sep, "/")
+        if resolved not in files:
+            return match.group(0)
+        return f'url("{STATIC_URL}/{files[resolved]}")'
+    return _URL.sub(replace, css)
+
+
+def minify_css(css: str) -> str:
+    css = re.sub(r"/\*.*?\*/", "", css, flags=re.S)
+    css = re.sub(r"\s+", " ", css)
+    return re.sub(r"\s*([{};,])\s*", r"\1", css).replace(";}", "}").strip()
+
+
+# ---------------- CSS purging ----------------
+_CLASS = re.compile(r"\.(-?[_a-zA-Z][_a-zA-Z0-9-]*)")
+
+
+def used_tokens() -> set[str]:
+    """Every word in the templates and scripts; a class is kept if its name appears anywhere."""
+    texts = []
+    for dirpath, _, filenames in os.walk(TEMPLATES_DIR):
+        texts += [os.path.join(dirpath, f) for f in filenames if f.endswith(".html")]
+    texts += [os.path.join(STATIC_DIR, s) for s in _sources(TEXT_DIRS, (".js",))]
+    tokens = set()
+    for path in texts:
+        with open(path, encoding="utf-8", errors="ignore") as f:
+            tokens.update(re.findall(r"[A-Za-z0-9_-]+", f.read()))
+    return tokens
+
+
+def _blocks(css: str):
+    """Yields (prelude, body) for each top-level rule; body is None for statements such as @charset."""
+    i, start, depth, body_start = 0, 0, 0, 0
+    while i < len(css):
+        c = css[i]
+        if c in "\"'":
+            end = css.find(c, i + 1)
+            i = end if end != -1 else len(css)
+        elif c == "{":
+            if depth == 0:
+                body_start = i
+            depth += 1
+        elif c == "}":
+            depth -= 1
+            if depth == 0:
+                yield css[start:body_start].strip(), css[body_start + 1:i]
+                start = i + 1
+        elif c == ";" and depth == 0:
+            yield css[start:i + 1].strip(), None
+            start = i + 1
+        i += 1
+
+
+def _split_selectors(prelude: str) -> list[str]:
+    parts, depth, start = [], 0, 0
+    for i, c in enumerate(prelude):
+        if c in "([":
+            depth += 1
+        elif c in ")]":
+            depth -= 1
+        elif c == "," and depth == 0:
+            parts.append(prelude[start:i].strip())
+            start = i + 1
+    parts.append(prelude[start:].strip())
+    return parts
+
+
+def _selector_used(selector: str, used: set[str]) -> bool:
+    # classes inside :not()/:is()/:has() arguments do not have to match, and attribute values are not classes
+    selector = re.sub(r"\[[^\]]*\]", "", selector)
+    while "(" in selector:
+        stripped = re.sub(r"\([^()]*\)", "", selector)
+        if stripped == selector:
+            break
+        selector = stripped
+    return all(name in used for name in _CLASS.findall(selector))
+
+
+def purge_css(css: str, used: set[str]) -> str:
+    """Drops selectors naming a class that is never used; keeps @font-face, @keyframes and the like."""
+    licenses = re.findall(r"/\*!.*?\*/", css, flags=re.S)
+    return "\n".join(licenses + [_purge(re.sub(r"/\*.*?\*/", "", css, flags=re.S), used)])
+
+
+def _purge(css: str, used: set[str]) -> str:
+    out = []
+    for prelude, body in _blocks(css):
+        if body is None:
+            out.append(prelude)
+        elif prelude.startswith(("@media", "@supports", "@layer", "@container")):
+            inner = _purge(body, used)
+            if inner:
+                out.append(f"{prelude}{{{inner}}}")
+        elif prelude.startswith("@"):
+            out.append(f"{prelude}{{{body}}}")
+        else:
+            kept = [s for s in _split_selectors(prelude) if _selector_used(s, used)]
+            if kept:
+                out.append(f"{','.join(kept)}{{{body}}}")
+    return "".join(out)
+
+
+def build_text(source: str, files: dict, used: set[str]) -> str:
+    with open(os.path.join(STATIC_DIR, source), encoding="utf-8") as f:
+        text = f.read()
+    if source.endswith(".css"):
+        text = _rewrite_urls(source, text, files)
+        if not source.startswith("vendor/"):
+            text = minify_css(text)
+        elif PURGE_VENDOR_CSS:
+            text = purge_css(text, used)
+    data = text.encode()
+    built = _write_built(source, data)
+    _precompress(built, data)
+    return built
+
+
+def _sources(directories, extensions: tuple[str, ...]) -> list[str]:
+    found = []
+    for directory in ([directories] if isinstance(directories, str) else directories):
+        for dirpath, _, filenames in os.walk(os.path.join(STATIC_DIR, directory)):
+            for filename in filenames:
+                if filename.lower().endswith(extensions):
+                    found.append(os.path.relpath(os.path.join(dirpath, filename), STATIC_DIR).replace(os.sep, "/"))
+    return sorted(found)
+
+
+def _stale(sources: list[str]) -> bool:
+    if not os.path.exists(MANIFEST_PATH) or set(load_manifest()["files"]) != set(sources):
+        return True
+    built_at = os.path.getmtime(MANIFEST_PATH)
+    # templates count too: they decide which vendored CSS rules survive purging
+    templates = [os.path.join(TEMPLATES_DIR, f) for f in os.listdir(TEMPLATES_DIR)]
+    paths = [os.path.join(STATIC_DIR, s) for s in sources] + templates
+    return any(os.path.getmtime(path) > built_at for path in paths)
+
+
+def build(force: bool = False) -> dict:
+    """Rebuilds static/build/ when a source changed since the last manifest was written."""
+    global _manifest
+    images = _sources(IMAGE_DIR, IMAGE_EXTENSIONS)
+    fonts = _sources("vendor", FONT_EXTENSIONS)
+    texts = _sources(TEXT_DIRS, TEXT_EXTENSIONS)
+    if not force and not _stale(images + fonts + texts):
+        return load_manifest()
+
+    manifest = {"files": {}, "images": {}}
+    for source in images:
+        entry = build_image(source)
+        manifest["images"][source] = entry
+        manifest["files"][source] = entry["url"]
+    for source in fonts:
+        with open(os.path.join(STATIC_DIR, source), "rb") as f:
+            manifest["files"][source] = _write_built(source, f.read())
+    used = used_tokens()
+    for source in texts:
+        manifest["files"][source] = build_text(source, manifest["files"], used)
+
+    _write_atomic(MANIFEST_PATH, json.dumps(manifest, indent=2).encode())
+    _manifest = manifest
+    return manifest
+
+
+def clean(manifest: dict) -> int:
+    """Deletes built files the manifest does not reference; returns how many were removed."""
+    used = {os.path.normpath(os.path.join(STATIC_DIR, p)) + suffix
+            for p in _manifest_paths(manifest) for suffix in ("", ".gz", ".br")}
+    used.add(os.path.normpath(MANIFEST_PATH))
+    removed = 0
+    for dirpath, _, filenames in os.walk(BUILD_DIR):
+        for filename in filenames:
+            full_path = os.path.normpath(os.path.join(dirpath, filename))
+            if full_path not in used:
+                os.remove(full_path)
+                removed += 1
+    return removed
+
+
+def _manifest_paths(manifest: dict):
+    yield from manifest["files"].values()
+    for entry in manifest["images"].values():
+        for variants in entry["variants"].values():
+            yield from (url for _, url in variants)
+
+
+def vendor() -> None:
+    """Downloads the pinned third-party files in VENDOR that are not present yet."""
+    for path, url in VENDOR.items():
+        full_path = os.path.join(STATIC_DIR, path)
+        if not os.path.exists(full_path):
+            with urllib.request.urlopen(url, timeout=30) as response:
+                _write_atomic(full_path, response.read())
+            print(f"Downloaded {path}")
+
+
+def load_manifest() -> dict:
+    global _manifest
+    if _manifest is None:
+        try:
+            with open(MANIFEST_PATH) as f:
+                _manifest = json.load(f)
+        except FileNotFoundError:
+            _manifest = {"files": {}, "images": {}}
+    return _manifest
+
+
+# ---------------- Template helpers ----------------
+def asset_url(path: str) -> str:
+    """URL of the built file for a source path under static/, or of the source itself if not built."""
+    built = load_manifest()["files"].get(path)
+    if built:
+        return f"{STATIC_URL}/{built}"
+    if path in VENDOR and not os.path.exists(os.path.join(STATIC_DIR, path)):
+        return VENDOR[path]
+    return f"{STATIC_URL}/{path}"
+
+
+def image_srcset(path: str, fmt: str = "webp") -> str:
+    entry = load_manifest()["images"].get(path)
+    if not entry or fmt not in entry["variants"]:
+        return ""
+    return ", ".join(f"{STATIC_URL}/{url} {w}w" for w, url in entry["variants"][fmt])
+
+
+def picture(path: str, alt: str = "", sizes: str = "100vw", **attrs) -> Markup:
+    """A <picture> with AVIF and WebP sources and the fingerprinted original as fallback."""
+    entry = load_manifest()["images"].get(path)
+    extra = "".join(f' {escape(k.rstrip("_").replace("_", "-"))}="{escape(v)}"' for k, v in attrs.items())
+    if not entry:
+        return Markup(f'<img src="{escape(asset_url(path))}" alt="{escape(alt)}"{extra}>')
+    sources = "".join(
+        f'<source type="image/{fmt}" srcset="{escape(image_srcset(path, fmt))}" sizes="{escape(sizes)}">'
+        for fmt in entry["variants"]
+    )
+    return Markup(
+        f'<picture>{sources}<img src="{escape(asset_url(path))}" alt="{escape(alt)}" '
+        f'width="{entry["width"]}" height="{entry["height"]}" loading="lazy" decoding="async"{extra}></picture>'
+    )
+
+
+def init_templates(templates) -> None:
+    templates.env.globals.update(asset_url=asset_url, image_srcset=image_srcset, picture=picture)
+
+
+# ---------------- Serving ----------------
+class ImmutableStaticFiles(StaticFiles):
+    """
+    StaticFiles that lets browsers cache fingerprinted build/ files forever and
+    serves their precompressed .br/.gz siblings to clients that accept them.
+    """
+
+    def file_response(self, full_path, stat_result, scope, status_code: int = 200):
+        immutable = os.path.commonpath([os.path.abspath(full_path), BUILD_DIR]) == BUILD_DIR
+        response = None
+        if immutable:
+            response = self._precompressed_response(full_path, scope, status_code)
+        if response is None:
+            response = super().file_response(full_path, stat_result, scope, status_code)
+        if immutable:
+            response.headers["Cache-Control"] = IMMUTABLE_CACHE_CONTROL
+        return response
+
+    def _precompressed_response(self, full_path, scope, status_code: int):
+        request_headers = Headers(scope=scope)
+        for encoding in accepted_encodings(request_headers.get("accept-encoding", "")):
+            sibling = f"{full_path}.{'br' if encoding == 'br' else 'gz'}"
+            try:
+                sibling_stat = os.stat(sibling)
+            except FileNotFoundError:
+                continue
+            response = FileResponse(
+                sibling, status_code=status_code, stat_result=sibling_stat,
+                media_type=mimetypes.guess_type(str(full_path))[0],
+                headers={"Content-Encoding": encoding, "Vary": "Accept-Encoding"},
+            )
+            if self.is_not_modified(response.headers, request_headers):
+                return NotModifiedResponse(response.headers)
+            return response
+        return None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build fingerprinted static assets into static/build/.")
+    parser.add_argument("--force", action="store_true", help="rebuild even if no source changed")
+    parser.add_argument("--clean", action="store_true", help="delete built files no longer in the manifest")
+    parser.add_argument("--vendor", action="store_true", help="download missing third-party files first")
+    args = parser.parse_args()
+    if args.vendor:
+        vendor()
+    result = build(force=args.force)
+    print(f"{len(result['files'])} assets in {BUILD_DIR}")
+    if args.clean:
+        print(f"Removed {clean(result)} unused files")
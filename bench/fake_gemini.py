@@ -0,0 +1,140 @@
+"""
+A local stand-in for the Gemini generateContent endpoint.
+
+    python -m bench.fake_gemini --port 8765 --latency-ms 800 --jitter-ms 300 --error-rate 0.05
+
+Point the app at it with GEMINI_API_URL=http://127.0.0.1:8765/generateContent
+and any non-empty GOOGLE_API_KEY. Requests asking for JSON output (the insights
+route) get a JSON report, everything else (question generation) gets text.
+Streaming requests (?alt=sse) get the text line by line as server-sent events,
+after the same latency and then spread over as long again. A fraction of requests, set by --error-rate, fail with 429
+or 503.
+"""
+from __future__ import annotations
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+INSIGHTS = {
+    "overall_summary": "The student is progressing steadily with consistent attendance.",
+    "Mathematics": {
+        "strengths": ["Algebraic manipulation"],
+        "weaknesses": ["Fractions"],
+        "suggestions": ["Daily practice with mixed fraction problems"],
+    },
+}
+QUESTIONS = "\n".join(
+    f"{i}. Sample question {i} on the requested topics. ({1 + i % 5} marks)" for i in range(1, 31)
+)
+
+
+class FakeGeminiConfig:
+    def __init__(self, latency_ms: float = 500, jitter_ms: float = 0, error_rate: float = 0.0, seed: int = 0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.errors = 0
+
+    def next_outcome(self) -> tuple[float, int | None]:
+        with self.lock:
+            self.calls += 1
+            delay = max(0.0, self.latency_ms + self.rng.uniform(-self.jitter_ms, self.jitter_ms)) / 1000
+            if self.rng.random() < self.error_rate:
+                self.errors += 1
+                return delay, self.rng.choice([429, 503])
+            return delay, None
+
+
+def make_handler(config: FakeGeminiConfig):
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+            delay, error_status = config.next_outcome()
+            time.sleep(delay)
+            if error_status:
+                self._reply(error_status, {"error": {"code": error_status, "message": "Simulated failure"}},
+                            {"Retry-After": "1"} if error_status == 429 else {})
+                return
+
+            try:
+                request = json.loads(body or b"{}")
+            except json.JSONDecodeError:
+                request = {}
+            wants_json = request.get("generationConfig", {}).get("responseMimeType") == "application/json"
+            text = json.dumps(INSIGHTS) if wants_json else QUESTIONS
+            if "alt=sse" in self.path:
+                self._stream(text.splitlines(keepends=True), delay)
+                return
+            self._reply(200, {"candidates": [{"content": {"parts": [{"text": text}], "role": "model"}}]})
+
+        def _stream(self, pieces: list[str], delay: float):
+            # called after the usual latency; the events then follow one another at a steady pace
+            self.protocol_version = "HTTP/1.1"
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            for piece in pieces:
+                event = {"candidates": [{"content": {"parts": [{"text": piece}], "role": "model"}}]}
+                data = b"data: " + json.dumps(event).encode() + b"\r\n\r\n"
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+                self.wfile.flush()
+                time.sleep(delay / len(pieces))
+            self.wfile.write(b"0\r\n\r\n")
+
+        def _reply(self, status: int, payload: dict, headers: dict | None = None):
+            data = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            for key, value in (headers or {}).items():
+                self.send_header(key, value)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def start_fake_gemini(host: str = "127.0.0.1", port: int = 0, **config_kwargs):
+    """Starts the server on a daemon thread; returns (server, config, url)."""
+    config = FakeGeminiConfig(**config_kwargs)
+    server = ThreadingHTTPServer((host, port), make_handler(config))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="fake-gemini", daemon=True).start()
+    url = f"http://{host}:{server.server_address[1]}/generateContent"
+    return server, config, url
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=500)
+    parser.add_argument("--jitter-ms", type=float, default=0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    server, config, url = start_fake_gemini(args.host, args.port, latency_ms=args.latency_ms,
+                                            jitter_ms=args.jitter_ms, error_rate=args.error_rate, seed=args.seed)
+    print(f"Fake Gemini listening on {url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+        print(f"Served {config.calls} calls ({config.errors} simulated errors)")
+
+
+if __name__ == "__main__":
+    main()
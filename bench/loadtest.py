@@ -0,0 +1,287 @@
+"""
+HTTP load test: replays a tutor/admin traffic mix and reports latency per route.
+
+    DATABASE_URL=sqlite:///bench.db python -m bench.seed_data --students 1000
+    DATABASE_URL=sqlite:///bench.db python -m bench.loadtest --start-app --users 20 --duration 60
+
+--start-app launches uvicorn against DATABASE_URL with a local fake Gemini
+(see bench.fake_gemini); without it, --base-url must point at a running app
+that already uses a fake or real Gemini. Results are written to
+bench/results/ tagged with the current git commit. Pass --compare to diff
+against an earlier result file.
+"""
+from __future__ import annotations
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+import requests
+from bench.fake_gemini import start_fake_gemini
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+
+# ---------------- Traffic mix ----------------
+# (weight, method, route template, builder(rng, ctx) -> (url, request kwargs))
+def _student(rng, ctx):
+    return rng.choice(ctx["student_ids"])
+
+
+def _recent_day(rng):
+    return (date.today() - timedelta(days=rng.randint(0, 27))).isoformat()
+
+
+TUTOR_MIX = [
+    (10, "GET", "/tutor-dashboard", lambda rng, ctx: ("/tutor-dashboard", {})),
+    (6, "GET", "/attendance-today-count", lambda rng, ctx: ("/attendance-today-count", {})),
+    (6, "GET", "/upcoming-tests-count", lambda rng, ctx: ("/upcoming-tests-count", {})),
+    (8, "GET", "/attendance", lambda rng, ctx: ("/attendance", {})),
+    (15, "POST", "/attendance/update", lambda rng, ctx: ("/attendance/update", {"json": {
+        "student_id": _student(rng, ctx), "date": _recent_day(rng),
+        "status": rng.choice(["present", "absent", "late"])}})),
+    (8, "GET", "/student/{student_id}/tests", lambda rng, ctx: (f"/student/{_student(rng, ctx)}/tests", {})),
+    (3, "POST", "/student/{student_id}/tests/add", lambda rng, ctx: (f"/student/{_student(rng, ctx)}/tests/add", {
+        "data": {"subject": "Mathematics", "topic": "Fractions", "test_date": _recent_day(rng),
+                 "total_marks": 25, "marks_attained": rng.randint(5, 25), "remarks": "Load test"}})),
+    (8, "GET", "/student/{student_id}/journal", lambda rng, ctx: (f"/student/{_student(rng, ctx)}/journal", {})),
+    (5, "GET", "/student/{student_id}/attendance-view",
+     lambda rng, ctx: (f"/student/{_student(rng, ctx)}/attendance-view", {})),
+    (4, "GET", "/student/{student_id}/insights", lambda rng, ctx: (f"/student/{_student(rng, ctx)}/insights", {})),
+    (4, "GET", "/insights/student/{student_id}/{period}/data",
+     lambda rng, ctx: (f"/insights/student/{_student(rng, ctx)}/last-30-days/data", {})),
+    (2, "POST", "/insights/student/{student_id}/{period}/ai",
+     lambda rng, ctx: (f"/insights/student/{_student(rng, ctx)}/{rng.choice(['weekly', 'last-30-days'])}/ai", {})),
+    (1, "POST", "/student/{student_id}/generate-questions",
+     lambda rng, ctx: (f"/student/{_student(rng, ctx)}/generate-questions", {"data": {
+         "question_type": "syllabus", "subject": "Mathematics", "topics": "Fractions", "totalMarks": 50,
+         "mcqCount": 10, "shortAnswerCount": 5, "longAnswerCount": 2}})),
+]
+
+ADMIN_MIX = [
+    (10, "GET", "/admin-dashboard", lambda rng, ctx: ("/admin-dashboard", {})),
+    (5, "GET", "/all_tests", lambda rng, ctx: ("/all_tests", {})),
+    (5, "GET", "/upcoming-tests", lambda rng, ctx: ("/upcoming-tests", {})),
+    (4, "GET", "/reports", lambda rng, ctx: ("/reports", {})),
+    (6, "GET", "/reports/student/{student_id}", lambda rng, ctx: (f"/reports/student/{_student(rng, ctx)}", {})),
+    (3, "GET", "/reports/student/{student_id}/download",
+     lambda rng, ctx: (f"/reports/student/{_student(rng, ctx)}/download?format=pdf", {})),
+    (4, "GET", "/tutors", lambda rng, ctx: ("/tutors", {})),
+    (6, "GET", "/tutor/{tutor_id}/students",
+     lambda rng, ctx: (f"/tutor/{rng.choice(ctx['tutor_ids'])}/students", {})),
+    (4, "GET", "/attendance-today", lambda rng, ctx: ("/attendance-today", {})),
+    (1, "GET", "/reports/all/download", lambda rng, ctx: ("/reports/all/download?format=pdf", {})),
+]
+
+
+# ---------------- Virtual users ----------------
+class VirtualUser(threading.Thread):
+    def __init__(self, index: int, base_url: str, username: str, mix: list, ctx: dict, seed: int,
+                 deadline: float, warmup_until: float, think_ms: float):
+        super().__init__(name=f"vu-{index}", daemon=True)
+        self.base_url = base_url
+        self.mix = mix
+        self.ctx = ctx
+        self.rng = random.Random(seed * 1000 + index)
+        self.deadline = deadline
+        self.warmup_until = warmup_until
+        self.think = think_ms / 1000
+        self.session = requests.Session()
+        self.session.cookies.set("username", username)
+        self.samples: list[tuple[str, int, float]] = []
+        self.weights = [entry[0] for entry in mix]
+
+    def run(self) -> None:
+        while time.monotonic() < self.deadline:
+            _, method, template, build = self.rng.choices(self.mix, weights=self.weights)[0]
+            path, kwargs = build(self.rng, self.ctx)
+            start = time.perf_counter()
+            try:
+                response = self.session.request(method, self.base_url + path, allow_redirects=False,
+                                                timeout=120, **kwargs)
+                status = response.status_code
+            except requests.RequestException:
+                status = 0
+            elapsed = time.perf_counter() - start
+            if time.monotonic() >= self.warmup_until:
+                self.samples.append((f"{method} {template}", status, elapsed))
+            if self.think:
+                time.sleep(self.rng.expovariate(1 / self.think))
+
+
+# ---------------- Reporting ----------------
+def percentile(sorted_values: list[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(q * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+def summarize(samples: list[tuple[str, int, float]], duration: float) -> dict:
+    by_route = defaultdict(list)
+    errors = defaultdict(int)
+    for route, status, elapsed in samples:
+        by_route[route].append(elapsed)
+        if status == 0 or status >= 400:
+            errors[route] += 1
+
+    def stats(latencies: list[float], error_count: int) -> dict:
+        latencies.sort()
+        return {
+            "count": len(latencies),
+            "errors": error_count,
+            "throughput_rps": round(len(latencies) / duration, 2),
+            "mean_ms": round(sum(latencies) / len(latencies) * 1000, 2) if latencies else 0.0,
+            "p50_ms": round(percentile(latencies, 0.50) * 1000, 2),
+            "p95_ms": round(percentile(latencies, 0.95) * 1000, 2),
+            "p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+        }
+
+    routes = {route: stats(latencies, errors[route]) for route, latencies in sorted(by_route.items())}
+    overall = stats([s[2] for s in samples], sum(errors.values()))
+    return {"routes": routes, "total": overall}
+
+
+def git_revision() -> dict:
+    try:
+        commit = subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+        dirty = bool(subprocess.check_output(["git", "status", "--porcelain", "--untracked-files=no"], text=True))
+    except (OSError, subprocess.CalledProcessError):
+        commit, dirty = "unknown", False
+    return {"commit": commit, "dirty": dirty}
+
+
+def print_report(result: dict, baseline: dict | None = None) -> None:
+    header = f"{'route':<52} {'count':>7} {'err':>5} {'rps':>8} {'p50':>9} {'p95':>9} {'p99':>9}"
+    if baseline:
+        header += f" {'p95 Δ':>9}"
+    print(header)
+    print("-" * len(header))
+    rows = list(result["routes"].items()) + [("TOTAL", result["total"])]
+    base_routes = dict(baseline["routes"], TOTAL=baseline["total"]) if baseline else {}
+    for route, s in rows:
+        line = (f"{route[:52]:<52} {s['count']:>7} {s['errors']:>5} {s['throughput_rps']:>8} "
+                f"{s['p50_ms']:>9} {s['p95_ms']:>9} {s['p99_ms']:>9}")
+        if baseline:
+            before = base_routes.get(route)
+            if before and before["p95_ms"]:
+                line += f" {(s['p95_ms'] - before['p95_ms']) / before['p95_ms'] * 100:>+8.1f}%"
+            else:
+                line += f" {'new':>9}"
+        print(line)
+
+
+# ---------------- App lifecycle ----------------
+def start_app(port: int, workers: int, gemini_url: str) -> subprocess.Popen:
+    env = dict(os.environ, GEMINI_API_URL=gemini_url, GOOGLE_API_KEY=os.getenv("GOOGLE_API_KEY_FAKE", "fake-key"))
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--workers", str(workers),
+         "--log-level", "warning"],
+        env=env,
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    for _ in range(300):
+        try:
+            if requests.get(base_url + "/login", timeout=1).status_code == 200:
+                return process
+        except requests.RequestException:
+            pass
+        if process.poll() is not None:
+            raise SystemExit("App exited during startup")
+        time.sleep(0.1)
+    process.terminate()
+    raise SystemExit("App did not become ready in 30s")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--manifest", default="bench/manifest.json")
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--start-app", action="store_true", help="launch uvicorn and a fake Gemini locally")
+    parser.add_argument("--port", type=int, default=8077)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--users", type=int, default=10, help="concurrent virtual users")
+    parser.add_argument("--admin-ratio", type=float, default=0.2, help="fraction of users that are admins")
+    parser.add_argument("--duration", type=float, default=30, help="measured seconds")
+    parser.add_argument("--warmup", type=float, default=5, help="unmeasured seconds before measuring")
+    parser.add_argument("--think-ms", type=float, default=0, help="mean think time between requests")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--gemini-latency-ms", type=float, default=800)
+    parser.add_argument("--gemini-jitter-ms", type=float, default=300)
+    parser.add_argument("--gemini-error-rate", type=float, default=0.02)
+    parser.add_argument("--output", help="result file (default: bench/results/loadtest-<commit>-<time>.json)")
+    parser.add_argument("--compare", help="earlier result file to diff against")
+    args = parser.parse_args()
+
+    with open(args.manifest) as f:
+        manifest = json.load(f)
+
+    app_process = None
+    base_url = args.base_url
+    if args.start_app:
+        _, gemini, gemini_url = start_fake_gemini(latency_ms=args.gemini_latency_ms, jitter_ms=args.gemini_jitter_ms,
+                                                  error_rate=args.gemini_error_rate, seed=args.seed)
+        app_process = start_app(args.port, args.workers, gemini_url)
+        base_url = f"http://127.0.0.1:{args.port}"
+
+    all_students = [sid for t in manifest["tutors"] for sid in t["student_ids"]]
+    admin_ctx = {"student_ids": all_students, "tutor_ids": [t["id"] for t in manifest["tutors"]]}
+    admin_users = max(0, min(args.users, round(args.users * args.admin_ratio)))
+
+    now = time.monotonic()
+    warmup_until = now + args.warmup
+    deadline = warmup_until + args.duration
+    users = []
+    for i in range(args.users):
+        if i < admin_users:
+            users.append(VirtualUser(i, base_url, manifest["admin"], ADMIN_MIX, admin_ctx, args.seed,
+                                     deadline, warmup_until, args.think_ms))
+        else:
+            tutor = manifest["tutors"][i % len(manifest["tutors"])]
+            ctx = {"student_ids": tutor["student_ids"], "tutor_ids": [tutor["id"]]}
+            users.append(VirtualUser(i, base_url, tutor["username"], TUTOR_MIX, ctx, args.seed,
+                                     deadline, warmup_until, args.think_ms))
+
+    print(f"Running {args.users} users ({admin_users} admin) for {args.duration}s after {args.warmup}s warmup...")
+    try:
+        for user in users:
+            user.start()
+        for user in users:
+            user.join()
+    finally:
+        if app_process is not None:
+            app_process.terminate()
+            app_process.wait(timeout=30)
+
+    samples = [s for user in users for s in user.samples]
+    result = {
+        **git_revision(),
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "config": {k: v for k, v in vars(args).items() if k not in ("output", "compare", "base_url")},
+        "dataset": {"students": len(all_students), "tutors": len(manifest["tutors"]), "seed": manifest.get("seed")},
+        **summarize(samples, args.duration),
+    }
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_report(result, baseline)
+
+    output = args.output
+    if not output:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+        output = os.path.join(RESULTS_DIR, f"loadtest-{result['commit']}-{stamp}.json")
+    with open(output, "w") as f:
+        json.dump(result, f, indent=2)
+    print(f"Saved results to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,231 @@
+"""
+Function-level benchmarks for the report, prompt and aggregation hot paths.
+
+    python -m bench.microbench                      # run and compare with the stored baseline
+    python -m bench.microbench --save-baseline      # record a new baseline
+    python -m bench.microbench --sizes 1000 --only pdf
+
+Each case is timed --repeat times (median and min are reported) and run once
+more under tracemalloc for peak memory. With a baseline present, any case
+whose median time or peak memory grows by more than --threshold fails the run
+with exit status 1. The benchmarks use their own throwaway SQLite database.
+"""
+from __future__ import annotations
+import argparse
+import gc
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date, datetime, timedelta
+
+# Point the app at a scratch database before any project module creates the engine
+_DB_DIR = tempfile.mkdtemp(prefix="microbench-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_DB_DIR, 'bench.db')}"
+
+from sqlalchemy import insert  # noqa: E402
+from sqlmodel import SQLModel, Session  # noqa: E402
+from db import engine  # noqa: E402
+from models import Student, Tutor, User, Journal, Attendance, TestRecord  # noqa: E402
+from ai_feedback import collect_student_context, format_data_for_ai  # noqa: E402
+from main import build_student_report_pdf, build_all_reports_pdf, attendance_by_day, month_attendance_rows  # noqa: E402
+from bench.loadtest import git_revision  # noqa: E402
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+DEFAULT_BASELINE = os.path.join(RESULTS_DIR, "microbench-baseline.json")
+SUBJECTS = ["Mathematics", "Science", "English", "Physics"]
+rng = random.Random(7)
+
+
+# ---------------- Fixtures ----------------
+def _days(n: int) -> list[date]:
+    start = date.today() - timedelta(days=n)
+    return [start + timedelta(days=i) for i in range(n)]
+
+
+def _journals(n: int, student_id: int = 1) -> list[Journal]:
+    return [Journal(student_id=student_id, tutor_name="Tutor", subject=rng.choice(SUBJECTS),
+                    journal="Covered exercises; struggled with fractions in the second half of the class.",
+                    remarks="Follow up next class", entry_date=d) for d in _days(n)]
+
+
+def _tests(n: int, student_id: int = 1) -> list[TestRecord]:
+    return [TestRecord(student_id=student_id, subject=rng.choice(SUBJECTS), topic="Fractions", test_date=d,
+                       total_marks=25, marks_attained=rng.randint(5, 25), remarks="Good effort")
+            for d in _days(n)]
+
+
+def _attendance(n: int, students: int = 1) -> list[Attendance]:
+    days = _days(max(1, n // students))
+    return [Attendance(student_id=s + 1, attendance_date=d, status=rng.choice(["Present", "Absent", "Late"]))
+            for s in range(students) for d in days][:n]
+
+
+_seeded_student: dict[int, int] = {}
+
+
+def _seed_student(rows: int) -> int:
+    """One student with `rows` journals, tests and attendance records, reused across repeats."""
+    if rows in _seeded_student:
+        return _seeded_student[rows]
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        user = User(username=f"bench_{rows}", password="x")
+        session.add(user)
+        session.commit()
+        tutor = Tutor(name="Tutor", subject="Mathematics", phone="0", user_id=user.id)
+        session.add(tutor)
+        session.commit()
+        student = Student(name="Bench Student", grade="8", tutor_id=tutor.id)
+        session.add(student)
+        session.commit()
+        for model, items in ((Journal, _journals(rows, student.id)), (TestRecord, _tests(rows, student.id)),
+                             (Attendance, _attendance(rows))):
+            session.execute(insert(model), [
+                {**item.model_dump(exclude={"id"}), "student_id": student.id} for item in items
+            ])
+        session.commit()
+        _seeded_student[rows] = student.id
+    return student.id
+
+
+# ---------------- Cases ----------------
+# Each setup takes a size and returns a zero-argument callable to time.
+def case_format_data_for_ai(size: int):
+    context = {"journals": _journals(size), "tests": _tests(size), "attendance": _attendance(size)}
+    return lambda: format_data_for_ai(context)
+
+
+def case_collect_student_context(size: int):
+    student_id = _seed_student(size)
+    start, end = date.today() - timedelta(days=size + 1), date.today()
+
+    def run():
+        with Session(engine) as session:
+            collect_student_context(session, student_id, start, end)
+    return run
+
+
+def case_student_report_pdf(size: int):
+    student = Student(id=1, name="Bench Student", grade="8", school="School", syllabus="CBSE",
+                      remarks="Synthetic", tutor_id=1)
+    tests = _tests(size)
+    return lambda: build_student_report_pdf(student, tests, [])
+
+
+def case_all_reports_pdf(size: int):
+    per_student = 20
+    students = [Student(id=i + 1, name=f"Student {i + 1}", grade="8", tutor_id=1)
+                for i in range(max(1, size // per_student))]
+    tests_by_student = {s.id: _tests(per_student, s.id) for s in students}
+    return lambda: build_all_reports_pdf(students, tests_by_student, {})
+
+
+def case_attendance_map(size: int):
+    records = _attendance(size)
+    return lambda: attendance_by_day(records)
+
+
+def case_view_attendance_filter(size: int):
+    records = _attendance(size)
+    latest = max(r.attendance_date for r in records)
+    return lambda: month_attendance_rows(records, latest.month, latest.year)
+
+
+CASES = {
+    "prompt.format_data_for_ai": case_format_data_for_ai,
+    "db.collect_student_context": case_collect_student_context,
+    "pdf.student_report": case_student_report_pdf,
+    "pdf.all_reports": case_all_reports_pdf,
+    "attendance.build_map": case_attendance_map,
+    "attendance.month_rows": case_view_attendance_filter,
+}
+
+
+# ---------------- Runner ----------------
+def measure(func, repeat: int) -> dict:
+    func()  # warm caches and lazy imports
+    timings = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+
+    gc.collect()
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "median_s": statistics.median(timings),
+        "min_s": min(timings),
+        "peak_kib": round(peak / 1024, 1),
+    }
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list[str]:
+    regressions = []
+    for key, current in results.items():
+        before = baseline.get("cases", {}).get(key)
+        if not before:
+            continue
+        if current["median_s"] > before["median_s"] * (1 + threshold):
+            regressions.append(f"{key}: time {before['median_s'] * 1000:.2f} ms -> {current['median_s'] * 1000:.2f} ms")
+        if current["peak_kib"] > before["peak_kib"] * (1 + threshold):
+            regressions.append(f"{key}: peak memory {before['peak_kib']} KiB -> {current['peak_kib']} KiB")
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--only", help="run cases whose name contains this text")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--threshold", type=float, default=0.25, help="allowed fractional growth (0.25 = 25%%)")
+    args = parser.parse_args()
+
+    results = {}
+    print(f"{'case':<42} {'median ms':>10} {'min ms':>10} {'peak KiB':>10}")
+    for name, setup in CASES.items():
+        if args.only and args.only not in name:
+            continue
+        for size in args.sizes:
+            key = f"{name}[{size}]"
+            results[key] = measure(setup(size), args.repeat)
+            r = results[key]
+            print(f"{key:<42} {r['median_s'] * 1000:>10.2f} {r['min_s'] * 1000:>10.2f} {r['peak_kib']:>10}")
+
+    report = {**git_revision(), "timestamp": datetime.now().isoformat(timespec="seconds"),
+              "python": sys.version.split()[0], "cases": results}
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Saved baseline to {args.baseline}")
+        return
+
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}; run with --save-baseline to create one")
+        return
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    regressions = compare(results, baseline, args.threshold)
+    if regressions:
+        print(f"\nRegressions beyond {args.threshold:.0%} against baseline {baseline.get('commit')}:")
+        for line in regressions:
+            print(f"  {line}")
+        sys.exit(1)
+    print(f"\nNo regressions beyond {args.threshold:.0%} against baseline {baseline.get('commit')}")
+
+
+if __name__ == "__main__":
+    main()
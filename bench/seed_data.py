@@ -0,0 +1,161 @@
+"""
+Seeds a synthetic tuition center for load testing.
+
+    DATABASE_URL=sqlite:///bench.db python -m bench.seed_data --students 1000 --years 2
+
+Creates one admin, a tutor per --students-per-tutor students, and for every
+student several years of weekday attendance, tests, journals and upcoming tests.
+Generation is seeded, so the same arguments always produce the same data. A
+manifest of the created accounts and ids is written for bench.loadtest.
+"""
+from __future__ import annotations
+import argparse
+import json
+import random
+from datetime import date, timedelta
+from passlib.context import CryptContext
+from sqlalchemy import insert
+from sqlmodel import SQLModel, Session, select
+from db import engine
+from models import User, Tutor, Student, Journal, Attendance, TestRecord, UpcomingTest
+
+SUBJECTS = ["Mathematics", "Science", "English", "Physics", "Chemistry", "Biology", "History", "Geography"]
+TOPICS = ["Fractions", "Algebra", "Triangles", "Circles", "Photosynthesis", "Grammar", "Essay Writing",
+          "Electricity", "Acids and Bases", "Cells", "World War II", "Map Reading", "Probability"]
+SYLLABI = ["CBSE", "ICSE", "IGCSE", "State Board"]
+GRADES = [str(g) for g in range(5, 13)]
+STATUSES = ["present"] * 17 + ["absent"] * 2 + ["late"]
+JOURNAL_NOTES = [
+    "Covered the chapter exercises and reviewed homework.",
+    "Struggled with fractions; needs more practice problems.",
+    "Very attentive today, solved all examples independently.",
+    "Revision session ahead of the upcoming test.",
+    "Introduced a new topic with worked examples.",
+]
+
+BATCH_SIZE = 5000
+DEFAULT_PASSWORD = "password"
+
+
+def _bulk_insert(session: Session, model, rows: list[dict]) -> None:
+    for start in range(0, len(rows), BATCH_SIZE):
+        session.execute(insert(model), rows[start:start + BATCH_SIZE])
+
+
+def seed(students: int, students_per_tutor: int, years: float, tests_per_month: int,
+         journals_per_week: int, seed_value: int, admin_username: str) -> dict:
+    rng = random.Random(seed_value)
+    SQLModel.metadata.create_all(engine)
+    # bcrypt is deliberately slow, so every seeded account shares one hash
+    password_hash = CryptContext(schemes=["bcrypt"], deprecated="auto").hash(DEFAULT_PASSWORD)
+
+    today = date.today()
+    first_day = today - timedelta(days=int(365 * years))
+    school_days = [first_day + timedelta(days=i) for i in range((today - first_day).days + 1)
+                   if (first_day + timedelta(days=i)).weekday() < 5]
+
+    with Session(engine) as session:
+        if session.exec(select(User).where(User.username == admin_username)).first():
+            raise SystemExit(f"User {admin_username!r} already exists; use a fresh database or --admin-username")
+
+        admin = User(username=admin_username, email=f"{admin_username}@example.com", password=password_hash,
+                     user_type="admin")
+        session.add(admin)
+        session.commit()
+        session.refresh(admin)
+
+        manifest = {"admin": admin_username, "password": DEFAULT_PASSWORD, "seed": seed_value, "tutors": []}
+        tutor_count = max(1, -(-students // students_per_tutor))
+        for t in range(tutor_count):
+            subject = SUBJECTS[t % len(SUBJECTS)]
+            tutor = Tutor(name=f"Tutor {t + 1}", subject=subject, phone=f"555{t:07d}", user_id=admin.id)
+            session.add(tutor)
+            session.commit()
+            session.refresh(tutor)
+            username = f"{admin_username}_tutor_{t + 1}"
+            session.add(User(username=username, password=password_hash, user_type="tutor", tutor_id=tutor.id))
+
+            count = min(students_per_tutor, students - t * students_per_tutor)
+            _bulk_insert(session, Student, [{
+                "name": f"Student {t * students_per_tutor + i + 1}",
+                "grade": rng.choice(GRADES),
+                "school": f"School {rng.randint(1, 40)}",
+                "syllabus": rng.choice(SYLLABI),
+                "focus_subjects": ", ".join(rng.sample(SUBJECTS, 2)),
+                "subject": subject,
+                "remarks": "Synthetic student for load testing.",
+                "tutor_id": tutor.id,
+            } for i in range(count)])
+            session.commit()
+            student_ids = session.exec(select(Student.id).where(Student.tutor_id == tutor.id)).all()
+            manifest["tutors"].append({"id": tutor.id, "username": username, "student_ids": list(student_ids)})
+
+            _seed_history(session, rng, tutor, student_ids, school_days, tests_per_month, journals_per_week, today)
+            session.commit()
+            print(f"Seeded tutor {t + 1}/{tutor_count} ({len(student_ids)} students)")
+
+    return manifest
+
+
+def _seed_history(session: Session, rng: random.Random, tutor: Tutor, student_ids: list[int],
+                  school_days: list[date], tests_per_month: int, journals_per_week: int, today: date) -> None:
+    months = max(1, len(school_days) // 21)
+    weeks = max(1, len(school_days) // 5)
+    for student_id in student_ids:
+        _bulk_insert(session, Attendance, [
+            {"student_id": student_id, "attendance_date": d, "status": rng.choice(STATUSES)}
+            for d in school_days
+        ])
+        tests = []
+        for _ in range(months * tests_per_month):
+            total = rng.choice([20, 25, 50, 100])
+            tests.append({
+                "student_id": student_id,
+                "subject": rng.choice(SUBJECTS),
+                "topic": rng.choice(TOPICS),
+                "test_date": rng.choice(school_days),
+                "total_marks": total,
+                "marks_attained": rng.randint(total // 4, total),
+                "remarks": rng.choice(["Good effort", "Needs revision", "Excellent", "Careless mistakes"]),
+            })
+        _bulk_insert(session, TestRecord, tests)
+        _bulk_insert(session, Journal, [{
+            "student_id": student_id,
+            "tutor_name": tutor.name,
+            "subject": rng.choice(SUBJECTS),
+            "journal": rng.choice(JOURNAL_NOTES),
+            "remarks": rng.choice(["On track", "Follow up next class", "Assign extra worksheet"]),
+            "entry_date": rng.choice(school_days),
+        } for _ in range(weeks * journals_per_week)])
+        _bulk_insert(session, UpcomingTest, [{
+            "student_id": student_id,
+            "subject": rng.choice(SUBJECTS),
+            "topics": rng.choice(TOPICS),
+            "test_date": today + timedelta(days=rng.randint(1, 60)),
+        } for _ in range(2)])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--students", type=int, default=100, help="number of students (10 to 100000)")
+    parser.add_argument("--students-per-tutor", type=int, default=25)
+    parser.add_argument("--years", type=float, default=1.0, help="years of history per student")
+    parser.add_argument("--tests-per-month", type=int, default=2)
+    parser.add_argument("--journals-per-week", type=int, default=2)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--admin-username", default="bench_admin")
+    parser.add_argument("--manifest", default="bench/manifest.json")
+    args = parser.parse_args()
+
+    if not 10 <= args.students <= 100_000:
+        parser.error("--students must be between 10 and 100000")
+
+    manifest = seed(args.students, args.students_per_tutor, args.years, args.tests_per_month,
+                    args.journals_per_week, args.seed, args.admin_username)
+    with open(args.manifest, "w") as f:
+        json.dump(manifest, f)
+    print(f"Wrote manifest to {args.manifest}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+ETags and 304 responses for read pages, derived from data versions.
+
+    etag = page_etag(session, user, student_scope(student_id))
+    if (response := not_modified(request, etag)) is not None:
+        return response
+    ... heavy queries ...
+    return with_etag(templates.TemplateResponse(...), etag)
+
+The tag covers the data versions of the given scopes, the viewing user, the
+day (dashboards show "today" counts) and a hash of the templates and built
+assets, so a deploy that changes the markup also changes every tag. Responses
+are marked private and must be revalidated, so the back button costs one
+cheap version lookup instead of the page's queries.
+"""
+from __future__ import annotations
+import hashlib
+import os
+from datetime import date
+from functools import lru_cache
+from starlette.responses import Response
+from assets import MANIFEST_PATH
+from data_versions import version_key
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+REVALIDATE_CACHE_CONTROL = "private, no-cache"
+
+
+@lru_cache(maxsize=1)
+def render_version() -> str:
+    """Hash of the templates and the asset manifest; RENDER_VERSION overrides it."""
+    if os.getenv("RENDER_VERSION"):
+        return os.environ["RENDER_VERSION"]
+    digest = hashlib.sha256()
+    templates_dir = os.path.join(BASE_DIR, "templates")
+    paths = [os.path.join(templates_dir, f) for f in sorted(os.listdir(templates_dir))] + [MANIFEST_PATH]
+    for path in paths:
+        if os.path.isfile(path):
+            with open(path, "rb") as f:
+                digest.update(f.read())
+    return digest.hexdigest()[:12]
+
+
+def page_etag(session, user, *keys: str) -> str:
+    """Weak ETag for a page built from the data behind `keys` (tables or data-version scopes)."""
+    return etag_for(user, version_key(session, *keys))
+
+
+def etag_for(user, versions: str) -> str:
+    """page_etag() for versions already read with version_key(), e.g. to share them with a fragment cache."""
+    raw = f"{render_version()}|{user.id}|{date.today().isoformat()}|{versions}"
+    return f'W/"{hashlib.sha256(raw.encode()).hexdigest()[:20]}"'
+
+
+def _opaque(tag: str) -> str:
+    tag = tag.strip()
+    return tag[2:] if tag.startswith("W/") else tag
+
+
+def not_modified(request, etag: str) -> Response | None:
+    """A 304 when the request's If-None-Match already names `etag` (weak comparison)."""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return None
+    tags = {_opaque(tag) for tag in header.split(",")}
+    if "*" in tags or _opaque(etag) in tags:
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": REVALIDATE_CACHE_CONTROL})
+    return None
+
+
+def with_etag(response: Response, etag: str) -> Response:
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = REVALIDATE_CACHE_CONTROL
+    return response
@@ -0,0 +1,177 @@
+"""
+Write counters ("data versions") kept in the dataversion table.
+
+Every committed write bumps the versions of the scopes it belongs to:
+"student:<id>" for a student and their records, "tutor:<id>" for a tutor's
+students and "tenant:<admin user id>" for everything an admin owns. Read
+paths combine the versions they depend on into cache keys and ETags:
+
+    version_key(session, user_scope(user))                            # template fragments
+    version_key(session, student_scope(5), cohort_scope(1, "8", "CBSE"))  # "cohort:1:8/CBSE=12.student:5=3"
+
+There are no table-wide versions: a row every writer had to update would make
+concurrent write transactions queue up behind each other's row lock. Writers
+in different tenants never share a version row.
+
+Bulk insert()/update()/delete() statements skip the ORM and bump nothing by
+themselves; code that issues them calls touch() with the scopes it changed.
+"""
+from __future__ import annotations
+from sqlalchemy import event, insert, inspect, or_, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+from sqlmodel import select
+from models import DataVersion, Student, Tutor
+
+VERSION_TABLE = DataVersion.__table__
+_UPSERT_DIALECTS = {"sqlite": sqlite.insert, "postgresql": postgresql.insert}
+
+
+def student_scope(student_id: int) -> str:
+    return f"student:{student_id}"
+
+
+def tutor_scope(tutor_id: int) -> str:
+    return f"tutor:{tutor_id}"
+
+
+def tenant_scope(admin_id: int) -> str:
+    return f"tenant:{admin_id}"
+
+
+def cohort_scope(admin_id: int, grade: str | None, syllabus: str | None) -> str:
+    """Students ranked against each other: one grade of one syllabus, within one admin's tenant."""
+    return f"cohort:{admin_id}:{grade}/{syllabus}"
+
+
+def user_scope(user) -> str:
+    """The widest scope a user can see: their whole tenant for an admin, their students for a tutor."""
+    return tenant_scope(user.id) if user.user_type == "admin" else tutor_scope(user.tutor_id)
+
+
+def _bump(connection, keys: set[str]) -> dict[str, int]:
+    """Increments the versions of `keys` and returns their new values."""
+    dialect_insert = _UPSERT_DIALECTS.get(connection.dialect.name)
+    if dialect_insert is not None:
+        statement = dialect_insert(VERSION_TABLE).values(
+            [{"table_name": k, "version": 1} for k in sorted(keys)]
+        ).on_conflict_do_update(
+            index_elements=[VERSION_TABLE.c.table_name],
+            set_={"version": VERSION_TABLE.c.version + 1},
+        )
+        if connection.dialect.insert_returning:
+            return dict(connection.execute(statement.returning(VERSION_TABLE.c.table_name, VERSION_TABLE.c.version)).all())
+        connection.execute(statement)
+    else:
+        result = connection.execute(
+            update(VERSION_TABLE)
+            .where(VERSION_TABLE.c.table_name.in_(keys))
+            .values(version=VERSION_TABLE.c.version + 1)
+        )
+        if result.rowcount != len(keys):
+            existing = set(connection.execute(
+                select(VERSION_TABLE.c.table_name).where(VERSION_TABLE.c.table_name.in_(keys))
+            ).scalars())
+            connection.execute(insert(VERSION_TABLE), [{"table_name": k, "version": 1} for k in keys - existing])
+    return dict(connection.execute(
+        select(VERSION_TABLE.c.table_name, VERSION_TABLE.c.version).where(VERSION_TABLE.c.table_name.in_(keys))
+    ).all())
+
+
+def _written(session) -> dict[str, set]:
+    return session.info.setdefault("data_versions", {"students": set(), "tutors": set(), "keys": set()})
+
+
+def _history_values(obj, attribute: str) -> set:
+    """Current and previous values of an attribute, so moving a row bumps both owners."""
+    history = inspect(obj).attrs[attribute].history
+    values = {getattr(obj, attribute), *history.deleted}
+    return {v for v in values if v is not None}
+
+
+def _record(written: dict, obj) -> None:
+    if isinstance(obj, Student):
+        written["keys"].add(student_scope(obj.id))
+        written["tutors"].update(_history_values(obj, "tutor_id"))
+    elif isinstance(obj, Tutor):
+        written["keys"].add(tutor_scope(obj.id))
+        written["keys"].update(tenant_scope(uid) for uid in _history_values(obj, "user_id"))
+    elif "student_id" in obj.__table__.c:
+        written["students"].update(_history_values(obj, "student_id"))
+
+
+def _resolve_scopes(connection, written: dict) -> set[str]:
+    """Expands students to their tutors and tutors to their tenants, in one query."""
+    keys = set(written["keys"]) | {student_scope(sid) for sid in written["students"]}
+    keys.update(tutor_scope(tid) for tid in written["tutors"])
+    students, tutors = Student.__table__, Tutor.__table__
+    conditions = []
+    if written["tutors"]:
+        conditions.append(tutors.c.id.in_(written["tutors"]))
+    if written["students"]:
+        conditions.append(tutors.c.id.in_(
+            select(students.c.tutor_id).where(students.c.id.in_(written["students"]))
+        ))
+    if conditions:
+        for tutor_id, user_id in connection.execute(select(tutors.c.id, tutors.c.user_id).where(or_(*conditions))):
+            keys.add(tutor_scope(tutor_id))
+            if user_id is not None:
+                keys.add(tenant_scope(user_id))
+    return keys
+
+
+def touch(session, *keys: str) -> None:
+    """Makes the session's next commit bump `keys` as well, e.g. for scopes a bulk statement wrote to."""
+    _written(session)["keys"].update(keys)
+
+
+def track_writes() -> None:
+    """
+    Records the scopes a session writes to and bumps their versions
+    once, just before commit, on the session's own connection: the new versions
+    commit or roll back together with the data and every worker process sees them.
+    """
+
+    @event.listens_for(Session, "after_flush")
+    def _after_flush(session, flush_context):
+        written = _written(session)
+        for obj in (*session.new, *session.deleted, *session.dirty):
+            if hasattr(obj, "__table__") and (obj not in session.dirty or session.is_modified(obj)):
+                _record(written, obj)
+
+    @event.listens_for(Session, "before_commit")
+    def _before_commit(session):
+        session.flush()  # commit would flush after this hook; collect those writes too
+        written = _written(session)
+        bumped = {}
+        if any(written.values()):
+            connection = session.connection()
+            bumped = _bump(connection, _resolve_scopes(connection, written))
+        session.info["data_versions_bumped"] = bumped
+        for collected in written.values():
+            collected.clear()
+
+    @event.listens_for(Session, "after_rollback")
+    def _after_rollback(session):
+        session.info.pop("data_versions_bumped", None)
+        for collected in _written(session).values():
+            collected.clear()
+
+
+def committed_versions(session) -> dict[str, int]:
+    """The versions the session's last commit bumped, and their new values; for after_commit listeners."""
+    return session.info.get("data_versions_bumped", {})
+
+
+def current_versions(session, *keys: str) -> dict[str, int]:
+    """The current version of each of `keys`, 0 for one never written."""
+    rows = session.exec(
+        select(DataVersion.table_name, DataVersion.version).where(DataVersion.table_name.in_(keys))
+    ).all()
+    return {k: 0 for k in keys} | dict(rows)
+
+
+def version_key(session, *keys: str) -> str:
+    """A short string that changes whenever any of `keys` is written."""
+    versions = current_versions(session, *keys)
+    return ".".join(f"{k}={versions[k]}" for k in sorted(keys))
@@ -1,6 +1,6 @@
 from fastapi import Request, Depends, HTTPException
 from sqlmodel import Session, select
-from models import User
+from models import User, Student, Tutor
 from db import get_session
 
 
@@ -13,4 +13,47 @@ def get_current_user(request: Request, session: Session = Depends(get_session))
     if not user:
         raise HTTPException(status_code=401, detail="Invalid user")
 
-    return user
\ No newline at end of file
+    return user
+
+
+class StudentAccess:
+    """A student the caller may act on, with its tutor and the admin who owns that tutor."""
+    __slots__ = ("student", "tutor", "admin_id")
+
+    def __init__(self, student: Student, tutor: Tutor):
+        self.student = student
+        self.tutor = tutor
+        self.admin_id = tutor.user_id
+
+
+def load_student_access(session: Session, user: User, student_id: int) -> StudentAccess:
+    """
+    Resolves a student and its tutor in one joined query. Raises 404 for an
+    unknown student and 403 when a tutor asks for someone else's student or an
+    admin for a student of another admin's tutor.
+    """
+    row = session.exec(
+        select(Student, Tutor).outerjoin(Tutor, Student.tutor_id == Tutor.id).where(Student.id == student_id)
+    ).first()
+    if row is None:
+        raise HTTPException(status_code=404, detail="Student not found")
+
+    student, tutor = row
+    if not tutor or (user.user_type == "tutor" and tutor.id != user.tutor_id):
+        raise HTTPException(status_code=403, detail="Not authorized")
+    if user.user_type == "admin" and tutor.user_id != user.id:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    return StudentAccess(student, tutor)
+
+
+def get_student_access(student_id: int, session: Session = Depends(get_session),
+                       user: User = Depends(get_current_user)) -> StudentAccess:
+    """Dependency for routes with a {student_id} path parameter; FastAPI caches it per request."""
+    return load_student_access(session, user, student_id)
+
+
+def get_tutor_ids(session: Session = Depends(get_session), user: User = Depends(get_current_user)) -> list[int]:
+    """Tutor ids whose students the caller can see: an admin's own tutors, or the tutor themself."""
+    if user.user_type == "admin":
+        return list(session.exec(select(Tutor.id).where(Tutor.user_id == user.id)).all())
+    return [user.tutor_id] if user.tutor_id else []
\ No newline at end of file
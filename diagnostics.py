@@ -0,0 +1,143 @@
+from __future__ import annotations
+import os
+import sys
+from collections import defaultdict
+import anyio.to_thread
+from fastapi import APIRouter, Depends, Request, HTTPException
+from fastapi.responses import HTMLResponse
+from fastapi.templating import Jinja2Templates
+from models import User
+from db import engine
+from dependencies import get_current_user
+import metrics
+
+try:
+    import resource
+except ImportError:  # Windows: no peak RSS
+    resource = None
+
+router = APIRouter(prefix="/diagnostics", tags=["Diagnostics"])
+
+_templates: Jinja2Templates | None = None
+
+
+def init_templates(templates: Jinja2Templates) -> None:
+    global _templates
+    _templates = templates
+
+
+# ---------------- Collectors ----------------
+def pool_stats() -> dict:
+    pool = engine.pool
+    stats = {"class": type(pool).__name__, "status": pool.status()}
+    for name in ("size", "checkedin", "checkedout", "overflow"):
+        method = getattr(pool, name, None)
+        if callable(method):
+            stats[name] = method()
+    return stats
+
+
+def sqlite_stats() -> dict | None:
+    if engine.url.get_backend_name() != "sqlite" or not engine.url.database:
+        return None
+    path = engine.url.database
+    sizes = {}
+    for suffix in ("", "-wal", "-shm"):
+        try:
+            sizes[suffix or "db"] = os.path.getsize(path + suffix)
+        except OSError:
+            sizes[suffix or "db"] = 0
+    return {"path": path, "db_bytes": sizes["db"], "wal_bytes": sizes["-wal"], "shm_bytes": sizes["-shm"]}
+
+
+def cache_stats(counters: dict) -> dict:
+    caches = defaultdict(lambda: {"hit": 0, "miss": 0})
+    for (name, labels), value in counters.items():
+        if name != "cache_requests_total":
+            continue
+        labels = dict(labels)
+        caches[labels["cache"]][labels["outcome"]] += value
+    for stats in caches.values():
+        total = stats["hit"] + stats["miss"]
+        stats["hit_rate"] = round(stats["hit"] / total, 4) if total else None
+    return dict(caches)
+
+
+def gemini_stats(counters: dict, histograms: dict) -> dict:
+    callers = defaultdict(lambda: {"ok": 0, "error": 0})
+    for (name, labels), value in counters.items():
+        if name == "gemini_requests_total":
+            labels = dict(labels)
+            callers[labels["caller"]][labels["outcome"]] += value
+
+    result = {}
+    for caller, outcomes in callers.items():
+        buckets = histograms.get(("gemini_request_duration_seconds", (("caller", caller),)), [])
+        total = outcomes["ok"] + outcomes["error"]
+        result[caller] = {
+            "calls": total,
+            "error_rate": round(outcomes["error"] / total, 4) if total else None,
+            "p50_seconds": metrics.histogram_quantile(0.50, buckets),
+            "p95_seconds": metrics.histogram_quantile(0.95, buckets),
+            "p99_seconds": metrics.histogram_quantile(0.99, buckets),
+        }
+    return result
+
+
+def worker_stats() -> dict:
+    """Requests waiting on the threadpool that runs every sync route; this is the app's job queue."""
+    limiter = anyio.to_thread.current_default_thread_limiter()
+    statistics = limiter.statistics()
+    return {
+        "threads_total": limiter.total_tokens,
+        "threads_busy": statistics.borrowed_tokens,
+        "queue_depth": statistics.tasks_waiting,
+    }
+
+
+def process_stats() -> dict:
+    """Resident memory now and at its peak, where the platform reports them (Linux does both); None otherwise."""
+    rss_bytes = peak_bytes = None
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    rss_bytes = int(line.split()[1]) * 1024
+                    break
+    except OSError:  # no /proc, e.g. macOS or Windows
+        pass
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is bytes on macOS and kilobytes elsewhere
+        peak_bytes = peak if sys.platform == "darwin" else peak * 1024
+    return {"pid": os.getpid(), "rss_bytes": rss_bytes, "peak_rss_bytes": peak_bytes}
+
+
+def collect() -> dict:
+    counters, gauges, histograms, _ = metrics.snapshot()
+    in_flight = sum(v for (name, _), v in gauges.items() if name == "http_requests_in_flight")
+    return {
+        "db_pool": pool_stats(),
+        "sqlite": sqlite_stats(),
+        "caches": cache_stats(counters),
+        "gemini": gemini_stats(counters, histograms),
+        "workers": worker_stats(),
+        "process": process_stats(),
+        "requests_in_flight": in_flight,
+    }
+
+
+# ---------------- Endpoints ----------------
+@router.get("", response_class=HTMLResponse)
+async def diagnostics_page(request: Request, user: User = Depends(get_current_user)):
+    if user.user_type != "admin":
+        raise HTTPException(status_code=403, detail="Not authorized")
+    return _templates.TemplateResponse("diagnostics.html", {"request": request, "stats": collect()})
+
+
+# Async so the threadpool statistics are read from the event loop itself
+@router.get("/data")
+async def diagnostics_data(user: User = Depends(get_current_user)):
+    if user.user_type != "admin":
+        raise HTTPException(status_code=403, detail="Not authorized")
+    return collect()
@@ -0,0 +1,291 @@
+"""
+Resilient Gemini calls, shared by the insights and question generators.
+
+    data = gemini.generate(payload, caller="insights")            # parsed generateContent response
+    for piece in gemini.stream(payload, caller="questions"): ...   # text as it is written
+
+Every call has a deadline (GEMINI_DEADLINE seconds, retries included). 429 and
+5xx responses, timeouts and connection failures are retried with full-jitter
+exponential backoff, waiting at least as long as a Retry-After header asks and
+never past the deadline. Calls that cannot succeed raise GeminiError.
+
+A circuit breaker counts consecutive failed attempts across the process. After
+GEMINI_BREAKER_THRESHOLD of them it opens: calls raise GeminiUnavailable at once,
+without holding a worker thread, for GEMINI_BREAKER_COOLDOWN seconds, after
+which a single probe call is let through to close it again.
+
+With GEMINI_HEDGE_AFTER set, a generate() attempt still unanswered after that
+many seconds sends a second, identical request and uses whichever answers
+first. That trims the latency tail at the price of extra Gemini calls, so it
+is off by default. Streams are never hedged or retried once text has arrived.
+"""
+from __future__ import annotations
+import json
+import os
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from email.utils import parsedate_to_datetime
+from typing import Iterator
+import requests
+from metrics import inc, track_gemini
+from tracing import span, SPAN_KIND_CLIENT
+
+GEMINI_API_KEY = os.getenv("GOOGLE_API_KEY")
+GEMINI_API_URL = os.getenv(
+    "GEMINI_API_URL",
+    "https://generativelanguage.googleapis.com/v1beta/models/gemini-1.5-flash:generateContent"
+)
+GEMINI_STREAM_URL = os.getenv(
+    "GEMINI_STREAM_URL",
+    GEMINI_API_URL.replace(":generateContent", ":streamGenerateContent")
+)
+
+GEMINI_DEADLINE = float(os.getenv("GEMINI_DEADLINE", "30"))
+GEMINI_CONNECT_TIMEOUT = float(os.getenv("GEMINI_CONNECT_TIMEOUT", "5"))
+# a stream may run longer than a single answer, but must keep producing events
+GEMINI_STREAM_DEADLINE = float(os.getenv("GEMINI_STREAM_DEADLINE", "300"))
+GEMINI_STREAM_TIMEOUT = float(os.getenv("GEMINI_STREAM_TIMEOUT", "60"))
+GEMINI_MAX_ATTEMPTS = int(os.getenv("GEMINI_MAX_ATTEMPTS", "4"))
+GEMINI_BACKOFF_BASE = float(os.getenv("GEMINI_BACKOFF_BASE", "0.5"))
+GEMINI_BACKOFF_MAX = float(os.getenv("GEMINI_BACKOFF_MAX", "8"))
+GEMINI_BREAKER_THRESHOLD = int(os.getenv("GEMINI_BREAKER_THRESHOLD", "5"))
+GEMINI_BREAKER_COOLDOWN = float(os.getenv("GEMINI_BREAKER_COOLDOWN", "30"))
+GEMINI_HEDGE_AFTER = float(os.getenv("GEMINI_HEDGE_AFTER", "0"))  # seconds; 0 turns hedging off
+
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+# one pooled session: keeps TLS connections to Gemini open between calls
+_http = requests.Session()
+_hedges = ThreadPoolExecutor(max_workers=int(os.getenv("GEMINI_HEDGE_WORKERS", "8")),
+                             thread_name_prefix="gemini-hedge")
+
+
+class GeminiError(Exception):
+    """A call that failed for good: a response that cannot be retried, or the retries or deadline ran out."""
+
+
+class GeminiUnavailable(GeminiError):
+    """The circuit breaker is open; nothing was sent."""
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"Gemini is unavailable; retry in {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+
+# ---------------- Circuit breaker ----------------
+class CircuitBreaker:
+    """Closed until `threshold` attempts fail in a row; then open for `cooldown` seconds, then one probe."""
+
+    def __init__(self, threshold: int, cooldown: float):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at: float | None = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        return "half-open" if self.retry_in() == 0 else "open"
+
+    def retry_in(self) -> float:
+        """Seconds until the next probe may be sent (0 when closed or due)."""
+        if self.opened_at is None:
+            return 0.0
+        return max(self.cooldown - (time.monotonic() - self.opened_at), 0.0)
+
+    def allow(self) -> bool:
+        """Raises GeminiUnavailable unless a request may be sent now; True if the caller is the probe."""
+        with self._lock:
+            if self.opened_at is None:
+                return False
+            if self.retry_in() == 0 and not self._probing:
+                self._probing = True  # this caller probes; the rest keep failing fast until it reports
+                return True
+            raise GeminiUnavailable(max(self.retry_in(), 1.0))
+
+    def release(self) -> None:
+        """Ends the probe whatever happened to it, so a probe that never reported cannot wedge the breaker."""
+        with self._lock:
+            self._probing = False
+
+    def succeeded(self) -> None:
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._probing = False
+
+    def failed(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self._probing or self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+            self._probing = False
+
+
+breaker = CircuitBreaker(GEMINI_BREAKER_THRESHOLD, GEMINI_BREAKER_COOLDOWN)
+
+
+# ---------------- Retries ----------------
+def _retry_after(response: requests.Response) -> float | None:
+    """Seconds a Retry-After header (delta or HTTP date) asks us to wait, if it has one."""
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+def _backoff(attempt: int) -> float:
+    # "full jitter": spreads the retries of callers that failed together
+    return random.uniform(0, min(GEMINI_BACKOFF_MAX, GEMINI_BACKOFF_BASE * 2 ** attempt))
+
+
+def _send(url: str, payload: dict, params: dict, timeout, stream: bool = False) -> requests.Response:
+    return _http.post(url, json=payload, params=params, timeout=timeout, stream=stream)
+
+
+def _hedged(url: str, payload: dict, params: dict, timeout, caller: str) -> requests.Response:
+    """Sends the request, and again if the first is slow; returns the first usable response."""
+    first = _hedges.submit(_send, url, payload, params, timeout)
+    done, _ = wait([first], timeout=GEMINI_HEDGE_AFTER)
+    if done:
+        return first.result()
+    inc("gemini_hedged_requests_total", (("caller", caller),))
+    pending = {first, _hedges.submit(_send, url, payload, params, timeout)}
+    fallback, error = None, None
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            try:
+                response = future.result()
+            except requests.exceptions.RequestException as e:
+                error = e
+                continue
+            if response.status_code not in RETRY_STATUSES:
+                for other in pending:  # the loser still finishes in the background; just drop its answer
+                    other.add_done_callback(lambda f: f.exception() or f.result().close())
+                return response
+            fallback = response
+    if fallback is not None:
+        return fallback
+    raise error
+
+
+def _call(url: str, payload: dict, caller: str, deadline: float, stream: bool = False) -> requests.Response:
+    """
+    A successful response to `payload`, retrying within the deadline. With
+    stream=True the response body has not been read yet.
+    """
+    params = {"key": GEMINI_API_KEY, **({"alt": "sse"} if stream else {})}
+    hedge = GEMINI_HEDGE_AFTER > 0 and not stream
+    attempt = 0
+    while True:
+        probe = breaker.allow()
+        try:
+            remaining = deadline - time.monotonic()
+            timeout = (min(GEMINI_CONNECT_TIMEOUT, remaining), remaining)
+            wait_for = None
+            try:
+                if hedge:
+                    response = _hedged(url, payload, params, timeout, caller)
+                else:
+                    response = _send(url, payload, params, timeout, stream)
+            except requests.exceptions.RequestException as e:
+                breaker.failed()
+                failure = f"{type(e).__name__}: {e}"
+            else:
+                if response.status_code not in RETRY_STATUSES:
+                    breaker.succeeded()  # even a 4xx shows Gemini is up; it just will not help to retry
+                    if not response.ok:
+                        raise GeminiError(f"HTTP {response.status_code}: {response.text[:200]}")
+                    return response
+                breaker.failed()
+                failure = f"HTTP {response.status_code}"
+                wait_for = _retry_after(response)
+                response.close()
+        finally:
+            if probe:
+                breaker.release()
+
+        attempt += 1
+        delay = max(_backoff(attempt), wait_for or 0)
+        if attempt >= GEMINI_MAX_ATTEMPTS or time.monotonic() + delay >= deadline:
+            raise GeminiError(f"{failure} (gave up after {attempt} attempt{'s' if attempt > 1 else ''})")
+        inc("gemini_retries_total", (("caller", caller),))
+        time.sleep(delay)
+
+
+def _wait_between_reads(response: requests.Response, timeout: float) -> None:
+    """Lets each further read of a streamed body wait up to `timeout` seconds, now that it has started."""
+    sock = getattr(getattr(response.raw, "connection", None), "sock", None)
+    if sock is not None:
+        sock.settimeout(timeout)
+
+
+def _rejected(caller: str) -> None:
+    inc("gemini_circuit_rejections_total", (("caller", caller),))
+
+
+def _fail_fast(caller: str) -> None:
+    # while the circuit is open, refuse before timing or tracing a call that will not be made
+    if breaker.state == "open":
+        _rejected(caller)
+        raise GeminiUnavailable(max(breaker.retry_in(), 1.0))
+
+
+# ---------------- Calls ----------------
+def generate(payload: dict, caller: str, deadline: float = GEMINI_DEADLINE) -> dict:
+    """The generateContent response for `payload`, within `deadline` seconds; raises GeminiError."""
+    _fail_fast(caller)
+    with track_gemini(caller), \
+            span("gemini.generate_content", SPAN_KIND_CLIENT, caller=caller) as gemini_span:
+        try:
+            response = _call(GEMINI_API_URL, payload, caller, time.monotonic() + deadline)
+        except GeminiUnavailable:
+            _rejected(caller)  # opened while this call was retrying
+            raise
+        if gemini_span:
+            gemini_span.set("http.status_code", response.status_code)
+        return response.json()
+
+
+def stream(payload: dict, caller: str, deadline: float = GEMINI_STREAM_DEADLINE) -> Iterator[str]:
+    """The text of a streamGenerateContent answer to `payload`, piece by piece; raises GeminiError."""
+    _fail_fast(caller)
+    end = time.monotonic() + deadline
+    with track_gemini(caller), \
+            span("gemini.stream_generate_content", SPAN_KIND_CLIENT, caller=caller) as gemini_span:
+        try:
+            response = _call(GEMINI_STREAM_URL, payload, caller, min(end, time.monotonic() + GEMINI_DEADLINE),
+                             stream=True)
+        except GeminiUnavailable:
+            _rejected(caller)
+            raise
+        if gemini_span:
+            gemini_span.set("http.status_code", response.status_code)
+        # the first byte had GEMINI_DEADLINE; the gaps between events get the stream's own timeout
+        _wait_between_reads(response, max(min(GEMINI_STREAM_TIMEOUT, end - time.monotonic()), 0.001))
+        with response:
+            try:
+                for line in response.iter_lines(chunk_size=None):  # as it arrives, not in 512-byte reads
+                    if time.monotonic() > end:
+                        raise GeminiError(f"stream exceeded its {deadline:.0f}s deadline")
+                    if line.startswith(b"data:"):
+                        for candidate in json.loads(line[5:]).get("candidates", [])[:1]:
+                            for part in candidate.get("content", {}).get("parts", []):
+                                if part.get("text"):
+                                    yield part["text"]
+            except requests.exceptions.RequestException as e:
+                breaker.failed()
+                raise GeminiError(f"stream interrupted: {type(e).__name__}: {e}") from e
@@ -0,0 +1,194 @@
+"""
+Live attendance: committed changes pushed to open pages as small deltas.
+
+    live.publish(session, access.admin_id, {"type": "attendance", ...})
+    session.commit()   # subscribers of that tenant receive the delta now
+
+Pages connect to the /ws/attendance WebSocket and get one JSON message per
+change: the attendance grid updates the cell, the dashboard its counters, the
+today page its row. Channels are per tenant (admin); a tutor only receives
+changes to their own students. A subscriber that falls more than
+LIVE_QUEUE_SIZE messages behind gets {"type": "resync"} instead and reloads
+its data.
+
+Deltas are only delivered once their transaction commits. On SQLite they are
+handed to this process's subscribers after commit; on PostgreSQL publish()
+issues pg_notify() inside the transaction and a LISTEN thread in every worker
+delivers them, so pages connected to other workers update too.
+"""
+from __future__ import annotations
+import asyncio
+import json
+import logging
+import os
+import select as select_module
+import threading
+from urllib.parse import urlsplit
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect
+from sqlalchemy import event, text
+from sqlalchemy.orm import Session as OrmSession
+from sqlmodel import Session, select
+from starlette.concurrency import run_in_threadpool
+from models import Tutor, User
+from db import engine
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(tags=["Live"])
+
+LIVE_CHANNEL = os.getenv("LIVE_CHANNEL", "live_attendance")
+LIVE_QUEUE_SIZE = int(os.getenv("LIVE_QUEUE_SIZE", "256"))
+
+
+class _Subscriber:
+    """One connected page; offered messages from any thread, read on its own event loop."""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, tutor_id: int | None):
+        self.loop = loop
+        self.tutor_id = tutor_id  # None for an admin: every tutor of the tenant
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=LIVE_QUEUE_SIZE)
+
+    def offer(self, message: dict) -> None:
+        if self.queue.full():
+            # too far behind for deltas to be useful: replace the backlog with one resync
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            message = {"type": "resync"}
+        self.queue.put_nowait(message)
+
+
+_channels: dict[int, set[_Subscriber]] = {}
+_lock = threading.Lock()
+
+
+def subscribe(tenant_id: int, tutor_id: int | None) -> _Subscriber:
+    subscriber = _Subscriber(asyncio.get_running_loop(), tutor_id)
+    with _lock:
+        _channels.setdefault(tenant_id, set()).add(subscriber)
+    return subscriber
+
+
+def unsubscribe(tenant_id: int, subscriber: _Subscriber) -> None:
+    with _lock:
+        subscribers = _channels.get(tenant_id)
+        if subscribers is not None:
+            subscribers.discard(subscriber)
+            if not subscribers:
+                del _channels[tenant_id]
+
+
+def _deliver(message: dict) -> None:
+    tenant_id = message.pop("tenant")
+    with _lock:
+        subscribers = list(_channels.get(tenant_id, ()))
+    for subscriber in subscribers:
+        if subscriber.tutor_id is None or subscriber.tutor_id == message.get("tutor_id"):
+            subscriber.loop.call_soon_threadsafe(subscriber.offer, dict(message))
+
+
+# ---------------- Publishing ----------------
+def publish(session: Session, tenant_id: int, message: dict) -> None:
+    """Queues `message` for the tenant's subscribers, to be delivered when the session commits."""
+    message = {"tenant": tenant_id, **message}
+    if session.get_bind().dialect.name == "postgresql":
+        session.execute(text("SELECT pg_notify(:channel, :payload)"),
+                        {"channel": LIVE_CHANNEL, "payload": json.dumps(message, default=str)})
+    else:
+        session.info.setdefault("live_messages", []).append(message)
+
+
+def track_commits() -> None:
+    """Delivers messages published in a session once it commits, and drops them on rollback."""
+
+    @event.listens_for(OrmSession, "after_commit")
+    def _after_commit(session):
+        for message in session.info.pop("live_messages", ()):
+            _deliver(message)
+
+    @event.listens_for(OrmSession, "after_rollback")
+    def _after_rollback(session):
+        session.info.pop("live_messages", None)
+
+
+def _listen(bind) -> None:
+    """PostgreSQL LISTEN loop: hands every notification on LIVE_CHANNEL to this worker's subscribers."""
+    while True:
+        connection = None
+        try:
+            connection = bind.raw_connection()
+            dbapi_connection = connection.dbapi_connection
+            dbapi_connection.set_isolation_level(0)  # autocommit, so notifications arrive
+            dbapi_connection.cursor().execute(f"LISTEN {LIVE_CHANNEL}")
+            while True:
+                if select_module.select([dbapi_connection], [], [], 30) == ([], [], []):
+                    continue
+                dbapi_connection.poll()
+                while dbapi_connection.notifies:
+                    _deliver(json.loads(dbapi_connection.notifies.pop(0).payload))
+        except Exception:
+            logger.exception("live attendance listener failed; reconnecting")
+            if connection is not None:
+                connection.invalidate()
+            threading.Event().wait(5)
+
+
+def start_listener(bind=engine) -> None:
+    """Starts the cross-worker listener when the database is PostgreSQL; nothing to do on SQLite."""
+    if bind.dialect.name == "postgresql":
+        threading.Thread(target=_listen, args=(bind,), name="live-listener", daemon=True).start()
+
+
+# ---------------- WebSocket ----------------
+def _audience(username: str | None) -> tuple[int, int | None] | None:
+    """(tenant id, tutor id or None for an admin) for the cookie's user, None when not signed in."""
+    if not username:
+        return None
+    with Session(engine) as session:
+        user = session.exec(select(User).where(User.username == username)).first()
+        if user is None:
+            return None
+        if user.user_type == "admin":
+            return user.id, None
+        tutor = session.get(Tutor, user.tutor_id) if user.tutor_id else None
+        if tutor is None or tutor.user_id is None:
+            return None
+        return tutor.user_id, tutor.id
+
+
+def _same_origin(websocket: WebSocket) -> bool:
+    # browsers send cookies with cross-site WebSocket handshakes too, so check where the page came from
+    origin = websocket.headers.get("origin")
+    return origin is None or urlsplit(origin).netloc == websocket.headers.get("host")
+
+
+@router.websocket("/ws/attendance")
+async def attendance_socket(websocket: WebSocket):
+    audience = None
+    if _same_origin(websocket):
+        audience = await run_in_threadpool(_audience, websocket.cookies.get("username"))
+    await websocket.accept()
+    if audience is None:
+        # closed after accepting: a refused handshake reaches the browser as 1006, which it would retry
+        await websocket.close(code=1008)  # policy violation: not signed in, or another site
+        return
+    tenant_id, tutor_id = audience
+    subscriber = subscribe(tenant_id, tutor_id)
+    # clients have nothing to say; reading only tells us when they go away
+    receiving = asyncio.ensure_future(websocket.receive())
+    getting = asyncio.ensure_future(subscriber.queue.get())
+    try:
+        while True:
+            done, _ = await asyncio.wait({receiving, getting}, return_when=asyncio.FIRST_COMPLETED)
+            if getting in done:
+                await websocket.send_json(getting.result())
+                getting = asyncio.ensure_future(subscriber.queue.get())
+            if receiving in done:
+                if receiving.result()["type"] == "websocket.disconnect":
+                    break
+                receiving = asyncio.ensure_future(websocket.receive())
+    except WebSocketDisconnect:
+        pass
+    finally:
+        receiving.cancel()
+        getting.cancel()
+        unsubscribe(tenant_id, subscriber)
@@ -6,39 +6,71 @@ from datetime import date, timedelta, datetime
 from fastapi import Body, Query, FastAPI, Request, Depends, Form
 from fastapi.responses import HTMLResponse
 from fastapi.templating import Jinja2Templates
-from sqlalchemy import func
+from sqlalchemy import func, delete
+from sqlalchemy.orm import contains_eager
 from sqlmodel import SQLModel, create_engine, Session, select
 from starlette.responses import RedirectResponse
 
-from models import Student, Journal, Attendance, TestRecord, User, Tutor, UpcomingTest, Feedback
-from db import engine  # shared engine
+from models import Student, Journal, Attendance, TestRecord, User, Tutor, UpcomingTest, Feedback, SubjectRanking, QuestionPaper
+from db import engine, get_session  # shared engine
+from dependencies import (
+    get_current_user, StudentAccess, get_student_access, load_student_access, get_tutor_ids,
+)
 from ai_feedback import router as ai_feedback_router, init_templates
 from ai_questions import router as ai_questions_router, init_templates as init_questions_templates
-from fastapi.staticfiles import StaticFiles
+from metrics import router as metrics_router, MetricsMiddleware, instrument_engine
+import query_audit
+from compression import CompressionMiddleware
+import template_cache
+import data_versions
+from data_versions import version_key, student_scope, user_scope, cohort_scope
+from conditional import page_etag, etag_for, not_modified, with_etag
+from profiler import router as profiler_router, ProfilerMiddleware, init_templates as init_profiler_templates
+from diagnostics import router as diagnostics_router, init_templates as init_diagnostics_templates
+from api import router as api_router
+import search
+import roster
+import live
+import tracing
+from tracing import span
+from rankings import (
+    router as rankings_router, refresh_rankings, refresh_student_cohorts, rankings_empty,
+    get_student_rankings, get_rankings_by_student, ranking_label,
+)
+from streaming import stream_template, stream_rows, group_rows
+from read_models import (
+    StudentRow, TestRow, TestListRow, UpcomingTestRow, UpcomingTestListRow, JournalRow, AttendanceRow,
+    select_rows, fetch,
+)
+import assets
 import os
 import secrets
 import string
 from passlib.context import CryptContext
 
 
-# ---------------- Helper to prevent caching ----------------
-def no_cache_response(template_response: HTMLResponse):
-    template_response.headers["Cache-Control"] = "no-store, no-cache, must-revalidate, max-age=0"
-    template_response.headers["Pragma"] = "no-cache"
-    template_response.headers["Expires"] = "0"
-    return template_response
-
-
 # ---------------- App Setup ----------------
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
 app = FastAPI(debug=True)
+app.add_middleware(CompressionMiddleware)
+app.add_middleware(query_audit.QueryAuditMiddleware)  # inside MetricsMiddleware, whose timings it shares
+app.add_middleware(MetricsMiddleware)
+app.add_middleware(ProfilerMiddleware)
+app.add_middleware(tracing.TracingMiddleware)
+instrument_engine(engine)
+query_audit.instrument_orm()
+data_versions.track_writes()
+tracing.instrument_engine(engine)
 app.mount(
     "/static",
-    StaticFiles(directory=os.path.join(BASE_DIR, "static")),
+    assets.ImmutableStaticFiles(directory=os.path.join(BASE_DIR, "static")),
     name="static",
 )
 templates = Jinja2Templates(directory="templates")
+template_cache.configure(templates)
+templates.env.filters["ranking_label"] = ranking_label
+assets.init_templates(templates)
 app.state.templates = templates
 
 # Pass templates to subrouter & include AI Feedback router
@@ -46,24 +78,19 @@ init_templates(templates)
 app.include_router(ai_feedback_router)
 init_questions_templates(templates)
 app.include_router(ai_questions_router)
-
-
-def get_session():
-    with Session(engine) as session:
-        yield session
-
-
-# Helper function to get logged-in user or raise 401
-def get_current_user(request: Request, session: Session = Depends(get_session)) -> User:
-    username = request.cookies.get("username")
-    if not username:
-        raise HTTPException(status_code=401, detail="Not authenticated")
-
-    user = session.exec(select(User).where(User.username == username)).first()
-    if not user:
-        raise HTTPException(status_code=401, detail="Invalid user")
-
-    return user
+app.include_router(rankings_router)
+app.include_router(metrics_router)
+init_profiler_templates(templates)
+app.include_router(profiler_router)
+init_diagnostics_templates(templates)
+app.include_router(diagnostics_router)
+app.include_router(api_router)
+search.init_templates(templates)
+app.include_router(search.router)
+roster.track_writes()
+app.include_router(roster.router)
+live.track_commits()
+app.include_router(live.router)
 
 
 # ---------------- Auth / Index ----------------
@@ -181,42 +208,27 @@ def logout():
 
 
 @app.get("/attendance-today-count")
-def attendance_today_count(session: Session = Depends(get_session), user: User = Depends(get_current_user)):
+def attendance_today_count(session: Session = Depends(get_session), tutor_ids: list[int] = Depends(get_tutor_ids)):
     today = date.today()
 
-    if user.user_type == "admin":
-        students_query = select(Student.id).where(Student.tutor_id.in_(
-            select(Tutor.id).where(Tutor.user_id == user.id)
-        ))
-    else:
-        students_query = select(Student.id).where(Student.tutor_id == user.tutor_id)
-
-    student_ids = session.exec(students_query).all()
-
     count = session.exec(
         select(func.count(Attendance.id))
+        .join(Student)
         .where(Attendance.attendance_date == today)
-        .where(Attendance.student_id.in_(student_ids))
+        .where(Student.tutor_id.in_(tutor_ids))
     ).first()
     return {"count": count or 0}
 
 
 @app.get("/upcoming-tests-count")
-def upcoming_tests_count(session: Session = Depends(get_session), user: User = Depends(get_current_user)):
+def upcoming_tests_count(session: Session = Depends(get_session), tutor_ids: list[int] = Depends(get_tutor_ids)):
     today = date.today()
-    if user.user_type == "admin":
-        students_query = select(Student.id).where(Student.tutor_id.in_(
-            select(Tutor.id).where(Tutor.user_id == user.id)
-        ))
-    else:
-        students_query = select(Student.id).where(Student.tutor_id == user.tutor_id)
-
-    student_ids = session.exec(students_query).all()
 
     count = session.exec(
         select(func.count(UpcomingTest.id))
+        .join(Student)
         .where(UpcomingTest.test_date >= today)
-        .where(UpcomingTest.student_id.in_(student_ids))
+        .where(Student.tutor_id.in_(tutor_ids))
     ).first()
     return {"count": count or 0}
 
@@ -237,10 +249,14 @@ def admin_dashboard(request: Request, session: Session = Depends(get_session), u
     if user.user_type != "admin":
         raise HTTPException(status_code=403, detail="Not authorized")
 
+    versions = version_key(session, user_scope(user))
+    etag = etag_for(user, versions)
+    if (cached := not_modified(request, etag)) is not None:
+        return cached
+
     tutors = session.exec(select(Tutor).where(Tutor.user_id == user.id)).all()
-    students = session.exec(
-        select(Student).where(Student.tutor_id.in_([t.id for t in tutors]))
-    ).all()
+    students = fetch(session, StudentRow,
+                     select_rows(StudentRow).where(Student.tutor_id.in_([t.id for t in tutors])))
     print(f"Admin Dashboard: Found {len(students)} students.")
 
     today = date.today()
@@ -259,23 +275,23 @@ def admin_dashboard(request: Request, session: Session = Depends(get_session), u
         .where(func.lower(Attendance.status) == "absent")
     ).first() or 0
 
-    record_tests = session.exec(
-        select(TestRecord, Student)
+    record_tests = fetch(session, TestListRow,
+        select_rows(TestListRow)
         .join(Student)
         .where(TestRecord.student_id.in_([s.id for s in students]))
         .order_by(TestRecord.test_date.desc())
         .limit(5)
-    ).all()
+    )
 
-    upcoming_tests = session.exec(
-        select(UpcomingTest, Student)
+    upcoming_tests = fetch(session, UpcomingTestListRow,
+        select_rows(UpcomingTestListRow)
         .join(Student)
         .where(UpcomingTest.student_id.in_([s.id for s in students]))
         .order_by(UpcomingTest.test_date.asc())
         .limit(5)
-    ).all()
+    )
 
-    return no_cache_response(
+    return with_etag(
         templates.TemplateResponse(
             "dashboard.html",
             {
@@ -284,12 +300,15 @@ def admin_dashboard(request: Request, session: Session = Depends(get_session), u
                 "user_type": user.user_type,
                 "tutors": tutors,
                 "students": students,
+                "fragment_version": versions,
                 "presents_today": presents_today,
                 "absents_today": absents_today,
+                "today": today.isoformat(),
                 "record_tests": record_tests,
                 "upcoming_tests": upcoming_tests,
             }
-        )
+        ),
+        etag,
     )
 
 
@@ -426,8 +445,13 @@ def tutor_dashboard(request: Request, session: Session = Depends(get_session), u
     if user.user_type != "tutor":
         raise HTTPException(status_code=403, detail="Not authorized")
 
+    versions = version_key(session, user_scope(user))
+    etag = etag_for(user, versions)
+    if (cached := not_modified(request, etag)) is not None:
+        return cached
+
     tutor = session.get(Tutor, user.tutor_id)
-    students = session.exec(select(Student).where(Student.tutor_id == tutor.id)).all()
+    students = fetch(session, StudentRow, select_rows(StudentRow).where(Student.tutor_id == tutor.id))
     print(f"Tutor Dashboard: Found {len(students)} students.")
 
     today = date.today()
@@ -446,23 +470,23 @@ def tutor_dashboard(request: Request, session: Session = Depends(get_session), u
         .where(func.lower(Attendance.status) == "absent")
     ).first() or 0
 
-    record_tests = session.exec(
-        select(TestRecord, Student)
+    record_tests = fetch(session, TestListRow,
+        select_rows(TestListRow)
         .join(Student)
         .where(TestRecord.student_id.in_([s.id for s in students]))
         .order_by(TestRecord.test_date.desc())
         .limit(5)
-    ).all()
+    )
 
-    upcoming_tests = session.exec(
-        select(UpcomingTest, Student)
+    upcoming_tests = fetch(session, UpcomingTestListRow,
+        select_rows(UpcomingTestListRow)
         .join(Student)
         .where(UpcomingTest.student_id.in_([s.id for s in students]))
         .order_by(UpcomingTest.test_date.asc())
         .limit(5)
-    ).all()
+    )
 
-    return no_cache_response(
+    return with_etag(
         templates.TemplateResponse(
             "tutor_dashboard.html",
             {
@@ -471,31 +495,24 @@ def tutor_dashboard(request: Request, session: Session = Depends(get_session), u
                 "user_type": user.user_type,
                 "tutor": tutor,
                 "students": students,
+                "fragment_version": versions,
                 "presents_today": presents_today,
                 "absents_today": absents_today,
                 "record_tests": record_tests,
                 "upcoming_tests": upcoming_tests,
             }
-        )
+        ),
+        etag,
     )
 
 
 # ---------------- Reports ----------------
 @app.get("/reports", response_class=HTMLResponse)
-def get_reports_page(request: Request, session: Session = Depends(get_session), user: User = Depends(get_current_user)):
-    tutor_ids = []
-    if user.user_type == "admin":
-        tutors = session.exec(select(Tutor).where(Tutor.user_id == user.id)).all()
-        tutor_ids = [t.id for t in tutors]
-    elif user.user_type == "tutor":
-        if user.tutor_id:
-            tutor_ids.append(user.tutor_id)
-
+def get_reports_page(request: Request, session: Session = Depends(get_session),
+                     user: User = Depends(get_current_user), tutor_ids: list[int] = Depends(get_tutor_ids)):
     students = []
     if tutor_ids:
-        students = session.exec(
-            select(Student).where(Student.tutor_id.in_(tutor_ids))
-        ).all()
+        students = fetch(session, StudentRow, select_rows(StudentRow).where(Student.tutor_id.in_(tutor_ids)))
 
     return templates.TemplateResponse(
         "reports.html",
@@ -568,7 +585,7 @@ def view_students(tutor_id: int, request: Request, session: Session = Depends(ge
     if not tutor or (user.user_type == "tutor" and tutor.id != user.tutor_id):
         raise HTTPException(status_code=403, detail="Not authorized to view these students")
 
-    students = session.exec(select(Student).where(Student.tutor_id == tutor_id)).all()
+    students = fetch(session, StudentRow, select_rows(StudentRow).where(Student.tutor_id == tutor_id))
     return templates.TemplateResponse(
         "students.html",
         {"request": request, "students": students, "tutor_id": tutor_id, "tutor_name": tutor.name}
@@ -621,16 +638,14 @@ def add_student(
 def transfer_student_form(
         student_id: int,
         request: Request,
+        access: StudentAccess = Depends(get_student_access),
         session: Session = Depends(get_session),
         user: User = Depends(get_current_user)
 ):
     if user.user_type != "admin":
         raise HTTPException(status_code=403, detail="Not authorized")
 
-    student = session.get(Student, student_id)
-    if not student:
-        raise HTTPException(status_code=404, detail="Student not found")
-
+    student = access.student
     tutors = session.exec(select(Tutor).where(Tutor.user_id == user.id)).all()
 
     return templates.TemplateResponse(
@@ -647,16 +662,15 @@ def transfer_student_form(
 def transfer_student(
         student_id: int,
         new_tutor_id: int = Form(...),
+        access: StudentAccess = Depends(get_student_access),
+        tutor_ids: list[int] = Depends(get_tutor_ids),
         session: Session = Depends(get_session),
         user: User = Depends(get_current_user)
 ):
-    if user.user_type != "admin":
+    if user.user_type != "admin" or new_tutor_id not in tutor_ids:
         raise HTTPException(status_code=403, detail="Not authorized")
 
-    student = session.get(Student, student_id)
-    if not student:
-        raise HTTPException(status_code=404, detail="Student not found")
-
+    student = access.student
     student.tutor_id = new_tutor_id
     session.add(student)
     session.commit()
@@ -669,47 +683,50 @@ def transfer_student(
 def get_student_report(
         student_id: int,
         request: Request,
+        access: StudentAccess = Depends(get_student_access),
         session: Session = Depends(get_session),
         user: User = Depends(get_current_user)
 ):
-    student = session.get(Student, student_id)
-    if not student:
-        raise HTTPException(status_code=404, detail="Student not found")
-
-    tutor = session.get(Tutor, student.tutor_id)
-    if not tutor or (user.user_type == "tutor" and tutor.id != user.tutor_id):
-        raise HTTPException(status_code=403, detail="Not authorized to view this student's report")
-
-    # Fetch all related data
-    attendance_records = session.exec(
-        select(Attendance)
+    student = access.student
+    etag = page_etag(session, user, student_scope(student_id), cohort_scope(access.admin_id, student.grade, student.syllabus))
+    if (cached := not_modified(request, etag)) is not None:
+        return cached
+
+    # Fetch related data; the page shows only the latest attendance and journal entries
+    attendance_records = fetch(session, AttendanceRow,
+        select_rows(AttendanceRow)
         .where(Attendance.student_id == student_id)
         .order_by(Attendance.attendance_date.desc())
-    ).all()
+        .limit(5)
+    )
 
-    journal_entries = session.exec(
-        select(Journal)
+    journal_entries = fetch(session, JournalRow,
+        select_rows(JournalRow)
         .where(Journal.student_id == student_id)
         .order_by(Journal.entry_date.desc())
-    ).all()
+        .limit(3)
+    )
 
-    test_records = session.exec(
-        select(TestRecord)
-        .where(TestRecord.student_id == student_id)
-        .order_by(TestRecord.test_date.desc())
-    ).all()
+    # The full test history is streamed into the page rather than loaded up front
+    test_records = stream_rows(TestRow,
+        select_rows(TestRow).where(TestRecord.student_id == student_id),
+        keys=(TestRecord.test_date, TestRecord.id), descending=True,
+    )
 
-    upcoming_tests = session.exec(
-        select(UpcomingTest)
+    upcoming_tests = fetch(session, UpcomingTestRow,
+        select_rows(UpcomingTestRow)
         .where(UpcomingTest.student_id == student_id)
         .where(UpcomingTest.test_date >= date.today())
         .order_by(UpcomingTest.test_date.asc())
-    ).all()
+    )
+
+    rankings = get_student_rankings(session, student_id)
 
     # Temporary placeholder for AI Feedback
     ai_feedback_data = "AI Feedback not yet implemented."
 
-    return templates.TemplateResponse(
+    return with_etag(stream_template(
+        templates,
         "student_report.html",
         {
             "request": request,
@@ -718,9 +735,10 @@ def get_student_report(
             "journal_entries": journal_entries,
             "test_records": test_records,
             "upcoming_tests": upcoming_tests,
+            "rankings": rankings,
             "ai_feedback": ai_feedback_data
         }
-    )
+    ), etag)
 
 # ---------------- Download Reports ----------------
 from fastapi.responses import StreamingResponse
@@ -736,21 +754,83 @@ from sqlmodel import Session, select
 from models import Student, Tutor, TestRecord  # Make sure these are imported
 
 
+def build_student_report_pdf(student: Student, test_records: list, rankings: list) -> BytesIO:
+    """Renders one student's details, rankings and test table into a PDF buffer."""
+    buffer = BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=letter)
+    styles = getSampleStyleSheet()
+    story = []
+
+    title_style = ParagraphStyle('Title', parent=styles['Normal'])
+    title_style.fontSize = 18
+    title_style.fontName = 'Helvetica-Bold'
+    title_style.alignment = TA_CENTER
+
+    # Add title and student details
+    story.append(Paragraph(f"{student.name}'s Academic Report", title_style))
+    story.append(Spacer(1, 0.2 * inch))
+    story.append(Paragraph(f"<b>Grade:</b> {student.grade}", styles['Normal']))
+    story.append(Paragraph(f"<b>School:</b> {student.school}", styles['Normal']))
+    story.append(Paragraph(f"<b>Syllabus:</b> {student.syllabus if student.syllabus else 'N/A'}", styles['Normal']))
+    story.append(Paragraph(f"<b>Remarks:</b> {student.remarks}", styles['Normal']))
+    for ranking in rankings:
+        story.append(Paragraph(f"<b>Ranking:</b> {ranking_label(ranking)}", styles['Normal']))
+    story.append(Spacer(1, 0.5 * inch))
+
+    # Add Test Records section
+    story.append(Paragraph("Test Records", styles['h2']))
+    story.append(Spacer(1, 0.2 * inch))
+
+    # Prepare data for the table with added safety checks
+    data = [['Date', 'Subject', 'Topic', 'Score']]
+    if test_records:
+        for test in test_records:
+            # Add checks for each field to prevent AttributeErrors
+            test_date = test.test_date.strftime('%Y-%m-%d') if test.test_date else 'N/A'
+            subject = test.subject if test.subject else 'N/A'
+            topic = test.topic if test.topic else 'N/A'
+
+            # Handle potential None values for marks
+            marks_attained = test.marks_attained if test.marks_attained is not None else 'N/A'
+            total_marks = test.total_marks if test.total_marks is not None else 'N/A'
+            score = f"{marks_attained}/{total_marks}"
+
+            data.append([test_date, subject, topic, score])
+    else:
+        data.append(['N/A', 'N/A', 'No test records found', 'N/A'])
+
+    # Create and style the table
+    table = Table(data, colWidths=[1.5 * inch, 1.5 * inch, 2.0 * inch, 1.0 * inch])
+    table.setStyle(TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#4A90E2')),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+        ('GRID', (0, 0), (-1, -1), 1, colors.black),
+        ('BOX', (0, 0), (-1, -1), 1, colors.black),
+        ('BACKGROUND', (0, 1), (-1, -1), colors.HexColor('#F5F7FA')),
+    ]))
+    story.append(table)
+
+    # Build the document
+    with span("pdf.build", report="student", rows=len(test_records)):
+        doc.build(story)
+
+    # Move the buffer's cursor to the beginning
+    buffer.seek(0)
+    return buffer
+
+
 @app.get("/reports/student/{student_id}/download")
 def download_student_report(
         student_id: int,
         request: Request,
         format: str = "pdf",
-        session: Session = Depends(get_session),
-        user: User = Depends(get_current_user)
+        access: StudentAccess = Depends(get_student_access),
+        session: Session = Depends(get_session)
 ):
-    student = session.get(Student, student_id)
-    if not student:
-        raise HTTPException(status_code=404, detail="Student not found")
-
-    tutor = session.get(Tutor, student.tutor_id)
-    if not tutor or (user.user_type == "tutor" and tutor.id != user.tutor_id):
-        raise HTTPException(status_code=403, detail="Not authorized to download this student's report")
+    student = access.student
 
     test_records = session.exec(
         select(TestRecord)
@@ -758,68 +838,10 @@ def download_student_report(
         .order_by(TestRecord.test_date.desc())
     ).all()
 
-    if format.lower() == "pdf":
-        buffer = BytesIO()
-        doc = SimpleDocTemplate(buffer, pagesize=letter)
-        styles = getSampleStyleSheet()
-        story = []
-
-        title_style = ParagraphStyle('Title', parent=styles['Normal'])
-        title_style.fontSize = 18
-        title_style.fontName = 'Helvetica-Bold'
-        title_style.alignment = TA_CENTER
-
-        # Add title and student details
-        story.append(Paragraph(f"{student.name}'s Academic Report", title_style))
-        story.append(Spacer(1, 0.2 * inch))
-        story.append(Paragraph(f"<b>Grade:</b> {student.grade}", styles['Normal']))
-        story.append(Paragraph(f"<b>School:</b> {student.school}", styles['Normal']))
-        story.append(Paragraph(f"<b>Syllabus:</b> {student.syllabus if student.syllabus else 'N/A'}", styles['Normal']))
-        story.append(Paragraph(f"<b>Remarks:</b> {student.remarks}", styles['Normal']))
-        story.append(Spacer(1, 0.5 * inch))
-
-        # Add Test Records section
-        story.append(Paragraph("Test Records", styles['h2']))
-        story.append(Spacer(1, 0.2 * inch))
-
-        # Prepare data for the table with added safety checks
-        data = [['Date', 'Subject', 'Topic', 'Score']]
-        if test_records:
-            for test in test_records:
-                # Add checks for each field to prevent AttributeErrors
-                test_date = test.test_date.strftime('%Y-%m-%d') if test.test_date else 'N/A'
-                subject = test.subject if test.subject else 'N/A'
-                topic = test.topic if test.topic else 'N/A'
-
-                # Handle potential None values for marks
-                marks_attained = test.marks_attained if test.marks_attained is not None else 'N/A'
-                total_marks = test.total_marks if test.total_marks is not None else 'N/A'
-                score = f"{marks_attained}/{total_marks}"
-
-                data.append([test_date, subject, topic, score])
-        else:
-            data.append(['N/A', 'N/A', 'No test records found', 'N/A'])
-
-        # Create and style the table
-        table = Table(data, colWidths=[1.5 * inch, 1.5 * inch, 2.0 * inch, 1.0 * inch])
-        table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#4A90E2')),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black),
-            ('BOX', (0, 0), (-1, -1), 1, colors.black),
-            ('BACKGROUND', (0, 1), (-1, -1), colors.HexColor('#F5F7FA')),
-        ]))
-        story.append(table)
-
-        # Build the document
-        doc.build(story)
-
-        # Move the buffer's cursor to the beginning
-        buffer.seek(0)
+    rankings = get_student_rankings(session, student_id)
 
+    if format.lower() == "pdf":
+        buffer = build_student_report_pdf(student, test_records, rankings)
         return StreamingResponse(
             buffer,
             media_type="application/pdf",
@@ -832,64 +854,81 @@ def download_student_report(
     raise HTTPException(status_code=400, detail="Invalid format specified. Must be 'pdf' or 'googlesheets'")
 
 
+def build_all_reports_pdf(students: list, tests_by_student: dict, rankings_by_student: dict) -> BytesIO:
+    """Renders one test table per student (skipping students without tests) into a PDF buffer."""
+    buffer = BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=letter)
+    styles = getSampleStyleSheet()
+    story = []
+
+    story.append(Paragraph("All Students' Test Reports", styles['Title']))
+    story.append(Spacer(1, 0.5 * inch))
+
+    for student in students:
+        test_records = tests_by_student.get(student.id)
+
+        if test_records:
+            story.append(Paragraph(f"Report for {student.name}", styles['h2']))
+            for ranking in rankings_by_student.get(student.id, []):
+                story.append(Paragraph(ranking_label(ranking), styles['Normal']))
+            story.append(Spacer(1, 0.2 * inch))
+
+            data = [['Date', 'Subject', 'Topic', 'Score']]
+            for test in test_records:
+                data.append([
+                    test.test_date.strftime('%Y-%m-%d'),
+                    test.subject,
+                    test.topic,
+                    f"{test.marks_attained}/{test.total_marks}"
+                ])
+
+            table = Table(data, colWidths=[1.5 * inch, 1.5 * inch, 2.0 * inch, 1.0 * inch])
+            table.setStyle(TableStyle([
+                ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#4A90E2')),
+                ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+                ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+                ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+                ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+                ('GRID', (0, 0), (-1, -1), 1, colors.black),
+                ('BOX', (0, 0), (-1, -1), 1, colors.black),
+                ('BACKGROUND', (0, 1), (-1, -1), colors.HexColor('#F5F7FA')),
+            ]))
+            story.append(table)
+            story.append(Spacer(1, 0.5 * inch))
+
+    with span("pdf.build", report="all", students=len(students)):
+        doc.build(story)
+    buffer.seek(0)
+    return buffer
+
+
 @app.get("/reports/all/download")
 def download_all_reports(
         request: Request,
         format: str = "pdf",
         session: Session = Depends(get_session),
-        user: User = Depends(get_current_user)
+        user: User = Depends(get_current_user),
+        tutor_ids: list[int] = Depends(get_tutor_ids)
 ):
     if user.user_type != "admin":
         raise HTTPException(status_code=403, detail="Not authorized")
 
     if format.lower() == "pdf":
-        buffer = BytesIO()
-        doc = SimpleDocTemplate(buffer, pagesize=letter)
-        styles = getSampleStyleSheet()
-        story = []
-
-        story.append(Paragraph("All Students' Test Reports", styles['Title']))
-        story.append(Spacer(1, 0.5 * inch))
-
-        students = session.exec(select(Student)).all()
-
-        for student in students:
-            test_records = session.exec(
-                select(TestRecord)
-                .where(TestRecord.student_id == student.id)
-                .order_by(TestRecord.test_date.desc())
-            ).all()
-
-            if test_records:
-                story.append(Paragraph(f"Report for {student.name}", styles['h2']))
-                story.append(Spacer(1, 0.2 * inch))
-
-                data = [['Date', 'Subject', 'Topic', 'Score']]
-                for test in test_records:
-                    data.append([
-                        test.test_date.strftime('%Y-%m-%d'),
-                        test.subject,
-                        test.topic,
-                        f"{test.marks_attained}/{test.total_marks}"
-                    ])
-
-                table = Table(data, colWidths=[1.5 * inch, 1.5 * inch, 2.0 * inch, 1.0 * inch])
-                table.setStyle(TableStyle([
-                    ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#4A90E2')),
-                    ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
-                    ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-                    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-                    ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-                    ('GRID', (0, 0), (-1, -1), 1, colors.black),
-                    ('BOX', (0, 0), (-1, -1), 1, colors.black),
-                    ('BACKGROUND', (0, 1), (-1, -1), colors.HexColor('#F5F7FA')),
-                ]))
-                story.append(table)
-                story.append(Spacer(1, 0.5 * inch))
-
-        doc.build(story)
-        buffer.seek(0)
-
+        students = session.exec(select(Student).where(Student.tutor_id.in_(tutor_ids))).all()
+        student_ids = [s.id for s in students]
+        rankings_by_student = get_rankings_by_student(session, student_ids)
+
+        # one query for these students' tests, only the columns the table shows, grouped in Python
+        tests_by_student = {student_id: [] for student_id in student_ids}
+        for test in session.exec(
+            select(TestRecord.student_id, TestRecord.test_date, TestRecord.subject, TestRecord.topic,
+                   TestRecord.marks_attained, TestRecord.total_marks)
+            .where(TestRecord.student_id.in_(student_ids))
+            .order_by(TestRecord.test_date.desc())
+        ).all():
+            tests_by_student[test.student_id].append(test)
+
+        buffer = build_all_reports_pdf(students, tests_by_student, rankings_by_student)
         return StreamingResponse(
             buffer,
             media_type="application/pdf",
@@ -904,16 +943,10 @@ def download_all_reports(
 def get_student_report(
         student_id: int,
         request: Request,
-        session: Session = Depends(get_session),
-        user: User = Depends(get_current_user)
+        access: StudentAccess = Depends(get_student_access),
+        session: Session = Depends(get_session)
 ):
-    student = session.get(Student, student_id)
-    if not student:
-        raise HTTPException(status_code=404, detail="Student not found")
-
-    tutor = session.get(Tutor, student.tutor_id)
-    if not tutor or (user.user_type == "tutor" and tutor.id != user.tutor_id):
-        raise HTTPException(status_code=403, detail="Not authorized to view this student's report")
+    student = access.student
 
     # Fetch all related data
     attendance_records = session.exec(
@@ -994,6 +1027,10 @@ def edit_tutor(tutor_id: int, name: str = Form(...), subject: str = Form(...), p
 
 
 # ---------- Delete Tutor ----------
+# every table holding a student's rows, cleared before the student is deleted
+STUDENT_RECORDS = (Attendance, Journal, TestRecord, UpcomingTest, Feedback, SubjectRanking, QuestionPaper)
+
+
 @app.post("/tutor/{tutor_id}/delete")
 def delete_tutor(tutor_id: int, request: Request, session: Session = Depends(get_session),
                  user: User = Depends(get_current_user)):
@@ -1009,25 +1046,26 @@ def delete_tutor(tutor_id: int, request: Request, session: Session = Depends(get
         session.delete(tutor_user)
 
     students = session.exec(select(Student).where(Student.tutor_id == tutor_id)).all()
+    student_ids = [student.id for student in students]
+    for model in STUDENT_RECORDS:
+        session.execute(delete(model).where(model.student_id.in_(student_ids)))
     for student in students:
         session.delete(student)
 
+    admin_id = tutor.user_id
     session.delete(tutor)
     session.commit()
+
+    # the students left their cohorts; re-rank the ones who remain
+    refresh_rankings(session, admin_id)
     return RedirectResponse("/admin-dashboard", status_code=303)
 
 
 # ---------- Edit Student ----------
 @app.get("/student/{student_id}/edit", response_class=HTMLResponse)
-def edit_student_form(student_id: int, request: Request, session: Session = Depends(get_session),
-                      user: User = Depends(get_current_user)):
-    student = session.get(Student, student_id)
-    if not student:
-        raise HTTPException(status_code=404, detail="Student not found")
-
-    tutor = session.get(Tutor, student.tutor_id)
-    if not tutor or (user.user_type == "tutor" and tutor.id != user.tutor_id):
-        raise HTTPException(status_code=403, detail="Not authorized")
+def edit_student_form(student_id: int, request: Request,
+                      access: StudentAccess = Depends(get_student_access)):
+    student = access.student
 
     return templates.TemplateResponse("edit_student.html", {"request": request, "student": student})
 
@@ -1041,15 +1079,11 @@ def edit_student(student_id: int,
                  focus_subjects: str = Form(""),
                  subject: str = Form(""),
                  remarks: str = Form(""),
-                 session: Session = Depends(get_session),
-                 user: User = Depends(get_current_user)):
-    student = session.get(Student, student_id)
-    if not student:
-        raise HTTPException(status_code=404, detail="Student not found")
+                 access: StudentAccess = Depends(get_student_access),
+                 session: Session = Depends(get_session)):
+    student = access.student
 
-    tutor = session.get(Tutor, student.tutor_id)
-    if not tutor or (user.user_type == "tutor" and tutor.id != user.tutor_id):
-        raise HTTPException(status_code=403, detail="Not authorized")
+    old_cohort = (student.grade, student.syllabus)
 
     student.name = name
     student.grade = grade
@@ -1062,6 +1096,10 @@ def edit_student(student_id: int,
     session.add(student)
     session.commit()
 
+    if old_cohort != (student.grade, student.syllabus):
+        refresh_rankings(session, access.admin_id, *old_cohort)
+        refresh_student_cohorts(session, access.admin_id, student)
+
     return RedirectResponse(url=f"/tutor/{student.tutor_id}/students", status_code=303)
 
 
@@ -1070,65 +1108,50 @@ def edit_student(student_id: int,
 def delete_student(
         student_id: int,
         request: Request,
-        session: Session = Depends(get_session),
-        user: User = Depends(get_current_user)
+        access: StudentAccess = Depends(get_student_access),
+        session: Session = Depends(get_session)
 ):
-    student = session.get(Student, student_id)
-    if not student:
-        raise HTTPException(status_code=404, detail="Student not found")
-
-    tutor = session.get(Tutor, student.tutor_id)
-    if not tutor or (user.user_type == "tutor" and tutor.id != user.tutor_id):
-        raise HTTPException(status_code=403, detail="Not authorized")
-
-    # delete related rows (attendance, journals, tests)
-    for rec in session.exec(select(Attendance).where(Attendance.student_id == student_id)).all():
-        session.delete(rec)
-
-    for j in session.exec(select(Journal).where(Journal.student_id == student_id)).all():
-        session.delete(j)
+    student, tutor = access.student, access.tutor
 
-    for t in session.exec(select(TestRecord).where(TestRecord.student_id == student_id)).all():
-        session.delete(t)
-
-    for ut in session.exec(select(UpcomingTest).where(UpcomingTest.student_id == student_id)).all():
-        session.delete(ut)
+    # delete related rows (attendance, journals, tests) without loading them
+    for model in STUDENT_RECORDS:
+        session.execute(delete(model).where(model.student_id == student_id))
 
+    cohort = (student.grade, student.syllabus)
     session.delete(student)
     session.commit()
 
+    refresh_rankings(session, access.admin_id, *cohort)
+
     return RedirectResponse(f"/tutor/{tutor.id}/students", status_code=303)
 
 
 # ---------------- Journal ----------------
 @app.get("/student/{student_id}/journal", response_class=HTMLResponse)
 def view_journal(student_id: int, request: Request, session: Session = Depends(get_session),
+                 access: StudentAccess = Depends(get_student_access),
                  user: User = Depends(get_current_user)):
-    student = session.get(Student, student_id)
-    if not student:
-        raise HTTPException(status_code=404, detail="Student not found")
+    etag = page_etag(session, user, student_scope(student_id))
+    if (cached := not_modified(request, etag)) is not None:
+        return cached
 
-    tutor = session.get(Tutor, student.tutor_id)
-    if not tutor or (user.user_type == "tutor" and tutor.id != user.tutor_id):
-        raise HTTPException(status_code=403, detail="Not authorized")
+    student = access.student
 
-    journals = session.exec(
-        select(Journal).where(Journal.student_id == student_id).order_by(Journal.entry_date.desc())
-    ).all()
+    journals = fetch(session, JournalRow,
+                     select_rows(JournalRow).where(Journal.student_id == student_id).order_by(Journal.entry_date.desc()))
 
-    return templates.TemplateResponse("journal.html", {
+    return with_etag(templates.TemplateResponse("journal.html", {
         "request": request,
         "student": student,
         "journals": journals
-    })
+    }), etag)
 
 
 @app.get("/student/{student_id}/journal/add", response_class=HTMLResponse)
 def add_journal_form(student_id: int, request: Request, session: Session = Depends(get_session),
+                     access: StudentAccess = Depends(get_student_access),
                      user: User = Depends(get_current_user)):
-    student = session.get(Student, student_id)
-    if not student:
-        raise HTTPException(status_code=404, detail="Student not found")
+    student = access.student
 
     # Admins can see all tutors they manage
     if user.user_type == "admin":
@@ -1143,7 +1166,7 @@ def add_journal_form(student_id: int, request: Request, session: Session = Depen
     )
 
 
-@app.post("/student/{student_id}/journal/add")
+@app.post("/student/{student_id}/journal/add", dependencies=[Depends(get_student_access)])
 def add_journal(student_id: int,
                 tutor_id: int = Form(...),
                 subject: str = Form(...),
@@ -1152,10 +1175,6 @@ def add_journal(student_id: int,
                 entry_date: str = Form(...),
                 session: Session = Depends(get_session),
                 user: User = Depends(get_current_user)):
-    student = session.get(Student, student_id)
-    if not student:
-        raise HTTPException(status_code=404, detail="Student not found")
-
     # Fetch the Tutor object using the provided tutor_id
     tutor = session.get(Tutor, tutor_id)
     if not tutor:
@@ -1191,10 +1210,7 @@ def edit_journal_form(journal_id: int, request: Request, session: Session = Depe
     if not journal:
         raise HTTPException(status_code=404, detail="Journal entry not found")
 
-    student = session.get(Student, journal.student_id)
-    tutor = session.get(Tutor, student.tutor_id)
-    if not student or not tutor or (user.user_type == "tutor" and tutor.id != user.tutor_id):
-        raise HTTPException(status_code=403, detail="Not authorized")
+    student = load_student_access(session, user, journal.student_id).student
 
     # Admins can see all tutors they manage
     if user.user_type == "admin":
@@ -1227,10 +1243,7 @@ def edit_journal(journal_id: int,
     if not journal_entry:
         raise HTTPException(status_code=404, detail="Journal entry not found")
 
-    student = session.get(Student, journal_entry.student_id)
-    tutor = session.get(Tutor, student.tutor_id)
-    if not student or not tutor or (user.user_type == "tutor" and tutor.id != user.tutor_id):
-        raise HTTPException(status_code=403, detail="Not authorized")
+    load_student_access(session, user, journal_entry.student_id)
 
     selected_tutor = session.get(Tutor, tutor_id)
     if not selected_tutor:
@@ -1255,10 +1268,7 @@ def delete_journal(journal_id: int, request: Request, session: Session = Depends
     if not journal:
         raise HTTPException(status_code=404, detail="Journal entry not found")
 
-    student = session.get(Student, journal.student_id)
-    tutor = session.get(Tutor, student.tutor_id)
-    if not student or not tutor or (user.user_type == "tutor" and tutor.id != user.tutor_id):
-        raise HTTPException(status_code=403, detail="Not authorized")
+    load_student_access(session, user, journal.student_id)
 
     session.delete(journal)
     session.commit()
@@ -1266,29 +1276,51 @@ def delete_journal(journal_id: int, request: Request, session: Session = Depends
 
 
 # ---------------- Attendance ----------------
+def month_attendance_rows(all_records: list, month: int, year: int) -> list[dict]:
+    """Display rows for one month of a student's attendance, newest first."""
+    today_date = date.today()
+    records = []
+    for rec in all_records:
+        if rec.attendance_date and rec.attendance_date.month == month and rec.attendance_date.year == year:
+            rec_date = rec.attendance_date
+            records.append({
+                "display_date": rec_date.strftime("%d-%m-%Y"),
+                "status": rec.status,
+                "is_weekend": rec_date.weekday() in (5, 6),
+                "is_today": rec_date == today_date
+            })
+
+    records.sort(key=lambda r: datetime.strptime(r["display_date"], "%d-%m-%Y"), reverse=True)
+    return records
+
+
+def attendance_by_day(records: list) -> dict:
+    """Maps "YYYY-MM-DD" -> status for one student's row of the attendance grid."""
+    return {rec.attendance_date.strftime("%Y-%m-%d"): rec.status.lower() for rec in records}
+
+
 @app.get("/student/{student_id}/attendance-view", response_class=HTMLResponse)
 def view_attendance(
         request: Request,
         student_id: int,
         month: int = Query(None),
         year: int = Query(None),
+        access: StudentAccess = Depends(get_student_access),
         session: Session = Depends(get_session),
         user: User = Depends(get_current_user)
 ):
-    student = session.get(Student, student_id)
-    if not student:
-        raise HTTPException(status_code=404, detail="Student not found")
+    etag = page_etag(session, user, student_scope(student_id))
+    if (cached := not_modified(request, etag)) is not None:
+        return cached
 
-    tutor = session.get(Tutor, student.tutor_id)
-    if not tutor or (user.user_type == "tutor" and tutor.id != user.tutor_id):
-        raise HTTPException(status_code=403, detail="Not authorized")
+    student = access.student
 
     all_records = session.exec(
         select(Attendance).where(Attendance.student_id == student_id)
     ).all()
 
     if not all_records:
-        return templates.TemplateResponse("attendance_view.html", {
+        return with_etag(templates.TemplateResponse("attendance_view.html", {
             "request": request,
             "student": student,
             "records": [],
@@ -1296,7 +1328,7 @@ def view_attendance(
             "years_list": [],
             "current_month": None,
             "current_year": None
-        })
+        }), etag)
 
     unique_months_years = sorted(
         {(rec.attendance_date.month, rec.attendance_date.year) for rec in all_records if rec.attendance_date},
@@ -1307,24 +1339,12 @@ def view_attendance(
     if not month or not year:
         month, year = unique_months_years[0]
 
-    today_date = date.today()
-    records = []
-    for rec in all_records:
-        if rec.attendance_date and rec.attendance_date.month == month and rec.attendance_date.year == year:
-            rec_date = rec.attendance_date
-            records.append({
-                "display_date": rec_date.strftime("%d-%m-%Y"),
-                "status": rec.status,
-                "is_weekend": rec_date.weekday() in (5, 6),
-                "is_today": rec_date == today_date
-            })
-
-    records.sort(key=lambda r: datetime.strptime(r["display_date"], "%d-%m-%Y"), reverse=True)
+    records = month_attendance_rows(all_records, month, year)
 
     months_list = [{"value": m, "name": date(2000, m, 1).strftime("%B")} for m in range(1, 13)]
     years_list = sorted({y for _, y in unique_months_years}, reverse=True)
 
-    return templates.TemplateResponse("attendance_view.html", {
+    return with_etag(templates.TemplateResponse("attendance_view.html", {
         "request": request,
         "student": student,
         "records": records,
@@ -1332,14 +1352,14 @@ def view_attendance(
         "years_list": years_list,
         "current_month": month,
         "current_year": year
-    })
+    }), etag)
 
 
 @app.get("/attendance", response_class=HTMLResponse)
 def mark_attendance(
         request: Request,
         session: Session = Depends(get_session),
-        user: User = Depends(get_current_user)
+        tutor_ids: list[int] = Depends(get_tutor_ids)
 ):
     today = date.today()
 
@@ -1356,27 +1376,12 @@ def mark_attendance(
     except ValueError:
         year = today.year
 
-    if user.user_type == "admin":
-        tutors = session.exec(select(Tutor).where(Tutor.user_id == user.id)).all()
-        tutor_ids = [t.id for t in tutors]
-    else:
-        tutors = session.exec(select(Tutor).where(Tutor.id == user.tutor_id)).all()
-        tutor_ids = [user.tutor_id]
-
-    students = session.exec(select(Student).where(Student.tutor_id.in_(tutor_ids))).all()
-
-    all_records = session.exec(
-        select(Attendance).where(Attendance.student_id.in_([s.id for s in students]))
-    ).all()
-
-    if all_records:
-        earliest_year = min(
-            rec.attendance_date.year
-            for rec in all_records
-            if rec.attendance_date
-        )
-    else:
-        earliest_year = today.year
+    earliest_date = session.exec(
+        select(func.min(Attendance.attendance_date))
+        .join(Student)
+        .where(Student.tutor_id.in_(tutor_ids))
+    ).first()
+    earliest_year = earliest_date.year if earliest_date else today.year
 
     years_list = list(range(today.year, earliest_year - 1, -1))
     months_list = [
@@ -1387,23 +1392,29 @@ def mark_attendance(
     import calendar
     num_days = calendar.monthrange(year, month)[1]
 
-    filtered_records = session.exec(
-        select(Attendance)
-        .where(Attendance.student_id.in_([s.id for s in students]))
+    # One grid row per student, streamed: students and their month of attendance
+    # are read in student id order and merged as the rows are rendered
+    students = stream_rows(StudentRow,
+        select_rows(StudentRow).where(Student.tutor_id.in_(tutor_ids)),
+        keys=(Student.id,),
+    )
+    month_records = stream_rows(AttendanceRow,
+        select_rows(AttendanceRow)
+        .join(Student)
+        .where(Student.tutor_id.in_(tutor_ids))
         .where(Attendance.attendance_date >= date(year, month, 1))
-        .where(Attendance.attendance_date <= date(year, month, num_days))
-    ).all()
-
-    attendance_map = {}
-    for rec in filtered_records:
-        if rec.student_id not in attendance_map:
-            attendance_map[rec.student_id] = {}
-        attendance_map[rec.student_id][rec.attendance_date.strftime("%Y-%m-%d")] = rec.status.lower()
+        .where(Attendance.attendance_date <= date(year, month, num_days)),
+        keys=(Attendance.student_id, Attendance.id),
+    )
+    grid_rows = group_rows(
+        students, month_records,
+        parent_key=lambda s: s.id, child_key=lambda r: r.student_id,
+        reduce=attendance_by_day,
+    )
 
-    return templates.TemplateResponse("mark_attendance.html", {
+    return stream_template(templates, "mark_attendance.html", {
         "request": request,
-        "students": students,
-        "attendance_map": attendance_map,
+        "grid_rows": grid_rows,
         "months_list": months_list,
         "years_list": years_list,
         "current_month": month,
@@ -1422,13 +1433,7 @@ def update_attendance(data: dict = Body(...), session: Session = Depends(get_ses
     date_str = data.get("date")
     status = data.get("status")
 
-    student = session.get(Student, student_id)
-    if not student:
-        raise HTTPException(status_code=404, detail="Student not found")
-
-    tutor = session.get(Tutor, student.tutor_id)
-    if not tutor or (user.user_type == "tutor" and tutor.id != user.tutor_id):
-        raise HTTPException(status_code=403, detail="Not authorized")
+    access = load_student_access(session, user, student_id)
 
     try:
         attendance_date = datetime.strptime(date_str, "%Y-%m-%d").date()
@@ -1439,6 +1444,16 @@ def update_attendance(data: dict = Body(...), session: Session = Depends(get_ses
             .where(Attendance.attendance_date == attendance_date)
         ).first()
 
+        live.publish(session, access.admin_id, {
+            "type": "attendance",
+            "student_id": student_id,
+            "student_name": access.student.name,
+            "grade": access.student.grade,
+            "tutor_id": access.tutor.id,
+            "date": attendance_date.isoformat(),
+            "status": status.lower(),
+            "previous": existing.status.lower() if existing else None,
+        })
         if existing:
             existing.status = status
             session.add(existing)
@@ -1459,32 +1474,23 @@ def update_attendance(data: dict = Body(...), session: Session = Depends(get_ses
 
 @app.get("/attendance-today", response_class=HTMLResponse)
 def attendance_today_filtered(request: Request, session: Session = Depends(get_session),
-                              user: User = Depends(get_current_user)):
+                              tutor_ids: list[int] = Depends(get_tutor_ids)):
     today = date.today()
 
-    if user.user_type == "admin":
-        students = session.exec(
-            select(Student)
-            .where(Student.tutor_id.in_(
-                select(Tutor.id).where(Tutor.user_id == user.id)
-            ))
-        ).all()
-    else:
-        students = session.exec(
-            select(Student)
-            .where(Student.tutor_id == user.tutor_id)
-        ).all()
-
-    student_ids = [s.id for s in students]
-
+    # the template shows rec.student, so load it in the same query
     records = session.exec(
-        select(Attendance).where(Attendance.attendance_date == today).where(Attendance.student_id.in_(student_ids))
+        select(Attendance)
+        .join(Student)
+        .where(Attendance.attendance_date == today)
+        .where(Student.tutor_id.in_(tutor_ids))
+        .options(contains_eager(Attendance.student))
     ).all()
 
     return templates.TemplateResponse("attendance_today_filtered.html", {
         "request": request,
         "records": records,
-        "today": today.strftime("%d-%m-%Y")
+        "today": today.strftime("%d-%m-%Y"),
+        "today_iso": today.isoformat(),
     })
 
 
@@ -1499,16 +1505,10 @@ def add_test(
         total_marks: int = Form(...),
         marks_attained: int = Form(...),
         remarks: str = Form(...),
-        session: Session = Depends(get_session),
-        user: User = Depends(get_current_user)
+        access: StudentAccess = Depends(get_student_access),
+        session: Session = Depends(get_session)
 ):
-    student = session.get(Student, student_id)
-    if not student:
-        raise HTTPException(status_code=404, detail="Student not found")
-
-    tutor = session.get(Tutor, student.tutor_id)
-    if not tutor or (user.user_type == "tutor" and tutor.id != user.tutor_id):
-        raise HTTPException(status_code=403, detail="Not authorized to add tests for this student")
+    student = access.student
 
     parsed_date = datetime.strptime(test_date, "%Y-%m-%d").date()
 
@@ -1524,6 +1524,9 @@ def add_test(
     session.add(new_test)
     session.commit()
 
+    # Only the cohort this test belongs to needs re-ranking
+    refresh_rankings(session, access.admin_id, student.grade, student.syllabus, subject)
+
     return RedirectResponse(url=f"/student/{student_id}/tests", status_code=303)
 
 
@@ -1532,59 +1535,53 @@ def add_test(
 def view_tests(
         request: Request,
         student_id: int,
+        access: StudentAccess = Depends(get_student_access),
         session: Session = Depends(get_session),
         user: User = Depends(get_current_user)
 ):
-    student = session.get(Student, student_id)
-    if not student:
-        raise HTTPException(status_code=404, detail="Student not found")
+    student = access.student
+    etag = page_etag(session, user, student_scope(student_id), cohort_scope(access.admin_id, student.grade, student.syllabus))
+    if (cached := not_modified(request, etag)) is not None:
+        return cached
 
-    tutor = session.get(Tutor, student.tutor_id)
-    if not tutor or (user.user_type == "tutor" and tutor.id != user.tutor_id):
-        raise HTTPException(status_code=403, detail="Not authorized to view this student's tests")
-
-    tests = session.exec(
-        select(TestRecord)
+    tests = fetch(session, TestRow,
+        select_rows(TestRow)
         .where(TestRecord.student_id == student_id)
         .order_by(TestRecord.test_date.desc())
-    ).all()
+    )
 
-    return templates.TemplateResponse("view_tests.html", {
+    return with_etag(templates.TemplateResponse("view_tests.html", {
         "request": request,
         "student": student,
-        "tests": tests
-    })
+        "tests": tests,
+        "rankings": get_student_rankings(session, student_id)
+    }), etag)
 
 # ---------- View All Tests Route ----------
 @app.get("/all_tests", response_class=HTMLResponse)
 def view_all_tests(
     request: Request,
     session: Session = Depends(get_session),
-    user: User = Depends(get_current_user)
+    user: User = Depends(get_current_user),
+    tutor_ids: list[int] = Depends(get_tutor_ids)
 ):
-    if user.user_type == "admin":
-        tutor_ids = session.exec(select(Tutor.id).where(Tutor.user_id == user.id)).all()
-        student_ids = session.exec(select(Student.id).where(Student.tutor_id.in_(tutor_ids))).all()
-    elif user.user_type == "tutor":
-        student_ids = session.exec(select(Student.id).where(Student.tutor_id == user.tutor_id)).all()
-    else:
+    if user.user_type not in ("admin", "tutor"):
         raise HTTPException(status_code=403, detail="Not authorized")
 
-    tests_with_students = session.exec(
-        select(TestRecord, Student)
+    etag = page_etag(session, user, user_scope(user))
+    if (cached := not_modified(request, etag)) is not None:
+        return cached
+
+    all_tests = stream_rows(TestListRow,
+        select_rows(TestListRow)
         .join(Student)
-        .where(TestRecord.student_id.in_(student_ids))
-        .order_by(TestRecord.test_date.desc())
-    ).all()
+        .where(Student.tutor_id.in_(tutor_ids)),
+        keys=(TestRecord.test_date, TestRecord.id), descending=True,
+    )
 
-    return no_cache_response(
-        templates.TemplateResponse(
-            "all_tests.html",
-            {
-                "request": request,
-                "tests_with_students": tests_with_students
-            }
-        )
+    return with_etag(
+        stream_template(templates, "all_tests.html", {"request": request, "all_tests": all_tests}),
+        etag,
     )
 
 
@@ -1593,25 +1590,14 @@ def view_all_tests(
 def list_upcoming_tests(
         request: Request,
         session: Session = Depends(get_session),
-        user: User = Depends(get_current_user)
+        tutor_ids: list[int] = Depends(get_tutor_ids)
 ):
-    if user.user_type == "admin":
-        tutors = session.exec(select(Tutor).where(Tutor.user_id == user.id)).all()
-        tutor_ids = [t.id for t in tutors]
-    else:
-        tutor_ids = [user.tutor_id]
-
-    students = session.exec(
-        select(Student).where(Student.tutor_id.in_(tutor_ids))
-    ).all()
-    student_ids = [s.id for s in students]
-
-    upcoming_tests = session.exec(
-        select(UpcomingTest, Student)
+    upcoming_tests = fetch(session, UpcomingTestListRow,
+        select_rows(UpcomingTestListRow)
         .join(Student)
-        .where(UpcomingTest.student_id.in_(student_ids))
+        .where(Student.tutor_id.in_(tutor_ids))
         .order_by(UpcomingTest.test_date.asc())
-    ).all()
+    )
 
     return templates.TemplateResponse(
         "upcoming_tests.html",
@@ -1654,13 +1640,7 @@ def add_upcoming_test(
         session: Session = Depends(get_session),
         user: User = Depends(get_current_user)
 ):
-    student = session.get(Student, student_id)
-    if not student:
-        raise HTTPException(status_code=404, detail="Student not found")
-
-    tutor = session.get(Tutor, student.tutor_id)
-    if not tutor or (user.user_type == "tutor" and tutor.id != user.tutor_id):
-        raise HTTPException(status_code=403, detail="Not authorized")
+    load_student_access(session, user, student_id)
 
     parsed_date = datetime.strptime(test_date, "%Y-%m-%d").date()
 
@@ -1679,26 +1659,16 @@ def add_upcoming_test(
 # ---------------- Student Insights ----------------
 @app.get("/student/{student_id}/insights", response_class=HTMLResponse)
 def student_insights(student_id: int, request: Request, session: Session = Depends(get_session),
-                     user: User = Depends(get_current_user)):
+                     access: StudentAccess = Depends(get_student_access)):
     print(f"Attempting to fetch insights for student_id: {student_id}")
-    student = session.get(Student, student_id)
-    if not student:
-        print(f"Error: Student with ID {student_id} not found.")
-        raise HTTPException(status_code=404, detail="Student not found")
-
-    tutor = session.get(Tutor, student.tutor_id)
-    if not tutor or (user.user_type == "tutor" and tutor.id != user.tutor_id and not user.user_type == "admin"):
-        print(f"Error: User {user.username} is not authorized to view insights for student ID {student_id}")
-        raise HTTPException(status_code=403, detail="Not authorized")
+    student = access.student
 
     # Fetch all relevant data for the insights page
-    journals = session.exec(
-        select(Journal).where(Journal.student_id == student_id).order_by(Journal.entry_date.desc())
-    ).all()
+    journals = fetch(session, JournalRow,
+                     select_rows(JournalRow).where(Journal.student_id == student_id).order_by(Journal.entry_date.desc()))
 
-    tests = session.exec(
-        select(TestRecord).where(TestRecord.student_id == student_id).order_by(TestRecord.test_date.desc())
-    ).all()
+    tests = fetch(session, TestRow,
+                  select_rows(TestRow).where(TestRecord.student_id == student_id).order_by(TestRecord.test_date.desc()))
 
     # Calculate attendance counts for the summary
     total_days = session.exec(
@@ -1734,4 +1704,10 @@ def student_insights(student_id: int, request: Request, session: Session = Depen
 # ---------------- Startup ----------------
 @app.on_event("startup")
 def on_startup():
+    assets.build()
     SQLModel.metadata.create_all(engine)
+    search.ensure_index(engine)
+    live.start_listener(engine)
+    with Session(engine) as session:
+        if rankings_empty(session):
+            refresh_rankings(session)
@@ -0,0 +1,274 @@
+from __future__ import annotations
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from fastapi import APIRouter, Request, HTTPException
+from fastapi.responses import PlainTextResponse
+from sqlalchemy import event
+
+router = APIRouter(tags=["Metrics"])
+
+# Optional bearer token for the scrape endpoint; unset means open (bind /metrics privately instead)
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+
+# Prometheus' default latency buckets, in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+# ---------------- Storage ----------------
+class _Shard:
+    """
+    Per-thread slice of every metric. Each thread only ever writes to its own
+    shard, so recording never takes a lock; the scrape sums all shards.
+    """
+
+    def __init__(self):
+        self.counters = defaultdict(int)
+        self.gauges = defaultdict(int)
+        self.histograms = defaultdict(lambda: [0] * (len(BUCKETS) + 1))
+        self.sums = defaultdict(float)
+
+
+_local = threading.local()
+_shards: list[_Shard] = []
+_shards_lock = threading.Lock()  # only taken the first time a thread records
+
+
+def _shard() -> _Shard:
+    shard = getattr(_local, "shard", None)
+    if shard is None:
+        shard = _Shard()
+        with _shards_lock:
+            _shards.append(shard)
+        _local.shard = shard
+    return shard
+
+
+def inc(name: str, labels: tuple = (), value: int = 1) -> None:
+    _shard().counters[(name, labels)] += value
+
+
+def gauge_add(name: str, labels: tuple = (), value: int = 1) -> None:
+    _shard().gauges[(name, labels)] += value
+
+
+def observe(name: str, labels: tuple, seconds: float) -> None:
+    shard = _shard()
+    key = (name, labels)
+    buckets = shard.histograms[key]
+    for i, bound in enumerate(BUCKETS):
+        if seconds <= bound:
+            buckets[i] += 1
+            break
+    else:
+        buckets[-1] += 1
+    shard.sums[key] += seconds
+
+
+# ---------------- Per-request timings ----------------
+class RequestTimings:
+    """
+    Accumulates time spent in the DB and in Gemini for the current request. The
+    query audit middleware, when installed, hangs its statement audit here too.
+    """
+    __slots__ = ("db_seconds", "gemini_seconds", "audit")
+
+    def __init__(self):
+        self.db_seconds = 0.0
+        self.gemini_seconds = 0.0
+        self.audit = None
+
+
+_current: ContextVar[RequestTimings | None] = ContextVar("request_timings", default=None)
+
+
+def current_timings() -> RequestTimings | None:
+    return _current.get()
+
+
+def instrument_engine(engine) -> None:
+    """Hooks SQLAlchemy cursor events so statement time (and the statement itself) is charged to the active request."""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_start"].pop()
+        observe("db_query_duration_seconds", (), elapsed)
+        timings = _current.get()
+        if timings is not None:
+            timings.db_seconds += elapsed
+            if timings.audit is not None:
+                timings.audit.record(statement, parameters, cursor, context, executemany)
+
+
+@contextmanager
+def track_gemini(caller: str):
+    """Times an outbound Gemini call; yields a dict the caller can flag with ok=False."""
+    outcome = {"ok": True}
+    start = time.perf_counter()
+    try:
+        yield outcome
+    except Exception:
+        outcome["ok"] = False
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        status = "ok" if outcome["ok"] else "error"
+        observe("gemini_request_duration_seconds", (("caller", caller),), elapsed)
+        inc("gemini_requests_total", (("caller", caller), ("outcome", status)))
+        timings = _current.get()
+        if timings is not None:
+            timings.gemini_seconds += elapsed
+
+
+# ---------------- Middleware ----------------
+def _route_label(scope) -> str:
+    route = scope.get("route")
+    if route is not None:
+        return route.path
+    # Mounted apps (e.g. /static) only leave their mount point behind
+    return scope.get("root_path") or "other"
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware recording latency, in-flight requests and status codes per route."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        status = {"code": 500}
+        timings = RequestTimings()
+        token = _current.set(timings)
+        gauge_add("http_requests_in_flight", (("method", method),), 1)
+        start = time.perf_counter()
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            labels = (("method", method), ("route", _route_label(scope)))
+            observe("http_request_duration_seconds", labels, elapsed)
+            observe("http_request_db_seconds", labels, timings.db_seconds)
+            if timings.gemini_seconds:
+                observe("http_request_gemini_seconds", labels, timings.gemini_seconds)
+            inc("http_responses_total", labels + (("status", str(status["code"])),))
+            gauge_add("http_requests_in_flight", (("method", method),), -1)
+            _current.reset(token)
+
+
+# ---------------- Exposition ----------------
+_HELP = {
+    "http_request_duration_seconds": ("histogram", "Request latency by route."),
+    "http_request_db_seconds": ("histogram", "Time spent executing SQL per request."),
+    "http_request_gemini_seconds": ("histogram", "Time spent waiting on Gemini per request."),
+    "http_responses_total": ("counter", "Responses by route and status code."),
+    "http_requests_in_flight": ("gauge", "Requests currently being served."),
+    "db_query_duration_seconds": ("histogram", "Latency of individual SQL statements."),
+    "gemini_request_duration_seconds": ("histogram", "Latency of outbound Gemini calls."),
+    "gemini_requests_total": ("counter", "Outbound Gemini calls by outcome."),
+    "gemini_retries_total": ("counter", "Gemini attempts retried after a 429, 5xx or network failure."),
+    "gemini_hedged_requests_total": ("counter", "Second requests sent because the first was slow."),
+    "gemini_circuit_rejections_total": ("counter", "Gemini calls refused because the circuit breaker was open."),
+    "cache_requests_total": ("counter", "Cache lookups by cache and outcome (hit/miss)."),
+}
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: tuple, extra: tuple = ()) -> str:
+    pairs = labels + extra
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def snapshot() -> tuple[dict, dict, dict, dict]:
+    """Merges every thread's shard into (counters, gauges, histograms, sums) keyed by (name, labels)."""
+    counters = defaultdict(int)
+    gauges = defaultdict(int)
+    histograms = defaultdict(lambda: [0] * (len(BUCKETS) + 1))
+    sums = defaultdict(float)
+    with _shards_lock:
+        shards = list(_shards)
+    for shard in shards:
+        for key, value in list(shard.counters.items()):
+            counters[key] += value
+        for key, value in list(shard.gauges.items()):
+            gauges[key] += value
+        for key, buckets in list(shard.histograms.items()):
+            merged = histograms[key]
+            for i, n in enumerate(list(buckets)):
+                merged[i] += n
+            sums[key] += shard.sums.get(key, 0.0)
+    return counters, gauges, histograms, sums
+
+
+def histogram_quantile(q: float, buckets: list[int]) -> float | None:
+    """Estimates a quantile from bucket counts by linear interpolation, like PromQL's histogram_quantile."""
+    total = sum(buckets)
+    if not total:
+        return None
+    rank = q * total
+    cumulative = 0
+    lower = 0.0
+    for bound, n in zip(BUCKETS, buckets):
+        if cumulative + n >= rank and n:
+            return lower + (bound - lower) * (rank - cumulative) / n
+        cumulative += n
+        lower = bound
+    # Falls in the +Inf bucket; the largest finite bound is the best we can say
+    return BUCKETS[-1]
+
+
+def render_metrics() -> str:
+    counters, gauges, histograms, sums = snapshot()
+
+    by_name = defaultdict(list)
+    for (name, labels), value in list(counters.items()) + list(gauges.items()):
+        by_name[name].append((labels, value))
+    for (name, labels), buckets in histograms.items():
+        by_name[name].append((labels, buckets))
+
+    lines = []
+    for name in sorted(by_name):
+        kind, help_text = _HELP.get(name, ("untyped", name))
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for labels, value in sorted(by_name[name], key=lambda item: item[0]):
+            if kind != "histogram":
+                lines.append(f"{name}{_format_labels(labels)} {value}")
+                continue
+            cumulative = 0
+            for bound, n in zip(BUCKETS + ("+Inf",), value):
+                cumulative += n
+                lines.append(f"{name}_bucket{_format_labels(labels, (('le', bound),))} {cumulative}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {sums[(name, labels)]:.6f}")
+            lines.append(f"{name}_count{_format_labels(labels)} {cumulative}")
+    return "\n".join(lines) + "\n"
+
+
+# ---------------- Endpoints ----------------
+@router.get("/metrics", response_class=PlainTextResponse)
+def metrics(request: Request):
+    if METRICS_TOKEN and request.headers.get("authorization") != f"Bearer {METRICS_TOKEN}":
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
@@ -115,4 +115,36 @@ class Feedback(SQLModel, table=True):
     feedback_text: str
     ai_generated: bool = Field(default=True)
 
-    student: "Student" = Relationship(back_populates="feedbacks")
\ No newline at end of file
+    student: "Student" = Relationship(back_populates="feedbacks")
+
+# -------------------- QUESTION PAPER --------------------
+class QuestionPaper(SQLModel, table=True):
+    """Generated test questions, saved as they finish streaming (see ai_questions.py)."""
+    id: Optional[int] = Field(default=None, primary_key=True)
+    student_id: int = Field(foreign_key="student.id", index=True)
+    question_type: str
+    subject: str
+    topics: Optional[str] = None
+    status: str = Field(default="generating")  # "generating", "complete" or "failed"
+    text: str = ""
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+# -------------------- SUBJECT RANKING --------------------
+class SubjectRanking(SQLModel, table=True):
+    id: Optional[int] = Field(default=None, primary_key=True)
+    student_id: int = Field(foreign_key="student.id", index=True)
+    grade: str
+    syllabus: Optional[str] = None
+    subject: str
+    average_percentage: float
+    percentile: float
+    top_percent: float
+    cohort_rank: int
+    cohort_size: int
+    refreshed_at: datetime = Field(default_factory=datetime.utcnow)
+
+# -------------------- DATA VERSION --------------------
+class DataVersion(SQLModel, table=True):
+    """Write counter per scope, bumped in the same transaction as the write (see data_versions.py)."""
+    table_name: str = Field(primary_key=True)
+    version: int = 0
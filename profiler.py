@@ -0,0 +1,268 @@
+from __future__ import annotations
+import hashlib
+import hmac
+import json
+import os
+import re
+import sys
+import threading
+import time
+from datetime import datetime
+from urllib.parse import parse_qs
+from fastapi import APIRouter, Depends, Request, HTTPException
+from fastapi.responses import HTMLResponse, FileResponse
+from fastapi.templating import Jinja2Templates
+from sqlmodel import Session, select
+from starlette.concurrency import run_in_threadpool
+from models import User
+from db import engine
+from dependencies import get_current_user
+
+router = APIRouter(prefix="/profiles", tags=["Profiling"])
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+PROFILE_DIR = os.getenv("PROFILE_DIR", os.path.join(BASE_DIR, "profiles"))
+# Only the newest PROFILE_RETENTION files are kept
+PROFILE_RETENTION = int(os.getenv("PROFILE_RETENTION", "50"))
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL_MS", "2")) / 1000
+# Shared secret for the X-Profile-Signature header; unset disables header triggering
+PROFILE_SECRET = os.getenv("PROFILE_SECRET")
+# Longest a signature may stay valid: X-Profile-Expires further ahead than this is refused
+PROFILE_SIGNATURE_TTL = int(os.getenv("PROFILE_SIGNATURE_TTL", "300"))
+
+_templates: Jinja2Templates | None = None
+
+
+def init_templates(templates: Jinja2Templates) -> None:
+    global _templates
+    _templates = templates
+
+
+# ---------------- Sampling ----------------
+class StackSampler:
+    """
+    Statistical profiler: a daemon thread snapshots every thread's stack at a fixed
+    interval and keeps the ones running inside the profiled endpoint.
+    """
+
+    def __init__(self, scope, interval: float = PROFILE_INTERVAL):
+        self.scope = scope
+        self.interval = interval
+        self.target_code = None
+        self.frames: dict[tuple, int] = {}
+        self.frame_list: list[dict] = []
+        self.samples: list[list[int]] = []
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+        self.started = 0.0
+        self.elapsed = 0.0
+
+    def start(self) -> None:
+        self.started = time.perf_counter()
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+        self.elapsed = time.perf_counter() - self.started
+
+    def _frame_index(self, frame) -> int:
+        code = frame.f_code
+        key = (code.co_filename, code.co_name, code.co_firstlineno)
+        index = self.frames.get(key)
+        if index is None:
+            index = len(self.frame_list)
+            self.frames[key] = index
+            self.frame_list.append({"name": code.co_name, "file": code.co_filename, "line": code.co_firstlineno})
+        return index
+
+    def _run(self) -> None:
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            if self.target_code is None:
+                # The router stores the endpoint in the scope once the request is matched
+                endpoint = self.scope.get("endpoint")
+                if endpoint is None:
+                    continue
+                self.target_code = getattr(endpoint, "__code__", None)
+            target = self.target_code
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                inside = False
+                while frame is not None:
+                    stack.append(frame)
+                    inside = inside or frame.f_code is target
+                    frame = frame.f_back
+                if inside:
+                    self.samples.append([self._frame_index(f) for f in reversed(stack)])
+
+    def to_speedscope(self, name: str) -> dict:
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": name,
+            "exporter": "tuition_center_fastapi profiler",
+            "shared": {"frames": self.frame_list},
+            "profiles": [{
+                "type": "sampled",
+                "name": name,
+                "unit": "seconds",
+                "startValue": 0,
+                "endValue": self.elapsed,
+                "samples": self.samples,
+                "weights": [self.interval] * len(self.samples),
+            }],
+        }
+
+
+# ---------------- Storage ----------------
+def _save_profile(sampler: StackSampler, method: str, path: str, status: int) -> str:
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    slug = re.sub(r"[^A-Za-z0-9]+", "_", path).strip("_") or "root"
+    stamp = datetime.now().strftime("%Y%m%d-%H%M%S-%f")
+    filename = f"{stamp}_{method}_{slug}_{int(sampler.elapsed * 1000)}ms.speedscope.json"
+    with open(os.path.join(PROFILE_DIR, filename), "w") as f:
+        json.dump(sampler.to_speedscope(f"{method} {path} ({status})"), f)
+    _enforce_retention()
+    return filename
+
+
+def _enforce_retention() -> None:
+    files = list_profiles()
+    for stale in files[PROFILE_RETENTION:]:
+        try:
+            os.remove(os.path.join(PROFILE_DIR, stale["name"]))
+        except OSError:
+            pass
+
+
+def list_profiles() -> list[dict]:
+    """Stored profiles, newest first."""
+    if not os.path.isdir(PROFILE_DIR):
+        return []
+    profiles = []
+    for name in os.listdir(PROFILE_DIR):
+        if not name.endswith(".speedscope.json"):
+            continue
+        full_path = os.path.join(PROFILE_DIR, name)
+        stat = os.stat(full_path)
+        profiles.append({
+            "name": name,
+            "size_kb": round(stat.st_size / 1024, 1),
+            "created": datetime.fromtimestamp(stat.st_mtime),
+        })
+    profiles.sort(key=lambda p: p["name"], reverse=True)
+    return profiles
+
+
+# ---------------- Triggering ----------------
+def sign_profile_request(path: str, expires: int) -> str:
+    """
+    Signature an operator sends in X-Profile-Signature to profile `path` until
+    `expires` (Unix seconds), which goes in X-Profile-Expires:
+
+        expires = int(time.time()) + 60
+        headers = {"X-Profile-Expires": str(expires),
+                   "X-Profile-Signature": sign_profile_request("/all_tests", expires)}
+    """
+    message = f"{path}\n{expires}".encode()
+    return hmac.new(PROFILE_SECRET.encode(), message, hashlib.sha256).hexdigest()
+
+
+def _valid_signature(scope, signature: str) -> bool:
+    """A signature for this path that has not expired, and was not made to last longer than the TTL."""
+    try:
+        expires = int(_header(scope, b"x-profile-expires") or "")
+    except ValueError:
+        return False
+    if not time.time() <= expires <= time.time() + PROFILE_SIGNATURE_TTL:
+        return False
+    return hmac.compare_digest(signature, sign_profile_request(scope["path"], expires))
+
+
+def _header(scope, name: bytes) -> str | None:
+    for key, value in scope.get("headers", []):
+        if key == name:
+            return value.decode("latin-1")
+    return None
+
+
+def _is_admin_cookie(scope) -> bool:
+    cookie_header = _header(scope, b"cookie") or ""
+    username = None
+    for part in cookie_header.split(";"):
+        key, _, value = part.strip().partition("=")
+        if key == "username":
+            username = value.strip('"')
+    if not username:
+        return False
+    with Session(engine) as session:
+        user = session.exec(select(User).where(User.username == username)).first()
+    return user is not None and user.user_type == "admin"
+
+
+async def _should_profile(scope) -> bool:
+    if PROFILE_SECRET:
+        signature = _header(scope, b"x-profile-signature")
+        if signature is not None:
+            return _valid_signature(scope, signature)
+    if b"profile=" in scope.get("query_string", b""):
+        flag = parse_qs(scope["query_string"].decode("latin-1")).get("profile", [""])[0]
+        # the user lookup is a database query: keep it off the event loop
+        return flag == "1" and await run_in_threadpool(_is_admin_cookie, scope)
+    return False
+
+
+class ProfilerMiddleware:
+    """
+    Profiles a request only when asked to, either by an admin adding ?profile=1 or
+    by an unexpired X-Profile-Signature header (see sign_profile_request). Other
+    requests pass straight through.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not await _should_profile(scope):
+            await self.app(scope, receive, send)
+            return
+
+        sampler = StackSampler(scope)
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        sampler.start()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            sampler.stop()
+            _save_profile(sampler, scope["method"], scope["path"], status["code"])
+
+
+# ---------------- Endpoints ----------------
+@router.get("", response_class=HTMLResponse)
+def profiles_page(request: Request, user: User = Depends(get_current_user)):
+    if user.user_type != "admin":
+        raise HTTPException(status_code=403, detail="Not authorized")
+    return _templates.TemplateResponse(
+        "profiles.html",
+        {"request": request, "profiles": list_profiles(), "retention": PROFILE_RETENTION}
+    )
+
+
+@router.get("/{name}")
+def download_profile(name: str, user: User = Depends(get_current_user)):
+    if user.user_type != "admin":
+        raise HTTPException(status_code=403, detail="Not authorized")
+    if name != os.path.basename(name) or not name.endswith(".speedscope.json"):
+        raise HTTPException(status_code=404, detail="Profile not found")
+    full_path = os.path.join(PROFILE_DIR, name)
+    if not os.path.isfile(full_path):
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return FileResponse(full_path, media_type="application/json", filename=name)
@@ -0,0 +1,169 @@
+"""
+Per-request SQL audit: statement count, rows fetched and suspected N+1 loops.
+
+Statements reach the audit through metrics.instrument_engine(), which already
+times every statement against the current request's RequestTimings; the audit
+hangs off that same object, so QueryAuditMiddleware must run inside
+MetricsMiddleware (added before it).
+"""
+from __future__ import annotations
+import logging
+import os
+from sqlalchemy import event
+from sqlalchemy.orm import Session, raiseload
+from metrics import RequestTimings, current_timings
+
+logger = logging.getLogger("query_audit")
+
+# Routes issuing more statements than this are logged as over budget
+QUERY_BUDGET = int(os.getenv("QUERY_BUDGET", "50"))
+# The same statement run this many times with different parameters looks like an N+1
+N_PLUS_ONE_THRESHOLD = int(os.getenv("N_PLUS_ONE_THRESHOLD", "5"))
+# Make relationship lazy loads that would hit the database raise instead (enabled in tests)
+RAISE_ON_LAZY_LOAD = os.getenv("SQL_RAISE_ON_LAZY_LOAD") == "1"
+# Return the counts as X-DB-* response headers; they describe the schema's hot paths, so off by default
+QUERY_AUDIT_HEADERS = os.getenv("QUERY_AUDIT_HEADERS") == "1"
+
+
+class QueryAudit:
+    """Statement count, rows fetched, DB time and per-statement repetition for a single request."""
+    __slots__ = ("count", "rows", "statements", "_timings")
+
+    def __init__(self, timings: RequestTimings):
+        self.count = 0
+        self.rows = 0
+        # statement text -> [executions, first parameter hash, seen different parameters]
+        self.statements: dict[str, list] = {}
+        self._timings = timings
+
+    @property
+    def db_seconds(self) -> float:
+        return self._timings.db_seconds
+
+    def record(self, statement: str, parameters, cursor, context, executemany: bool) -> None:
+        """Called by metrics' after_cursor_execute listener for every statement of the request."""
+        self.count += 1
+        params_hash = hash(repr(parameters))
+        entry = self.statements.get(statement)
+        if entry is None:
+            self.statements[statement] = [1, params_hash, False]
+        else:
+            entry[0] += 1
+            if entry[1] != params_hash:
+                entry[2] = True
+        if not executemany and cursor.description is not None:
+            # the result is built from context.cursor right after this event
+            context.cursor = _CountingCursor(cursor, self)
+
+    def suspected_n_plus_one(self) -> list[tuple[str, int]]:
+        return [
+            (statement, executions)
+            for statement, (executions, _, varied) in self.statements.items()
+            if varied and executions >= N_PLUS_ONE_THRESHOLD
+        ]
+
+
+def current_audit() -> QueryAudit | None:
+    timings = current_timings()
+    return timings.audit if timings is not None else None
+
+
+class _CountingCursor:
+    """
+    Stands in for a DBAPI cursor while its result is read, adding every row
+    fetched to an audit: ORM entities, column projections and scalars alike.
+    """
+
+    def __init__(self, cursor, audit: QueryAudit):
+        self._cursor = cursor
+        self._audit = audit
+
+    def fetchone(self):
+        row = self._cursor.fetchone()
+        if row is not None:
+            self._audit.rows += 1
+        return row
+
+    def fetchmany(self, *args):
+        rows = self._cursor.fetchmany(*args)
+        self._audit.rows += len(rows)
+        return rows
+
+    def fetchall(self):
+        rows = self._cursor.fetchall()
+        self._audit.rows += len(rows)
+        return rows
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+def instrument_orm() -> None:
+    """
+    With RAISE_ON_LAZY_LOAD, every ORM select gets raiseload("*"), so a
+    relationship not loaded explicitly with selectinload/joinedload raises
+    instead of quietly querying while a template renders. Relationships already
+    satisfied from the identity map are still allowed.
+    """
+
+    if RAISE_ON_LAZY_LOAD:
+        @event.listens_for(Session, "do_orm_execute")
+        def _raise_on_lazy_load(orm_execute_state):
+            if orm_execute_state.is_select and not orm_execute_state.is_relationship_load:
+                orm_execute_state.statement = orm_execute_state.statement.options(raiseload("*", sql_only=True))
+
+
+def _route_label(scope) -> str:
+    route = scope.get("route")
+    return route.path if route is not None else scope.get("path", "")
+
+
+class QueryAuditMiddleware:
+    """
+    Pure ASGI middleware that audits the SQL issued by each request. Over-budget
+    routes and suspected N+1 patterns are logged; with QUERY_AUDIT_HEADERS=1 the
+    counts are also returned as X-DB-* response headers. For streamed responses
+    the headers only cover the work done before the first byte; the log covers
+    the body too.
+    """
+
+    def __init__(self, app, headers: bool = QUERY_AUDIT_HEADERS):
+        self.app = app
+        self.headers = headers
+
+    async def __call__(self, scope, receive, send):
+        timings = current_timings()
+        if scope["type"] != "http" or timings is None:
+            await self.app(scope, receive, send)
+            return
+
+        audit = timings.audit = QueryAudit(timings)
+
+        async def send_wrapper(message):
+            if self.headers and message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.append((b"x-db-query-count", str(audit.count).encode()))
+                headers.append((b"x-db-rows-fetched", str(audit.rows).encode()))
+                headers.append((b"x-db-time-ms", f"{audit.db_seconds * 1000:.2f}".encode()))
+                headers.append((b"x-db-n-plus-one", str(len(audit.suspected_n_plus_one())).encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            timings.audit = None
+            self._report(scope, audit)
+
+    def _report(self, scope, audit: QueryAudit) -> None:
+        route = f"{scope['method']} {_route_label(scope)}"
+        if audit.count > QUERY_BUDGET:
+            logger.warning(
+                "%s issued %d SQL statements (budget %d, %.1f ms in DB)",
+                route, audit.count, QUERY_BUDGET, audit.db_seconds * 1000,
+            )
+        for statement, executions in audit.suspected_n_plus_one():
+            logger.warning(
+                "Suspected N+1 in %s: statement ran %d times with different parameters: %s",
+                route, executions, " ".join(statement.split())[:200],
+            )
@@ -0,0 +1,165 @@
+from __future__ import annotations
+import math
+from collections import defaultdict
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy import delete, func, insert, literal_column
+from sqlmodel import Session, select
+from models import Student, TestRecord, SubjectRanking, Tutor, User
+from db import get_session
+from dependencies import get_current_user
+from data_versions import cohort_scope, touch
+
+router = APIRouter(prefix="/rankings", tags=["Rankings"])
+
+
+# ---------------- Refresh ----------------
+def _ranked_select(admin_id: int | None = None, grade: str | None = None, syllabus: str | None = None,
+                   subject: str | None = None):
+    """
+    Builds the window-function query that ranks every student inside their
+    (admin, grade, syllabus, subject) cohort by average test percentage:
+    students are only ever compared with others of the same tuition centre.
+    """
+    average_percentage = func.avg(
+        TestRecord.marks_attained * 100.0 / TestRecord.total_marks
+    ).label("average_percentage")
+
+    averages = (
+        select(
+            TestRecord.student_id.label("student_id"),
+            Tutor.user_id.label("admin_id"),
+            Student.grade.label("grade"),
+            Student.syllabus.label("syllabus"),
+            TestRecord.subject.label("subject"),
+            average_percentage,
+        )
+        .join(Student, Student.id == TestRecord.student_id)
+        .join(Tutor, Tutor.id == Student.tutor_id)
+        .where(TestRecord.total_marks > 0)
+        .group_by(TestRecord.student_id, Tutor.user_id, Student.grade, Student.syllabus, TestRecord.subject)
+    )
+    if admin_id is not None:
+        averages = averages.where(Tutor.user_id == admin_id)
+    if grade is not None:
+        averages = averages.where(Student.grade == grade)
+        averages = averages.where(
+            Student.syllabus.is_(None) if syllabus is None else Student.syllabus == syllabus
+        )
+    if subject is not None:
+        averages = averages.where(TestRecord.subject == subject)
+    averages = averages.subquery("averages")
+
+    cohort = (averages.c.admin_id, averages.c.grade, averages.c.syllabus, averages.c.subject)
+    return select(
+        averages.c.student_id,
+        averages.c.grade,
+        averages.c.syllabus,
+        averages.c.subject,
+        averages.c.average_percentage,
+        (func.percent_rank().over(partition_by=cohort, order_by=averages.c.average_percentage) * 100)
+        .label("percentile"),
+        (func.cume_dist().over(partition_by=cohort, order_by=averages.c.average_percentage.desc()) * 100)
+        .label("top_percent"),
+        func.rank().over(partition_by=cohort, order_by=averages.c.average_percentage.desc())
+        .label("cohort_rank"),
+        func.count().over(partition_by=cohort).label("cohort_size"),
+        literal_column("CURRENT_TIMESTAMP").label("refreshed_at"),
+    )
+
+
+def refresh_rankings(session: Session, admin_id: int | None = None, grade: str | None = None,
+                     syllabus: str | None = None, subject: str | None = None) -> None:
+    """
+    Rebuilds the cached ranking rows. With no arguments the whole table is rebuilt;
+    passing an admin limits the work to their students, and a grade (and its
+    syllabus) to that cohort, optionally narrowed to a single subject.
+    """
+    stale = delete(SubjectRanking)
+    if admin_id is not None:
+        stale = stale.where(SubjectRanking.student_id.in_(
+            select(Student.id).join(Tutor, Tutor.id == Student.tutor_id).where(Tutor.user_id == admin_id)
+        ))
+    if grade is not None:
+        stale = stale.where(SubjectRanking.grade == grade).where(
+            SubjectRanking.syllabus.is_(None) if syllabus is None else SubjectRanking.syllabus == syllabus
+        )
+    if subject is not None:
+        stale = stale.where(SubjectRanking.subject == subject)
+    # nothing loaded is kept past the commit below, so skip fetching the deleted ids to sync the session
+    session.execute(stale.execution_options(synchronize_session=False))
+
+    columns = ["student_id", "grade", "syllabus", "subject", "average_percentage",
+               "percentile", "top_percent", "cohort_rank", "cohort_size", "refreshed_at"]
+    session.execute(insert(SubjectRanking).from_select(
+        columns, _ranked_select(admin_id, grade, syllabus, subject)
+    ))
+    if admin_id is not None and grade is not None:
+        touch(session, cohort_scope(admin_id, grade, syllabus))
+    else:
+        cohorts = select(Tutor.user_id, Student.grade, Student.syllabus).join(
+            Tutor, Tutor.id == Student.tutor_id).distinct()
+        if admin_id is not None:
+            cohorts = cohorts.where(Tutor.user_id == admin_id)
+        if grade is not None:
+            cohorts = cohorts.where(Student.grade == grade).where(
+                Student.syllabus.is_(None) if syllabus is None else Student.syllabus == syllabus
+            )
+        touch(session, *(cohort_scope(*cohort) for cohort in session.exec(cohorts)))
+    session.commit()
+
+
+def refresh_student_cohorts(session: Session, admin_id: int, student: Student) -> None:
+    """Re-ranks every subject cohort the student currently belongs to."""
+    refresh_rankings(session, admin_id, student.grade, student.syllabus)
+
+
+def rankings_empty(session: Session) -> bool:
+    return session.exec(select(SubjectRanking.id).limit(1)).first() is None
+
+
+# ---------------- Lookups ----------------
+def get_student_rankings(session: Session, student_id: int) -> list[SubjectRanking]:
+    return session.exec(
+        select(SubjectRanking)
+        .where(SubjectRanking.student_id == student_id)
+        .order_by(SubjectRanking.subject)
+    ).all()
+
+
+def get_rankings_by_student(session: Session, student_ids: list[int]) -> dict[int, list[SubjectRanking]]:
+    """Fetches the rankings for many students in one query, grouped by student id."""
+    grouped = defaultdict(list)
+    if not student_ids:
+        return grouped
+    rows = session.exec(
+        select(SubjectRanking)
+        .where(SubjectRanking.student_id.in_(student_ids))
+        .order_by(SubjectRanking.subject)
+    ).all()
+    for ranking in rows:
+        grouped[ranking.student_id].append(ranking)
+    return grouped
+
+
+def ranking_label(ranking: SubjectRanking) -> str:
+    """Human readable summary, e.g. 'Top 20% in Mathematics'."""
+    if ranking.cohort_size <= 1:
+        return f"Only student ranked in {ranking.subject}"
+    top = max(1, min(100, math.ceil(round(ranking.top_percent, 6))))
+    return f"Top {top}% in {ranking.subject}"
+
+
+# ---------------- Endpoints ----------------
+@router.post("/refresh")
+def refresh_all_rankings(session: Session = Depends(get_session), user: User = Depends(get_current_user)):
+    if user.user_type != "admin":
+        raise HTTPException(status_code=403, detail="Not authorized")
+
+    refresh_rankings(session, user.id)
+    count = session.exec(
+        select(func.count(SubjectRanking.id))
+        .join(Student, Student.id == SubjectRanking.student_id)
+        .join(Tutor, Tutor.id == Student.tutor_id)
+        .where(Tutor.user_id == user.id)
+    ).first()
+    return {"success": True, "rankings": count or 0}
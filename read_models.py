@@ -0,0 +1,111 @@
+"""
+Compact read models for list pages.
+
+Each row type is a NamedTuple whose columns() are selected directly, so list
+views get plain tuples instead of fully validated SQLModel instances:
+
+    tests = fetch(session, TestListRow, select_rows(TestListRow).join(Student).where(...))
+"""
+from __future__ import annotations
+from datetime import date
+from typing import NamedTuple
+from sqlmodel import Session, select
+from models import Student, Journal, Attendance, TestRecord, UpcomingTest
+
+
+class StudentRow(NamedTuple):
+    id: int
+    name: str
+    grade: str
+    school: str | None
+    syllabus: str | None
+    focus_subjects: str | None
+    subject: str | None
+    remarks: str | None
+
+    @staticmethod
+    def columns():
+        return (Student.id, Student.name, Student.grade, Student.school, Student.syllabus,
+                Student.focus_subjects, Student.subject, Student.remarks)
+
+
+class TestRow(NamedTuple):
+    subject: str
+    topic: str
+    test_date: date
+    total_marks: int
+    marks_attained: int
+    remarks: str
+
+    @staticmethod
+    def columns():
+        return (TestRecord.subject, TestRecord.topic, TestRecord.test_date, TestRecord.total_marks,
+                TestRecord.marks_attained, TestRecord.remarks)
+
+
+class TestListRow(NamedTuple):
+    """A test with its student's name, for pages listing many students' tests."""
+    subject: str
+    topic: str
+    test_date: date
+    total_marks: int
+    marks_attained: int
+    student_name: str
+
+    @staticmethod
+    def columns():
+        return (TestRecord.subject, TestRecord.topic, TestRecord.test_date, TestRecord.total_marks,
+                TestRecord.marks_attained, Student.name)
+
+
+class UpcomingTestRow(NamedTuple):
+    subject: str
+    topics: str | None
+    test_date: date
+
+    @staticmethod
+    def columns():
+        return UpcomingTest.subject, UpcomingTest.topics, UpcomingTest.test_date
+
+
+class UpcomingTestListRow(NamedTuple):
+    subject: str
+    topics: str | None
+    test_date: date
+    student_name: str
+
+    @staticmethod
+    def columns():
+        return UpcomingTest.subject, UpcomingTest.topics, UpcomingTest.test_date, Student.name
+
+
+class JournalRow(NamedTuple):
+    id: int
+    tutor_name: str
+    subject: str
+    journal: str
+    remarks: str
+    entry_date: date
+
+    @staticmethod
+    def columns():
+        return Journal.id, Journal.tutor_name, Journal.subject, Journal.journal, Journal.remarks, Journal.entry_date
+
+
+class AttendanceRow(NamedTuple):
+    student_id: int
+    attendance_date: date
+    status: str
+
+    @staticmethod
+    def columns():
+        return Attendance.student_id, Attendance.attendance_date, Attendance.status
+
+
+def select_rows(row_type):
+    """select() of the row type's columns; add joins, filters and ordering as usual."""
+    return select(*row_type.columns())
+
+
+def fetch(session: Session, row_type, statement) -> list:
+    return [row_type._make(row) for row in session.exec(statement)]
@@ -0,0 +1,281 @@
+"""
+In-memory typeahead over student and tutor names, one index per tenant.
+
+    GET /roster/typeahead?q=pri   ->  [{"kind": "student", "name": "Priya Nair", "url": ...}, ...]
+
+Each index keeps the name words in a sorted list, for prefix lookups by
+bisection, and a trigram -> entries map for typo-tolerant fallback matches
+(the pg_trgm idea, in memory). Lookups never scan the tenant's roster.
+
+An index remembers the data version of its tenant's scope ("tenant:<admin id>")
+it was built at, and every lookup compares it with the database (one
+primary-key read), so writes in other tenants never touch it. Writes committed
+by this process are applied to the cached indexes in place and advance their
+versions; a write from another worker, or a bulk statement, leaves an index
+behind and the tenant's index is rebuilt on its next lookup. Each index has
+its own lock, held by a lookup and by a commit applying its changes, so a
+typeahead never reads an index half way through an update.
+"""
+from __future__ import annotations
+import heapq
+import os
+import re
+import threading
+import unicodedata
+from bisect import bisect_left, insort
+from collections import Counter, defaultdict
+from typing import NamedTuple
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session as OrmSession
+from sqlmodel import Session, select
+from models import Student, Tutor, User
+from db import get_session
+from dependencies import get_current_user
+from data_versions import committed_versions, current_versions, tenant_scope
+
+router = APIRouter(prefix="/roster", tags=["Roster"])
+
+ROSTER_TABLES = (Student.__table__.name, Tutor.__table__.name)
+TYPEAHEAD_LIMIT = int(os.getenv("TYPEAHEAD_LIMIT", "8"))
+# share of the query's trigrams an entry must contain to match as a probable typo
+TRIGRAM_THRESHOLD = float(os.getenv("TYPEAHEAD_TRIGRAM_THRESHOLD", "0.5"))
+
+
+class Entry(NamedTuple):
+    kind: str  # "student" or "tutor"
+    id: int
+    name: str
+    tutor_id: int  # the student's tutor, or the tutor itself
+    info: str | None  # grade for a student, subject for a tutor
+
+
+def _normalize(text: str) -> str:
+    decomposed = unicodedata.normalize("NFKD", text.casefold())
+    return "".join(c for c in decomposed if not unicodedata.combining(c))
+
+
+def _words(text: str) -> list[str]:
+    return re.findall(r"\w+", _normalize(text))
+
+
+def _trigrams(text: str) -> set[str]:
+    """Trigrams of each word, padded like pg_trgm so word starts weigh more."""
+    grams = set()
+    for word in _words(text):
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+class RosterIndex:
+    def __init__(self, version: int):
+        self.version = version
+        self.lock = threading.Lock()  # search() and in-place updates after a commit
+        self.entries: dict[tuple[str, int], Entry] = {}
+        self._names: dict[tuple[str, int], str] = {}  # normalized, for ordering and whole-name matches
+        self.tutor_names: dict[int, str] = {}
+        self._words: list[tuple[str, tuple[str, int]]] = []  # sorted (word, entry key)
+        self._trigrams: defaultdict[str, set] = defaultdict(set)
+
+    def add(self, entry: Entry) -> None:
+        key = (entry.kind, entry.id)
+        self.remove(key)
+        self.entries[key] = entry
+        self._names[key] = _normalize(entry.name)
+        if entry.kind == "tutor":
+            self.tutor_names[entry.id] = entry.name
+        for word in set(_words(entry.name)):
+            insort(self._words, (word, key))
+        for gram in _trigrams(entry.name):
+            self._trigrams[gram].add(key)
+
+    def remove(self, key: tuple[str, int]) -> None:
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            return
+        del self._names[key]
+        if entry.kind == "tutor":
+            self.tutor_names.pop(entry.id, None)
+        for word in set(_words(entry.name)):
+            i = bisect_left(self._words, (word, key))
+            if i < len(self._words) and self._words[i] == (word, key):
+                del self._words[i]
+        for gram in _trigrams(entry.name):
+            keys = self._trigrams.get(gram)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._trigrams[gram]
+
+    def _prefixed(self, word: str) -> set[tuple[str, int]]:
+        i = bisect_left(self._words, (word,))
+        found = set()
+        while i < len(self._words) and self._words[i][0].startswith(word):
+            found.add(self._words[i][1])
+            i += 1
+        return found
+
+    def search(self, q: str, limit: int = TYPEAHEAD_LIMIT, tutor_id: int | None = None) -> list[Entry]:
+        """
+        Entries whose name words start with every word of `q` (the whole name
+        first), topped up with trigram matches; `tutor_id` keeps that tutor's students.
+        """
+        words = _words(q)
+        if not words:
+            return []
+        with self.lock:
+            return self._search(q, words, limit, tutor_id)
+
+    def _search(self, q: str, words: list[str], limit: int, tutor_id: int | None) -> list[Entry]:
+        def visible(key):
+            return tutor_id is None or (key[0] == "student" and self.entries[key].tutor_id == tutor_id)
+
+        keys = set.intersection(*(self._prefixed(word) for word in words))
+        whole = " ".join(words)
+        scored = {key: 2.0 if self._names[key].startswith(whole) else 1.0 for key in keys if visible(key)}
+
+        if len(scored) < limit and len(whole) >= 3:
+            grams = _trigrams(q)
+            shared = Counter(key for gram in grams for key in self._trigrams.get(gram, ()))
+            for key, count in shared.items():
+                # like pg_trgm's word_similarity: how much of the query the name contains
+                similarity = count / len(grams)
+                if similarity >= TRIGRAM_THRESHOLD and key not in scored and visible(key):
+                    scored[key] = similarity
+
+        best = heapq.nsmallest(limit, scored, key=lambda key: (-scored[key], self._names[key]))
+        return [self.entries[key] for key in best]
+
+
+_indexes: dict[int, RosterIndex] = {}
+_lock = threading.Lock()
+
+
+def _build(session: Session, tenant_id: int, version: int) -> RosterIndex:
+    index = RosterIndex(version)
+    for tutor_id, name, subject in session.exec(
+        select(Tutor.id, Tutor.name, Tutor.subject).where(Tutor.user_id == tenant_id)
+    ):
+        index.add(Entry("tutor", tutor_id, name, tutor_id, subject))
+    for student_id, name, grade, tutor_id in session.exec(
+        select(Student.id, Student.name, Student.grade, Student.tutor_id).join(Tutor).where(Tutor.user_id == tenant_id)
+    ):
+        index.add(Entry("student", student_id, name, tutor_id, grade))
+    return index
+
+
+def get_index(session: Session, tenant_id: int) -> RosterIndex:
+    """The tenant's index, rebuilt when the tenant's data moved on since it was built."""
+    scope = tenant_scope(tenant_id)
+    version = current_versions(session, scope)[scope]
+    with _lock:
+        index = _indexes.get(tenant_id)
+        if index is not None and index.version == version:
+            return index
+    index = _build(session, tenant_id, version)
+    with _lock:
+        _indexes[tenant_id] = index
+    return index
+
+
+# ---------------- Incremental updates ----------------
+def _changes(session) -> dict:
+    return session.info.setdefault("roster_changes", {"rows": [], "bulk": False})
+
+
+def _apply(index: RosterIndex, tenant_id: int, rows: list) -> None:
+    for kind, row_id, values in rows:
+        if kind == "tutor":
+            if values is None or values[2] != tenant_id:
+                index.remove(("tutor", row_id))
+            else:
+                index.add(Entry("tutor", row_id, values[0], row_id, values[1]))
+        elif values is not None and values[2] in index.tutor_names:
+            index.add(Entry("student", row_id, values[0], values[2], values[1]))
+        else:
+            index.remove(("student", row_id))  # deleted, or moved to another tenant
+
+
+def track_writes() -> None:
+    """Keeps this process's cached indexes current with its own commits."""
+
+    @event.listens_for(OrmSession, "after_flush")
+    def _after_flush(session, flush_context):
+        changes = _changes(session)
+        for obj in (*session.new, *session.dirty, *session.deleted):
+            if not isinstance(obj, (Student, Tutor)) or (obj in session.dirty and not session.is_modified(obj)):
+                continue
+            deleted = obj in session.deleted
+            if isinstance(obj, Tutor):
+                if inspect(obj).attrs.user_id.history.deleted:
+                    changes["bulk"] = True  # a tutor changing tenant takes their students along
+                changes["rows"].append(("tutor", obj.id, None if deleted else (obj.name, obj.subject, obj.user_id)))
+            else:
+                changes["rows"].append(("student", obj.id, None if deleted else (obj.name, obj.grade, obj.tutor_id)))
+
+    @event.listens_for(OrmSession, "do_orm_execute")
+    def _bulk_write(orm_execute_state):
+        if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+            table = getattr(orm_execute_state.statement, "table", None)
+            if table is not None and table.name in ROSTER_TABLES:
+                _changes(orm_execute_state.session)["bulk"] = True
+
+    @event.listens_for(OrmSession, "after_commit")
+    def _after_commit(session):
+        changes = session.info.pop("roster_changes", None)
+        bumped = committed_versions(session)
+        rows = sorted(changes["rows"], key=lambda row: row[0] != "tutor") if changes else []
+        with _lock:
+            if changes is not None and changes["bulk"]:
+                _indexes.clear()
+                return
+            for tenant_id, index in list(_indexes.items()):
+                version = bumped.get(tenant_scope(tenant_id))
+                if version is None:
+                    continue  # this commit did not write to the tenant
+                # only advance an index that saw every earlier write; otherwise rebuild it on demand
+                if index.version != version - 1:
+                    del _indexes[tenant_id]
+                    continue
+                with index.lock:
+                    _apply(index, tenant_id, rows)
+                    index.version = version
+
+    @event.listens_for(OrmSession, "after_rollback")
+    def _after_rollback(session):
+        session.info.pop("roster_changes", None)
+
+
+# ---------------- Endpoints ----------------
+@router.get("/typeahead")
+def typeahead(
+        q: str = "",
+        limit: int = Query(TYPEAHEAD_LIMIT, ge=1, le=50),
+        session: Session = Depends(get_session),
+        user: User = Depends(get_current_user),
+):
+    """Students (and, for admins, tutors) whose names match what has been typed so far."""
+    if not q.strip():
+        return []
+    if user.user_type == "admin":
+        tenant_id, tutor_id = user.id, None
+    else:
+        tutor = session.get(Tutor, user.tutor_id) if user.tutor_id else None
+        if tutor is None or tutor.user_id is None:
+            return []
+        tenant_id, tutor_id = tutor.user_id, tutor.id
+
+    index = get_index(session, tenant_id)
+    return [
+        {
+            "kind": entry.kind,
+            "id": entry.id,
+            "name": entry.name,
+            "detail": entry.info if entry.kind == "tutor"
+            else " · ".join(filter(None, [f"Grade {entry.info}" if entry.info else None,
+                                          index.tutor_names.get(entry.tutor_id)])),
+            "url": f"/tutor/{entry.id}/students" if entry.kind == "tutor" else f"/reports/student/{entry.id}",
+        }
+        for entry in index.search(q, limit, tutor_id)
+    ]
@@ -0,0 +1,229 @@
+"""
+Full-text search over journals, test records and student remarks.
+
+    hits = search(session, "struggled with fractions", tutor_ids)
+
+On SQLite the text lives in an FTS5 table, search_index, filled by triggers on
+journal, testrecord and student, so every write (ORM, bulk statement or a
+script) keeps it in sync. Each row's rowid encodes the source row (id * 4 +
+kind), which keeps the triggers' deletes on the primary key. On PostgreSQL
+there is no copy: expression GIN indexes over to_tsvector() of the same
+columns are maintained by the database itself.
+
+ensure_index() creates whatever is missing at startup and fills a new FTS
+table from the existing rows; `python -m search --rebuild` refills it.
+Results are ranked (bm25 / ts_rank) and carry HTML snippets with the matched
+terms in <mark>, escaped everywhere else.
+"""
+from __future__ import annotations
+import os
+import re
+from typing import NamedTuple
+from fastapi import APIRouter, Depends, Request
+from fastapi.responses import HTMLResponse
+from markupsafe import Markup, escape
+from sqlalchemy import bindparam, text
+from sqlmodel import Session
+from starlette.templating import Jinja2Templates
+from db import get_session
+from dependencies import get_tutor_ids
+
+router = APIRouter(tags=["Search"])
+
+SEARCH_LIMIT = int(os.getenv("SEARCH_LIMIT", "50"))
+SEARCH_LANGUAGE = os.getenv("SEARCH_LANGUAGE", "english")  # PostgreSQL text search configuration
+
+# Snippet delimiters: private-use characters that cannot appear in user text, swapped for <mark> after escaping
+_OPEN, _CLOSE = "\ue000", "\ue001"
+
+# kind -> (code in the FTS rowid, table, title expression, body expression)
+SOURCES = {
+    "journal": (1, "journal", "subject", "coalesce({t}.journal, '') || ' ' || coalesce({t}.remarks, '')"),
+    "test": (2, "testrecord", "topic", "coalesce({t}.remarks, '')"),
+    "student": (3, "student", "name", "coalesce({t}.remarks, '')"),
+}
+_KINDS = {code: kind for kind, (code, *_) in SOURCES.items()}
+
+# -------- Templates wiring (set from main.py) --------
+_templates: Jinja2Templates | None = None
+
+
+def init_templates(templates: Jinja2Templates) -> None:
+    global _templates
+    _templates = templates
+
+
+class SearchHit(NamedTuple):
+    kind: str  # "journal", "test" or "student"
+    id: int
+    student_id: int
+    student_name: str
+    title: Markup
+    snippet: Markup
+    rank: float
+
+    @property
+    def url(self) -> str:
+        if self.kind == "journal":
+            return f"/student/{self.student_id}/journal"
+        if self.kind == "test":
+            return f"/student/{self.student_id}/tests"
+        return f"/reports/student/{self.student_id}"
+
+
+# ---------------- Index ----------------
+def _student_id(kind: str, row: str) -> str:
+    return f"{row}.id" if kind == "student" else f"{row}.student_id"
+
+
+def _sqlite_statements() -> list[str]:
+    statements = [
+        "CREATE VIRTUAL TABLE IF NOT EXISTS search_index "
+        "USING fts5(student_id UNINDEXED, title, body, tokenize = 'porter unicode61')"
+    ]
+    for kind, (code, table, title, body) in SOURCES.items():
+        insert = (
+            f"INSERT INTO search_index (rowid, student_id, title, body) VALUES "
+            f"(new.id * 4 + {code}, {_student_id(kind, 'new')}, new.{title}, {body.format(t='new')});"
+        )
+        delete = f"DELETE FROM search_index WHERE rowid = old.id * 4 + {code};"
+        statements += [
+            f"CREATE TRIGGER IF NOT EXISTS search_{table}_insert AFTER INSERT ON {table} BEGIN {insert} END",
+            f"CREATE TRIGGER IF NOT EXISTS search_{table}_delete AFTER DELETE ON {table} BEGIN {delete} END",
+            f"CREATE TRIGGER IF NOT EXISTS search_{table}_update AFTER UPDATE ON {table} BEGIN {delete} {insert} END",
+        ]
+    return statements
+
+
+def _sqlite_fill(connection) -> None:
+    connection.execute(text("DELETE FROM search_index"))
+    for kind, (code, table, title, body) in SOURCES.items():
+        connection.execute(text(
+            f"INSERT INTO search_index (rowid, student_id, title, body) "
+            f"SELECT id * 4 + {code}, {_student_id(kind, table)}, {title}, {body.format(t=table)} FROM {table}"
+        ))
+
+
+def _pg_document(kind: str, alias: str) -> str:
+    _, _, title, body = SOURCES[kind]
+    return f"to_tsvector('{SEARCH_LANGUAGE}', coalesce({alias}.{title}, '') || ' ' || {body.format(t=alias)})"
+
+
+def _pg_statements() -> list[str]:
+    # the indexed expressions must match the ones search() filters on, table name included
+    return [
+        f"CREATE INDEX IF NOT EXISTS ix_{table}_search ON {table} USING gin ({_pg_document(kind, table)})"
+        for kind, (_, table, _, _) in SOURCES.items()
+    ]
+
+
+def ensure_index(engine, rebuild: bool = False) -> None:
+    """Creates the search index for the engine's dialect; fills a new (or, with rebuild, the existing) FTS table."""
+    with engine.begin() as connection:
+        if connection.dialect.name == "postgresql":
+            for statement in _pg_statements():
+                connection.execute(text(statement))
+            return
+        if connection.dialect.name != "sqlite":
+            return
+        exists = connection.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'search_index'")
+        ).first()
+        for statement in _sqlite_statements():
+            connection.execute(text(statement))
+        if rebuild or not exists:
+            _sqlite_fill(connection)
+
+
+# ---------------- Query ----------------
+def _fts_query(q: str) -> str:
+    """User input as an FTS5 query: every word must match, the last one as a prefix."""
+    words = re.findall(r"\w+", q)
+    if not words:
+        return ""
+    return " ".join(f'"{w}"' for w in words[:-1]) + (" " if len(words) > 1 else "") + f'"{words[-1]}"*'
+
+
+def _marked(fragment: str | None) -> Markup:
+    return Markup(str(escape(fragment or "")).replace(_OPEN, "<mark>").replace(_CLOSE, "</mark>"))
+
+
+def _search_sqlite(session: Session, q: str, tutor_ids: list[int], limit: int) -> list:
+    match = _fts_query(q)
+    if not match:
+        return []
+    statement = text(
+        f"SELECT search_index.rowid, student.id, student.name, "
+        f"highlight(search_index, 1, '{_OPEN}', '{_CLOSE}'), "
+        f"snippet(search_index, 2, '{_OPEN}', '{_CLOSE}', '…', 16), "
+        f"bm25(search_index, 0.0, 2.0, 1.0) AS rank "
+        f"FROM search_index JOIN student ON student.id = search_index.student_id "
+        f"WHERE search_index MATCH :match AND student.tutor_id IN :tutor_ids "
+        f"ORDER BY rank LIMIT :limit"
+    ).bindparams(bindparam("tutor_ids", expanding=True))
+    rows = session.connection().execute(statement, {"match": match, "tutor_ids": tutor_ids, "limit": limit})
+    return [
+        # bm25 is lower for better matches; flip it so a higher rank is better on both databases
+        SearchHit(_KINDS[rowid % 4], rowid // 4, student_id, name, _marked(title), _marked(snippet), -rank)
+        for rowid, student_id, name, title, snippet, rank in rows
+    ]
+
+
+def _search_postgresql(session: Session, q: str, tutor_ids: list[int], limit: int) -> list:
+    options = f"StartSel={_OPEN}, StopSel={_CLOSE}, MaxWords=30, MinWords=10, MaxFragments=2"
+    parts = []
+    for kind, (_, table, title, body) in SOURCES.items():
+        document = _pg_document(kind, table)
+        parts.append(
+            f"SELECT '{kind}' AS kind, {table}.id, student.id AS student_id, student.name, "
+            f"ts_headline('{SEARCH_LANGUAGE}', coalesce({table}.{title}, ''), query, :options) AS title, "
+            f"ts_headline('{SEARCH_LANGUAGE}', {body.format(t=table)}, query, :options) AS snippet, "
+            f"ts_rank({document}, query) AS rank "
+            f"FROM {table} "
+            + ("" if kind == "student" else f"JOIN student ON student.id = {table}.student_id ")
+            + f"CROSS JOIN websearch_to_tsquery('{SEARCH_LANGUAGE}', :q) AS query "
+            f"WHERE {document} @@ query AND student.tutor_id IN :tutor_ids"
+        )
+    statement = text(
+        " UNION ALL ".join(f"({part})" for part in parts) + " ORDER BY rank DESC LIMIT :limit"
+    ).bindparams(bindparam("tutor_ids", expanding=True))
+    rows = session.connection().execute(
+        statement, {"q": q, "options": options, "tutor_ids": tutor_ids, "limit": limit}
+    )
+    return [
+        SearchHit(kind, id_, student_id, name, _marked(title), _marked(snippet), rank)
+        for kind, id_, student_id, name, title, snippet, rank in rows
+    ]
+
+
+def search(session: Session, q: str, tutor_ids: list[int], limit: int = SEARCH_LIMIT) -> list[SearchHit]:
+    """Best matches for `q` among the students of `tutor_ids`, best first."""
+    if not q.strip() or not tutor_ids:
+        return []
+    if session.get_bind().dialect.name == "postgresql":
+        return _search_postgresql(session, q, tutor_ids, limit)
+    return _search_sqlite(session, q, tutor_ids, limit)
+
+
+# ---------------- Endpoints ----------------
+@router.get("/search", response_class=HTMLResponse)
+def search_page(
+        request: Request,
+        q: str = "",
+        session: Session = Depends(get_session),
+        tutor_ids: list[int] = Depends(get_tutor_ids),
+):
+    return _templates.TemplateResponse("search.html", {
+        "request": request,
+        "q": q,
+        "hits": search(session, q, tutor_ids),
+    })
+
+
+if __name__ == "__main__":
+    import argparse
+    from db import engine
+
+    parser = argparse.ArgumentParser(description="Create the full-text search index.")
+    parser.add_argument("--rebuild", action="store_true", help="refill the SQLite FTS table from the source tables")
+    ensure_index(engine, rebuild=parser.parse_args().rebuild)
@@ -0,0 +1,33 @@
+// Live attendance deltas from /ws/attendance.
+// liveAttendance(onDelta, onResync): onDelta gets {student_id, tutor_id, date, status, previous, student_name, grade};
+// onResync is called when deltas may have been missed (reconnect, or the server says we fell behind).
+window.liveAttendance = function(onDelta, onResync) {
+    let delay = 1000;
+    let connectedBefore = false;
+    let failures = 0;  // connections in a row that closed without ever opening
+
+    function connect() {
+        const scheme = location.protocol === 'https:' ? 'wss://' : 'ws://';
+        const socket = new WebSocket(scheme + location.host + '/ws/attendance');
+
+        socket.onopen = function() {
+            delay = 1000;
+            failures = 0;
+            if (connectedBefore) onResync();
+            connectedBefore = true;
+        };
+        socket.onmessage = function(event) {
+            const message = JSON.parse(event.data);
+            if (message.type === 'resync') onResync();
+            else if (message.type === 'attendance') onDelta(message);
+        };
+        socket.onclose = function(event) {
+            if (event.code === 1008) return;  // not signed in: retrying will not help
+            if (++failures > 5) return;  // never opened: most likely refused, so stop asking
+            setTimeout(connect, delay);
+            delay = Math.min(delay * 2, 30000);
+        };
+    }
+
+    if ('WebSocket' in window) connect();
+};
@@ -0,0 +1,31 @@
+// Rows follow attendance marked today anywhere in the tenant
+document.addEventListener('DOMContentLoaded', function() {
+    const table = document.getElementById('attendanceToday');
+    const empty = document.getElementById('attendanceTodayEmpty');
+    const body = table.querySelector('tbody');
+
+    function badge(status) {
+        const span = document.createElement('span');
+        span.className = 'badge ' + (status === 'present' ? 'bg-success' : status === 'absent' ? 'bg-danger' : 'bg-secondary');
+        span.textContent = status === 'present' ? 'Present' : status === 'absent' ? 'Absent' : status;
+        return span;
+    }
+
+    window.liveAttendance(function(delta) {
+        if (delta.date !== table.dataset.date) return;
+        let row = body.querySelector('tr[data-student-id="' + delta.student_id + '"]');
+        if (!row) {
+            row = document.createElement('tr');
+            row.dataset.studentId = delta.student_id;
+            [delta.student_name, delta.grade, ''].forEach(function(text) {
+                const cell = document.createElement('td');
+                cell.textContent = text;
+                row.appendChild(cell);
+            });
+            body.appendChild(row);
+            table.classList.remove('d-none');
+            empty.classList.add('d-none');
+        }
+        row.cells[2].replaceChildren(badge(delta.status));
+    }, function() { window.location.reload(); });
+});
@@ -0,0 +1,114 @@
+// Theme toggle functionality
+const themeToggle = document.getElementById('themeToggle');
+const themeIcon = themeToggle.querySelector('i');
+
+// Check for saved theme preference or respect OS preference
+const prefersDarkScheme = window.matchMedia('(prefers-color-scheme: dark)');
+const currentTheme = localStorage.getItem('theme');
+
+if (currentTheme === 'dark' || (!currentTheme && prefersDarkScheme.matches)) {
+    document.body.classList.add('dark-mode');
+    themeIcon.classList.remove('fa-moon');
+    themeIcon.classList.add('fa-sun');
+}
+
+themeToggle.addEventListener('click', function() {
+    document.body.classList.toggle('dark-mode');
+
+    if (document.body.classList.contains('dark-mode')) {
+        localStorage.setItem('theme', 'dark');
+        themeIcon.classList.remove('fa-moon');
+        themeIcon.classList.add('fa-sun');
+    } else {
+        localStorage.setItem('theme', 'light');
+        themeIcon.classList.remove('fa-sun');
+        themeIcon.classList.add('fa-moon');
+    }
+});
+
+// Filter functionality for tutors and students
+document.addEventListener('DOMContentLoaded', function() {
+    // Tutor filtering
+    const tutorSearch = document.getElementById('tutorSearch');
+    const tutorFilter = document.getElementById('tutorFilter');
+    const tutorList = document.getElementById('tutorList');
+    const tutors = tutorList.getElementsByClassName('list-group-item');
+
+    if (tutorSearch && tutorFilter) {
+        tutorSearch.addEventListener('input', filterTutors);
+        tutorFilter.addEventListener('change', filterTutors);
+    }
+
+    function filterTutors() {
+        const searchText = tutorSearch.value.toLowerCase();
+        const subjectValue = tutorFilter.value;
+
+        Array.from(tutors).forEach(function(tutor) {
+            const tutorName = tutor.querySelector('h5').textContent.toLowerCase();
+            const tutorSubject = tutor.getAttribute('data-subject');
+            const matchesSearch = tutorName.includes(searchText);
+            const matchesSubject = subjectValue === 'all' || tutorSubject === subjectValue;
+
+            if (matchesSearch && matchesSubject) {
+                tutor.style.display = 'block';
+            } else {
+                tutor.style.display = 'none';
+            }
+        });
+    }
+
+    // Student filtering
+    const studentSearch = document.getElementById('studentSearch');
+    const gradeFilter = document.getElementById('gradeFilter');
+    const studentList = document.getElementById('studentList');
+    const students = studentList.getElementsByClassName('list-group-item');
+
+    if (studentSearch && gradeFilter) {
+        studentSearch.addEventListener('input', filterStudents);
+        gradeFilter.addEventListener('change', filterStudents);
+    }
+
+    function filterStudents() {
+        const searchText = studentSearch.value.toLowerCase();
+        const gradeValue = gradeFilter.value;
+
+        Array.from(students).forEach(function(student) {
+            const studentName = student.querySelector('h5').textContent.toLowerCase();
+            const studentGrade = student.getAttribute('data-grade');
+            const matchesSearch = studentName.includes(searchText);
+            const matchesGrade = gradeValue === 'all' || studentGrade === gradeValue;
+
+            if (matchesSearch && matchesGrade) {
+                student.style.display = 'block';
+            } else {
+                student.style.display = 'none';
+            }
+        });
+    }
+});
+
+// Today's present/absent counters follow attendance marked anywhere in the tenant
+document.addEventListener('DOMContentLoaded', function() {
+    const counters = document.getElementById('attendanceCounters');
+    const presents = document.getElementById('presentsToday');
+    const absents = document.getElementById('absentsToday');
+    if (!counters || !presents || !absents || !window.liveAttendance) return;
+
+    function adjust(status, by) {
+        const counter = status === 'present' ? presents : status === 'absent' ? absents : null;
+        if (counter) counter.textContent = Math.max(0, parseInt(counter.textContent || '0') + by);
+    }
+
+    window.liveAttendance(function(delta) {
+        if (delta.date !== counters.dataset.today || delta.status === delta.previous) return;
+        adjust(delta.previous, -1);
+        adjust(delta.status, 1);
+    }, function() {
+        fetch('/api/v1/attendance/summary?day=' + counters.dataset.today)
+            .then(r => r.json())
+            .then(summary => {
+                presents.textContent = summary.present;
+                absents.textContent = summary.absent;
+            });
+    });
+});
@@ -0,0 +1,118 @@
+// Theme toggle functionality
+const themeToggle = document.getElementById('themeToggle');
+const themeIcon = themeToggle.querySelector('i');
+
+// Check for saved theme preference or respect OS preference
+const prefersDarkScheme = window.matchMedia('(prefers-color-scheme: dark)');
+const currentTheme = localStorage.getItem('theme');
+
+if (currentTheme === 'dark' || (!currentTheme && prefersDarkScheme.matches)) {
+    document.body.classList.add('dark-mode');
+    themeIcon.classList.remove('fa-moon');
+    themeIcon.classList.add('fa-sun');
+}
+
+themeToggle.addEventListener('click', function() {
+    document.body.classList.toggle('dark-mode');
+
+    if (document.body.classList.contains('dark-mode')) {
+        localStorage.setItem('theme', 'dark');
+        themeIcon.classList.remove('fa-moon');
+        themeIcon.classList.add('fa-sun');
+    } else {
+        localStorage.setItem('theme', 'light');
+        themeIcon.classList.remove('fa-sun');
+        themeIcon.classList.add('fa-moon');
+    }
+});
+
+// Set initial question type
+document.getElementById('questionTypeInput').value = 'syllabus';
+
+// Question type button functionality
+document.querySelectorAll('.question-type-button').forEach(button => {
+    button.addEventListener('click', function(event) {
+        event.preventDefault();
+        const questionType = this.getAttribute('data-question-type');
+
+        // Remove active class from all buttons
+        document.querySelectorAll('.question-type-button').forEach(btn => {
+            btn.classList.remove('active', 'btn-primary');
+            btn.classList.add('btn-outline-primary');
+        });
+
+        // Add active class to clicked button
+        this.classList.add('active', 'btn-primary');
+        this.classList.remove('btn-outline-primary');
+
+        // Set the value of the hidden input
+        document.getElementById('questionTypeInput').value = questionType;
+
+        // Show the form if it's hidden
+        document.getElementById('questionsForm').style.display = 'block';
+    });
+});
+
+// Form submission handler
+document.getElementById('questionGenerationForm').addEventListener('submit', async function(event) {
+    event.preventDefault();
+
+    // Show loading indicator and clear previous content
+    document.getElementById('loadingIndicator').style.display = 'block';
+    document.getElementById('generatedQuestionsDisplay').innerHTML = '';
+
+    const form = event.target;
+    const formData = new FormData(form);
+    const url = form.action;
+
+    try {
+        const response = await fetch(url, {
+            method: 'POST',
+            body: formData
+        });
+
+        if (!response.ok) {
+            document.getElementById('loadingIndicator').style.display = 'none';
+            const errorText = await response.text();
+            document.getElementById('generatedQuestionsDisplay').innerHTML = `
+                <div class="alert alert-danger" role="alert">
+                    <i class="fas fa-exclamation-circle me-2"></i>
+                    Error: ${errorText}
+                </div>`;
+            return;
+        }
+
+        // The page arrives in pieces as the questions are written; show each one as it lands
+        const display = document.getElementById('generatedQuestionsDisplay');
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let htmlContent = '';
+        let pending = false;
+        const render = () => {
+            pending = false;
+            display.innerHTML = htmlContent;
+        };
+
+        while (true) {
+            const { done, value } = await reader.read();
+            if (done) break;
+            htmlContent += decoder.decode(value, { stream: true });
+            document.getElementById('loadingIndicator').style.display = 'none';
+            if (!pending) {
+                pending = true;
+                requestAnimationFrame(render);
+            }
+        }
+        htmlContent += decoder.decode();
+        render();
+
+    } catch (error) {
+        // Hide the loading indicator on error
+        document.getElementById('loadingIndicator').style.display = 'none';
+        document.getElementById('generatedQuestionsDisplay').innerHTML = `
+            <div class="alert alert-danger" role="alert">
+                <i class="fas fa-exclamation-circle me-2"></i>
+                An unexpected error occurred: ${error.message}
+            </div>`;
+    }
+});
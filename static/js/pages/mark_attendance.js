@@ -0,0 +1,82 @@
+document.addEventListener("DOMContentLoaded", function() {
+    const boxes = document.querySelectorAll('.attendance-checkbox');
+
+    function setCellStatus(cell, status) {
+        const badge = cell.querySelector('.badge');
+        cell.classList.toggle('present-cell', status === 'present');
+        cell.classList.toggle('absent-cell', status === 'absent');
+        cell.querySelector('.attendance-checkbox').checked = status === 'present';
+        if (!badge) return;
+        if (status === 'present') { badge.textContent = 'Present'; badge.className = 'badge bg-success'; }
+        else if (status === 'absent') { badge.textContent = 'Absent'; badge.className = 'badge bg-danger'; }
+        else { badge.textContent = '—'; badge.className = 'badge bg-secondary badge-placeholder'; }
+    }
+
+    function updateCellUI(cell, checked) {
+        setCellStatus(cell, checked ? 'present' : 'absent');
+    }
+
+    boxes.forEach(function(cb) {
+        cb.addEventListener('change', function() {
+            const studentId = parseInt(this.dataset.studentId);
+            const date = this.dataset.date;
+            const isChecked = this.checked;
+            const status = isChecked ? 'present' : 'absent';
+            const cell = this.closest('td');
+
+            // optimistic UI update
+            updateCellUI(cell, isChecked);
+
+            fetch('/attendance/update', {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify({ student_id: studentId, date: date, status: status })
+            })
+            .then(r => r.json())
+            .then(data => {
+                if (!data || !data.success) {
+                    alert('Failed to save attendance: ' + (data && data.error ? data.error : 'unknown'));
+                    // revert UI
+                    this.checked = !this.checked;
+                    updateCellUI(cell, this.checked);
+                }
+            })
+            .catch(() => {
+                alert('Network error while saving attendance');
+                // revert UI
+                this.checked = !this.checked;
+                updateCellUI(cell, this.checked);
+            });
+        });
+    });
+
+    if (!boxes.length) return;
+
+    // Changes made elsewhere (another tutor, an admin, another tab) arrive as deltas
+    function cellFor(studentId, date) {
+        const box = document.querySelector(
+            '.attendance-checkbox[data-student-id="' + studentId + '"][data-date="' + date + '"]');
+        return box ? box.closest('td') : null;
+    }
+
+    // After missing deltas, re-read this month's grid from the API, a page of students at a time
+    function resync(cursor) {
+        const [year, month] = boxes[0].dataset.date.split('-');
+        let url = '/api/v1/attendance/grid?limit=500&year=' + parseInt(year) + '&month=' + parseInt(month);
+        if (cursor) url += '&cursor=' + encodeURIComponent(cursor);
+        fetch(url)
+            .then(r => r.json())
+            .then(page => {
+                page.items.forEach(function(row) {
+                    document.querySelectorAll('.attendance-checkbox[data-student-id="' + row.student_id + '"]')
+                        .forEach(function(box) { setCellStatus(box.closest('td'), row.days[box.dataset.date]); });
+                });
+                if (page.next_cursor) resync(page.next_cursor);
+            });
+    }
+
+    window.liveAttendance(function(delta) {
+        const cell = cellFor(delta.student_id, delta.date);
+        if (cell) setCellStatus(cell, delta.status);
+    }, function() { resync(null); });
+});
@@ -0,0 +1,18 @@
+document.addEventListener('DOMContentLoaded', function () {
+    const downloadButton = document.getElementById('download-button');
+    const dropdownItems = document.querySelectorAll('.dropdown-item');
+
+    dropdownItems.forEach(item => {
+        item.addEventListener('click', function () {
+            // Change button state on click
+            downloadButton.innerHTML = '<span class="spinner-border spinner-border-sm" role="status" aria-hidden="true"></span> Processing...';
+            downloadButton.disabled = true;
+
+            // Reset button state after a short delay to allow download to start
+            setTimeout(() => {
+                downloadButton.innerHTML = '<i class="fas fa-download me-2"></i>Download Report';
+                downloadButton.disabled = false;
+            }, 3000); // 3 seconds delay, can be adjusted
+        });
+    });
+});
@@ -0,0 +1,81 @@
+// Roster typeahead for header search boxes: <input data-roster-typeahead> inside a form posting to /search
+document.querySelectorAll('input[data-roster-typeahead]').forEach(function(input) {
+    const menu = document.createElement('div');
+    menu.className = 'dropdown-menu roster-typeahead-menu';
+    input.parentNode.classList.add('roster-typeahead');
+    input.parentNode.appendChild(menu);
+    input.setAttribute('autocomplete', 'off');
+
+    let timer = null;
+    let controller = null;
+    let active = -1;
+
+    function close() {
+        menu.classList.remove('show');
+        active = -1;
+    }
+
+    function highlight(index) {
+        const items = menu.querySelectorAll('.dropdown-item');
+        items.forEach(function(item, i) { item.classList.toggle('active', i === index); });
+        active = index;
+    }
+
+    function render(results) {
+        menu.replaceChildren();
+        results.forEach(function(result) {
+            const item = document.createElement('a');
+            item.className = 'dropdown-item';
+            item.href = result.url;
+            const name = document.createElement('span');
+            name.className = 'fw-semibold';
+            name.textContent = result.name;
+            const detail = document.createElement('small');
+            detail.className = 'text-muted ms-2';
+            detail.textContent = result.kind === 'tutor' ? 'Tutor · ' + (result.detail || '') : result.detail;
+            item.append(name, detail);
+            menu.appendChild(item);
+        });
+        active = -1;
+        menu.classList.toggle('show', results.length > 0);
+    }
+
+    function lookup() {
+        const q = input.value.trim();
+        if (controller) controller.abort();
+        if (!q) {
+            close();
+            return;
+        }
+        controller = new AbortController();
+        fetch('/roster/typeahead?q=' + encodeURIComponent(q), {signal: controller.signal})
+            .then(function(response) { return response.ok ? response.json() : []; })
+            .then(render)
+            .catch(function(error) { if (error.name !== 'AbortError') close(); });
+    }
+
+    input.addEventListener('input', function() {
+        clearTimeout(timer);
+        timer = setTimeout(lookup, 120);
+    });
+
+    input.addEventListener('keydown', function(event) {
+        const items = menu.querySelectorAll('.dropdown-item');
+        if (!menu.classList.contains('show') || !items.length) return;
+        if (event.key === 'ArrowDown') {
+            event.preventDefault();
+            highlight((active + 1) % items.length);
+        } else if (event.key === 'ArrowUp') {
+            event.preventDefault();
+            highlight((active - 1 + items.length) % items.length);
+        } else if (event.key === 'Enter' && active >= 0) {
+            // a picked name opens its page; plain Enter falls through to full-text search
+            event.preventDefault();
+            window.location.href = items[active].href;
+        } else if (event.key === 'Escape') {
+            close();
+        }
+    });
+
+    input.addEventListener('blur', function() { setTimeout(close, 150); });
+});
@@ -0,0 +1,126 @@
+"""
+Streamed, async template rendering for pages whose size grows with the data.
+
+    rows = stream_rows(TestListRow, select_rows(TestListRow).join(Student)...,
+                       keys=(TestRecord.test_date, TestRecord.id), descending=True)
+    return stream_template(templates, "all_tests.html", {"request": request, "all_tests": rows})
+
+The template renders in Jinja's async mode and is sent as it is produced: the
+first chunk (doctype, head and styles up to the first expression) goes out
+immediately, the rest in STREAM_CHUNK_SIZE pieces. Row sources are async
+iterators that read STREAM_BATCH_SIZE rows at a time in the thread pool, so
+neither the rows nor the HTML are ever held in full. Templates must loop over
+them with {% for %}...{% else %}, since an async iterator has no length or
+truthiness.
+
+Each batch is a keyset-paginated query in a session of its own, closed before
+the rows are rendered: a slow client holds no pooled connection while its
+page is being sent, however many row sources the page has.
+
+The status line goes out before the body is rendered, so an error part way
+through cannot become a 500: it is logged, marked at the end of what was sent,
+and re-raised, which aborts the response instead of ending it as a complete 200.
+"""
+from __future__ import annotations
+import logging
+import os
+from typing import AsyncIterator
+from fastapi.responses import StreamingResponse
+from jinja2.bccache import FileSystemBytecodeCache
+from sqlalchemy import tuple_
+from sqlmodel import Session
+from starlette.concurrency import run_in_threadpool
+from db import engine
+
+logger = logging.getLogger("streaming")
+
+STREAM_CHUNK_SIZE = int(os.getenv("STREAM_CHUNK_SIZE", "16384"))
+STREAM_BATCH_SIZE = int(os.getenv("STREAM_BATCH_SIZE", "500"))
+INCOMPLETE_NOTICE = (
+    '<div class="alert alert-danger text-center">'
+    "Something went wrong and this page is incomplete. Please reload it.</div>"
+)
+
+_async_envs: dict[int, object] = {}
+
+
+def _async_env(templates):
+    """An async overlay of the app's environment, sharing its loader, filters and globals."""
+    env = _async_envs.get(id(templates.env))
+    if env is None:
+        bytecode_cache = templates.env.bytecode_cache
+        if isinstance(bytecode_cache, FileSystemBytecodeCache):
+            # async templates compile to different code; keep them apart from the sync ones
+            bytecode_cache = FileSystemBytecodeCache(bytecode_cache.directory, "__jinja2_async_%s.cache")
+        env = templates.env.overlay(enable_async=True, bytecode_cache=bytecode_cache)
+        _async_envs[id(templates.env)] = env
+    return env
+
+
+def _fetch_batch(statement, keys: tuple, descending: bool, after: tuple | None, limit: int) -> list:
+    if after is not None:
+        position = tuple_(*keys)
+        statement = statement.where(position < tuple_(*after) if descending else position > tuple_(*after))
+    statement = statement.order_by(*(key.desc() if descending else key for key in keys)).limit(limit)
+    with Session(engine) as session:
+        return session.execute(statement).all()
+
+
+async def stream_rows(row_type, statement, keys: tuple, descending: bool = False,
+                      batch_size: int = STREAM_BATCH_SIZE) -> AsyncIterator:
+    """
+    Yields row_type rows for `statement` ordered by `keys` (ending in a unique
+    column), one batch per thread-pool hop and per short-lived session.
+    """
+    statement = statement.add_columns(*keys)  # the last row's keys are where the next batch starts
+    after = None
+    while True:
+        batch = await run_in_threadpool(_fetch_batch, statement, keys, descending, after, batch_size)
+        for row in batch:
+            yield row_type._make(row[:-len(keys)])
+        if len(batch) < batch_size:
+            return
+        after = tuple(batch[-1][-len(keys):])
+
+
+async def group_rows(parents: AsyncIterator, children: AsyncIterator, parent_key, child_key, reduce) -> AsyncIterator:
+    """
+    Merges two streams sorted by the same key into (parent, reduce(children)) pairs,
+    e.g. students ordered by id with their attendance ordered by student_id.
+    """
+    pending = await anext(children, None)
+    async for parent in parents:
+        key = parent_key(parent)
+        group = []
+        while pending is not None and child_key(pending) <= key:
+            if child_key(pending) == key:
+                group.append(pending)
+            pending = await anext(children, None)
+        yield parent, reduce(group)
+
+
+async def _chunks(pieces: AsyncIterator[str], name: str) -> AsyncIterator[str]:
+    buffer, size, first = [], 0, True
+    try:
+        async for piece in pieces:
+            if first:
+                yield piece
+                first = False
+                continue
+            buffer.append(piece)
+            size += len(piece)
+            if size >= STREAM_CHUNK_SIZE:
+                yield "".join(buffer)
+                buffer, size = [], 0
+    except Exception:
+        logger.exception("Streaming %s failed part way through", name)
+        yield "".join(buffer) + INCOMPLETE_NOTICE
+        raise
+    if buffer:
+        yield "".join(buffer)
+
+
+def stream_template(templates, name: str, context: dict, headers: dict | None = None) -> StreamingResponse:
+    template = _async_env(templates).get_template(name)
+    return StreamingResponse(_chunks(template.generate_async(context), name), media_type="text/html",
+                             headers=headers)
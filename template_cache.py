@@ -0,0 +1,111 @@
+"""
+Production settings for the Jinja environment and a fragment cache.
+
+configure(templates) turns on a persistent bytecode cache (compiled templates
+survive restarts and are shared between workers) and disables auto-reload
+unless TEMPLATE_AUTO_RELOAD=1, so templates are no longer stat()ed on every
+render. It also adds a {% cache %} tag that keeps rendered sections in memory:
+
+    {% cache "admin-students", user_id, fragment_version %}
+        ... expensive loop ...
+    {% endcache %}
+
+The key is built from the tag's arguments, so routes pass a version from
+data_versions.version_key() and any write in the scopes it covers makes the
+old entry unreachable; it then ages out of the LRU.
+"""
+from __future__ import annotations
+import os
+import threading
+from collections import OrderedDict
+from jinja2 import nodes
+from jinja2.bccache import FileSystemBytecodeCache
+from jinja2.ext import Extension
+from markupsafe import Markup
+from metrics import inc
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+TEMPLATE_CACHE_DIR = os.getenv("TEMPLATE_CACHE_DIR", os.path.join(BASE_DIR, ".jinja_cache"))
+TEMPLATE_AUTO_RELOAD = os.getenv("TEMPLATE_AUTO_RELOAD", "0") == "1"
+FRAGMENT_CACHE_SIZE = int(os.getenv("FRAGMENT_CACHE_SIZE", "256"))
+
+
+class FragmentCache:
+    """Thread-safe LRU of rendered fragments; sync routes render from the thread pool."""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._entries: OrderedDict[tuple, str] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: tuple) -> str | None:
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: tuple, value: str) -> None:
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+fragments = FragmentCache(FRAGMENT_CACHE_SIZE)
+
+
+class FragmentCacheExtension(Extension):
+    tags = {"cache"}
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        args = [parser.parse_expression()]
+        while parser.stream.skip_if("comma"):
+            args.append(parser.parse_expression())
+        body = parser.parse_statements(("name:endcache",), drop_needle=True)
+        key = nodes.Tuple([nodes.Const(parser.name)] + args, "load")
+        method = "_render_async" if self.environment.is_async else "_render"
+        return nodes.CallBlock(self.call_method(method, [key]), [], [], body).set_lineno(lineno)
+
+    @staticmethod
+    def _lookup(key: tuple) -> tuple[tuple, str | None]:
+        key = tuple(str(part) for part in key)
+        cached = fragments.get(key)
+        inc("cache_requests_total", (("cache", "template_fragment"), ("outcome", "miss" if cached is None else "hit")))
+        return key, cached
+
+    def _render(self, key: tuple, caller) -> str:
+        if FRAGMENT_CACHE_SIZE <= 0:
+            return caller()
+        key, cached = self._lookup(key)
+        if cached is not None:
+            return Markup(cached)
+        rendered = caller()
+        fragments.set(key, str(rendered))
+        return rendered
+
+    async def _render_async(self, key: tuple, caller) -> str:
+        # async environments (see streaming.py) render the body as a coroutine
+        if FRAGMENT_CACHE_SIZE <= 0:
+            return await caller()
+        key, cached = self._lookup(key)
+        if cached is not None:
+            return Markup(cached)
+        rendered = await caller()
+        fragments.set(key, str(rendered))
+        return rendered
+
+
+def configure(templates) -> None:
+    """Applies the bytecode cache, auto-reload setting and {% cache %} tag to a Jinja2Templates."""
+    env = templates.env
+    os.makedirs(TEMPLATE_CACHE_DIR, exist_ok=True)
+    env.bytecode_cache = FileSystemBytecodeCache(TEMPLATE_CACHE_DIR)
+    env.auto_reload = TEMPLATE_AUTO_RELOAD
+    env.add_extension(FragmentCacheExtension)
@@ -0,0 +1,84 @@
+"""
+Insights prompt: long histories are compacted into digests and a few quoted records within the token budget.
+
+    python -m pytest -q test_ai_feedback_prompt.py
+"""
+import os
+import re
+import tempfile
+from datetime import date, timedelta
+
+# Scratch database and no Gemini key, set before the app reads its configuration
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='insights-'), 'test.db')}"
+os.environ["GOOGLE_API_KEY"] = ""
+
+import pytest  # noqa: E402
+
+from ai_feedback import estimate_tokens, format_data_for_ai  # noqa: E402
+from models import Attendance, Journal, TestRecord  # noqa: E402
+
+BUDGET = 2000
+NEWEST = date(2025, 6, 30)
+
+
+def _test(subject: str, days_ago: int, marks: int, remarks: str = "Steady work") -> TestRecord:
+    return TestRecord(student_id=1, subject=subject, topic="Revision", test_date=NEWEST - timedelta(days=days_ago),
+                      total_marks=100, marks_attained=marks, remarks=remarks)
+
+
+def _journal(subject: str, days_ago: int) -> Journal:
+    return Journal(student_id=1, subject=subject, entry_date=NEWEST - timedelta(days=days_ago),
+                   journal="Covered the chapter exercises", remarks="Needs more practice")
+
+
+def _context(tests: list, journals: list = ()) -> dict:
+    attendance = [Attendance(student_id=1, attendance_date=NEWEST, status="Present")]
+    return {"tests": tests, "journals": list(journals), "attendance": attendance}
+
+
+def _quoted_dates(prompt: str, section: str) -> list[str]:
+    block = prompt.split(section, 1)[1].split("\n\n", 1)[0]
+    return re.findall(r"^- Date: (\S+),", block, re.MULTILINE)
+
+
+def test_short_history_is_quoted_in_full():
+    context = _context([_test("Mathematics", 3, 70), _test("Science", 1, 80)], [_journal("Mathematics", 2)])
+    prompt = format_data_for_ai(context, BUDGET)
+    assert "Subject Summaries" not in prompt
+    assert prompt.count("- Date:") == 3
+
+
+@pytest.mark.parametrize("subjects", [20, 60, 200])
+def test_prompt_stays_within_the_budget(subjects):
+    tests = [_test(f"Subject {s:03}", day, 40 + (s + day) % 50) for s in range(subjects) for day in range(0, 60, 6)]
+    journals = [_journal(f"Subject {s:03}", day) for s in range(subjects) for day in range(0, 60, 15)]
+    prompt = format_data_for_ai(_context(tests, journals), BUDGET)
+    assert estimate_tokens(prompt) <= BUDGET
+    summaries = prompt.split("Subject Summaries", 1)[1].split("\n\n", 1)[0]
+    covered = len(re.findall(r"^- Subject \d+:", summaries, re.MULTILINE))
+    other = re.search(r"^- (\d+) other subjects:", summaries, re.MULTILINE)
+    assert covered + (int(other.group(1)) if other else 0) == subjects  # every subject is summarized somewhere
+    assert "Test Records (" in prompt  # and the digests leave room for quoted records
+
+
+def test_quoted_records_keep_chronological_order():
+    # newest first, as an unordered query might return them
+    tests = [_test(subject, day, 60 + day % 30) for subject in ("Mathematics", "Science") for day in range(120)]
+    prompt = format_data_for_ai(_context(tests), BUDGET)
+    dates = _quoted_dates(prompt, "Test Records (")
+    assert len(dates) < len(tests)
+    assert dates == sorted(dates)
+    assert dates[-1] == NEWEST.isoformat()
+
+
+def test_unusual_result_is_flagged_and_kept():
+    tests = [_test("Mathematics", day, 80 + day % 3) for day in range(1, 150)]
+    tests.append(_test("Mathematics", 7, 15, remarks="Left most questions blank"))
+    prompt = format_data_for_ai(_context(tests), BUDGET)
+    [outlier] = [line for line in prompt.splitlines() if "Left most questions blank" in line]
+    assert re.search(r"\(unusual: subject average 8\d%\)$", outlier)
+    assert prompt.count("(unusual") == 1  # ordinary results are not flagged
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main(["-q", __file__]))
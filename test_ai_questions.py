@@ -0,0 +1,93 @@
+"""
+Question papers: what is saved when Gemini's stream ends, well or early.
+
+    python -m pytest -q test_ai_questions.py
+"""
+import asyncio
+import os
+import tempfile
+
+# Scratch database and no Gemini key, set before the app reads its configuration
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='questions-'), 'test.db')}"
+os.environ["GOOGLE_API_KEY"] = ""
+
+import pytest  # noqa: E402
+from sqlmodel import SQLModel, Session  # noqa: E402
+
+import ai_questions  # noqa: E402
+import gemini  # noqa: E402
+from db import engine  # noqa: E402
+from gemini import GeminiError, GeminiUnavailable  # noqa: E402
+from models import User, Tutor, Student, QuestionPaper  # noqa: E402
+
+
+@pytest.fixture(scope="module")
+def student_id() -> int:
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        admin = User(username="questions_admin", password="x", user_type="admin")
+        session.add(admin)
+        session.commit()
+        tutor = Tutor(name="Tutor", subject="Science", phone="0", user_id=admin.id)
+        session.add(tutor)
+        session.commit()
+        student = Student(name="Asked", grade="7", syllabus="CBSE", tutor_id=tutor.id)
+        session.add(student)
+        session.commit()
+        return student.id
+
+
+@pytest.fixture
+def generate(student_id, monkeypatch):
+    """Runs a generation against a scripted Gemini stream; returns the paper as saved and the pieces sent."""
+    monkeypatch.setattr(gemini, "GEMINI_API_KEY", "test-key")
+
+    def run(stream):
+        monkeypatch.setattr(gemini, "stream", lambda payload, caller: stream())
+        with Session(engine) as session:
+            paper = ai_questions._new_paper(session, student_id, "test", "Science", "Light")
+
+        async def follow():
+            generation = ai_questions.start_generation(paper.id, "prompt")
+            return [piece async for piece in generation.follow()]
+
+        sent = asyncio.run(follow())
+        with Session(engine) as session:
+            return session.get(QuestionPaper, paper.id), "".join(sent)
+    return run
+
+
+def test_finished_stream_is_saved_complete(generate):
+    def stream():
+        yield "Q1. What is light?\n"
+        yield "Q2. Why is the sky blue?\n"
+
+    paper, sent = generate(stream)
+    assert paper.status == "complete"
+    assert paper.text == sent == "Q1. What is light?\nQ2. Why is the sky blue?\n"
+
+
+def test_stream_failing_part_way_is_saved_failed(generate):
+    def stream():
+        yield "Q1. What is light?\n"
+        raise GeminiError("stream interrupted: ReadTimeout")
+
+    paper, sent = generate(stream)
+    assert paper.status == "failed"
+    assert paper.text == sent
+    assert paper.text.startswith("Q1. What is light?\n")  # what was written is kept
+    assert paper.text.endswith("API Call Error: stream interrupted: ReadTimeout")
+
+
+def test_unavailable_gemini_is_saved_failed(generate):
+    def stream():
+        raise GeminiUnavailable(30)
+        yield
+
+    paper, _ = generate(stream)
+    assert paper.status == "failed"
+    assert "Try again in 30 seconds" in paper.text
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main(["-q", __file__]))
@@ -0,0 +1,271 @@
+"""
+Gemini client: retries, Retry-After, the circuit breaker, hedging and stream timeouts.
+
+No request leaves the process: gemini._send is replaced by a stub that plays
+back scripted responses, and time.sleep by one that only records the waits.
+
+    python -m pytest -q test_gemini.py
+"""
+import os
+import threading
+import time
+from email.utils import formatdate
+
+os.environ["GOOGLE_API_KEY"] = "test-key"
+
+import pytest  # noqa: E402
+import requests  # noqa: E402
+
+import gemini  # noqa: E402
+from gemini import GeminiError, GeminiUnavailable  # noqa: E402
+from metrics import snapshot  # noqa: E402
+
+CALLER = "test"
+
+
+def _response(status: int, body: bytes = b"{}", headers: dict | None = None) -> requests.Response:
+    response = requests.Response()
+    response.status_code = status
+    response.headers.update(headers or {})
+    response._content = body
+    response._content_consumed = True
+    return response
+
+
+def _counter(name: str) -> int:
+    return snapshot()[0].get((name, (("caller", CALLER),)), 0)
+
+
+class Script:
+    """Stands in for gemini._send: answers each call with the next item, raising it if it is an exception."""
+
+    def __init__(self, *outcomes):
+        self.outcomes = list(outcomes)
+        self.calls = []
+
+    def __call__(self, url, payload, params, timeout, stream=False):
+        self.calls.append(timeout)
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, BaseException):
+            raise outcome
+        return outcome
+
+
+@pytest.fixture(autouse=True)
+def client(monkeypatch):
+    """A fresh breaker, no hedging, no real sleeping; returns the list of requested sleeps."""
+    monkeypatch.setattr(gemini, "breaker", gemini.CircuitBreaker(threshold=5, cooldown=30))
+    monkeypatch.setattr(gemini, "GEMINI_MAX_ATTEMPTS", 4)
+    monkeypatch.setattr(gemini, "GEMINI_HEDGE_AFTER", 0)
+    monkeypatch.setattr(gemini, "_backoff", lambda attempt: 0.1)
+    sleeps = []
+    monkeypatch.setattr(gemini.time, "sleep", sleeps.append)
+    return sleeps
+
+
+def _script(monkeypatch, *outcomes) -> Script:
+    script = Script(*outcomes)
+    monkeypatch.setattr(gemini, "_send", script)
+    return script
+
+
+# ---------------- Retries ----------------
+def test_retries_until_success(monkeypatch, client):
+    script = _script(monkeypatch, _response(503), requests.exceptions.ConnectionError("reset"),
+                     _response(200, b'{"ok": 1}'))
+    retries = _counter("gemini_retries_total")
+    assert gemini.generate({}, caller=CALLER) == {"ok": 1}
+    assert len(script.calls) == 3
+    assert client == [0.1, 0.1]
+    assert _counter("gemini_retries_total") - retries == 2
+    assert gemini.breaker.failures == 0
+
+
+def test_gives_up_after_max_attempts(monkeypatch):
+    script = _script(monkeypatch, *[_response(503)] * 4)
+    with pytest.raises(GeminiError, match=r"HTTP 503 \(gave up after 4 attempts\)"):
+        gemini.generate({}, caller=CALLER)
+    assert len(script.calls) == 4
+
+
+def test_client_errors_are_not_retried(monkeypatch):
+    script = _script(monkeypatch, _response(400, b"bad request"))
+    with pytest.raises(GeminiError, match="HTTP 400: bad request"):
+        gemini.generate({}, caller=CALLER)
+    assert len(script.calls) == 1
+    assert gemini.breaker.failures == 0  # Gemini answered; it is not down
+
+
+def test_attempts_share_the_deadline(monkeypatch):
+    script = _script(monkeypatch, _response(503), _response(200))
+    gemini.generate({}, caller=CALLER, deadline=10)
+    connect, read = script.calls[1]
+    assert connect <= gemini.GEMINI_CONNECT_TIMEOUT and read <= 10
+
+
+# ---------------- Retry-After ----------------
+def test_retry_after_seconds_sets_the_wait(monkeypatch, client):
+    _script(monkeypatch, _response(429, headers={"Retry-After": "7"}), _response(200))
+    gemini.generate({}, caller=CALLER)
+    assert client == [7.0]
+
+
+def test_retry_after_http_date():
+    response = _response(503, headers={"Retry-After": formatdate(time.time() + 20, usegmt=True)})
+    assert 18 <= gemini._retry_after(response) <= 20
+    assert gemini._retry_after(_response(503, headers={"Retry-After": "soon"})) is None
+    assert gemini._retry_after(_response(503)) is None
+
+
+def test_retry_after_past_the_deadline_gives_up(monkeypatch, client):
+    script = _script(monkeypatch, _response(429, headers={"Retry-After": "120"}), _response(200))
+    with pytest.raises(GeminiError, match="HTTP 429"):
+        gemini.generate({}, caller=CALLER, deadline=30)
+    assert len(script.calls) == 1
+    assert client == []
+
+
+# ---------------- Circuit breaker ----------------
+def _open_breaker(monkeypatch):
+    threshold = gemini.breaker.threshold
+    monkeypatch.setattr(gemini, "GEMINI_MAX_ATTEMPTS", threshold)
+    _script(monkeypatch, *[_response(503)] * threshold)
+    with pytest.raises(GeminiError):
+        gemini.generate({}, caller=CALLER)
+    assert gemini.breaker.state == "open"
+
+
+def _cool_down():
+    gemini.breaker.opened_at -= gemini.breaker.cooldown + 1
+
+
+def test_breaker_opens_and_fails_fast(monkeypatch):
+    _open_breaker(monkeypatch)
+    script = _script(monkeypatch, _response(200))
+    rejections = _counter("gemini_circuit_rejections_total")
+    with pytest.raises(GeminiUnavailable) as raised:
+        gemini.generate({}, caller=CALLER)
+    assert script.calls == []
+    assert 1 <= raised.value.retry_after <= 30
+    assert _counter("gemini_circuit_rejections_total") - rejections == 1
+
+
+def test_one_probe_closes_the_breaker(monkeypatch):
+    _open_breaker(monkeypatch)
+    _cool_down()
+    assert gemini.breaker.state == "half-open"
+    during_probe = []
+
+    def probe(url, payload, params, timeout, stream=False):
+        try:
+            gemini.breaker.allow()  # a second caller while the probe is out
+        except GeminiUnavailable:
+            during_probe.append("rejected")
+        return _response(200, b'{"ok": 1}')
+
+    monkeypatch.setattr(gemini, "_send", probe)
+    assert gemini.generate({}, caller=CALLER) == {"ok": 1}
+    assert during_probe == ["rejected"]
+    assert gemini.breaker.state == "closed"
+
+
+def test_failed_probe_reopens_the_breaker(monkeypatch):
+    _open_breaker(monkeypatch)
+    _cool_down()
+    script = _script(monkeypatch, _response(503), _response(200))
+    with pytest.raises(GeminiUnavailable):
+        gemini.generate({}, caller=CALLER)
+    assert len(script.calls) == 1
+    assert gemini.breaker.state == "open"
+
+
+def test_probe_is_released_after_an_unexpected_error(monkeypatch):
+    _open_breaker(monkeypatch)
+    _cool_down()
+    _script(monkeypatch, ValueError("bad payload"))
+    with pytest.raises(ValueError):
+        gemini.generate({}, caller=CALLER)
+    assert gemini.breaker.allow() is True  # the next caller may probe instead of failing fast forever
+
+
+# ---------------- Hedging ----------------
+def test_slow_attempt_is_hedged(monkeypatch):
+    monkeypatch.setattr(gemini, "GEMINI_HEDGE_AFTER", 0.05)
+    first_sent = threading.Event()
+    release = threading.Event()
+
+    def send(url, payload, params, timeout, stream=False):
+        if not first_sent.is_set():
+            first_sent.set()
+            release.wait(5)
+            return _response(200, b'{"answer": "slow"}')
+        return _response(200, b'{"answer": "fast"}')
+
+    monkeypatch.setattr(gemini, "_send", send)
+    hedged = _counter("gemini_hedged_requests_total")
+    try:
+        assert gemini.generate({}, caller=CALLER) == {"answer": "fast"}
+    finally:
+        release.set()
+    assert _counter("gemini_hedged_requests_total") - hedged == 1
+
+
+def test_fast_attempt_is_not_hedged(monkeypatch):
+    monkeypatch.setattr(gemini, "GEMINI_HEDGE_AFTER", 5)
+    script = _script(monkeypatch, _response(200, b'{"answer": "only"}'))
+    assert gemini.generate({}, caller=CALLER) == {"answer": "only"}
+    assert len(script.calls) == 1
+
+
+# ---------------- Streams ----------------
+class _Socket:
+    def __init__(self):
+        self.timeouts = []
+
+    def settimeout(self, value):
+        self.timeouts.append(value)
+
+
+class _StreamResponse:
+    status_code = 200
+    ok = True
+
+    def __init__(self, lines):
+        self.lines = lines
+        self.sock = _Socket()
+        self.raw = type("Raw", (), {"connection": type("Connection", (), {"sock": self.sock})()})()
+
+    def iter_lines(self, chunk_size=None):
+        return iter(self.lines)
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def test_stream_waits_for_events_with_the_stream_timeout(monkeypatch):
+    monkeypatch.setattr(gemini, "GEMINI_DEADLINE", 10)
+    monkeypatch.setattr(gemini, "GEMINI_STREAM_TIMEOUT", 60)
+    response = _StreamResponse([b'data: {"candidates": [{"content": {"parts": [{"text": "Q1"}]}}]}', b"",
+                                b'data: {"candidates": [{"content": {"parts": [{"text": "Q2"}]}}]}'])
+    script = _script(monkeypatch, response)
+    assert list(gemini.stream({}, caller=CALLER, deadline=300)) == ["Q1", "Q2"]
+    assert script.calls[0][1] <= 10  # the first byte is held to GEMINI_DEADLINE
+    assert response.sock.timeouts == [60]  # later reads are not
+
+
+def test_stream_timeout_is_capped_by_the_stream_deadline(monkeypatch):
+    monkeypatch.setattr(gemini, "GEMINI_STREAM_TIMEOUT", 60)
+    response = _StreamResponse([])
+    _script(monkeypatch, response)
+    assert list(gemini.stream({}, caller=CALLER, deadline=20)) == []
+    assert 19 <= response.sock.timeouts[0] <= 20
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main(["-q", __file__]))
@@ -0,0 +1,243 @@
+"""
+Query-budget regression tests.
+
+Every GET route of the app, plus the form posts listed in POST_CASES, is
+requested as an admin and as a tutor against a seeded SQLite database, first
+at the SMALL data size and again after growing it to LARGE. Each route must
+stay within its statement and fetched-row budget, and must issue the same number
+of statements at both sizes: a count that grows with the data is an N+1.
+Lazy relationship loads raise during these tests, so templates cannot hide
+queries behind attribute access.
+
+    python -m pytest -q test_query_budget.py
+"""
+import os
+import tempfile
+from datetime import date, timedelta
+
+# Scratch database and no Gemini key, set before the app reads its configuration
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='query-budget-'), 'test.db')}"
+os.environ["GOOGLE_API_KEY"] = ""
+# Any relationship a template touches without eager loading fails the route
+os.environ["SQL_RAISE_ON_LAZY_LOAD"] = "1"
+# Streamed pages read one query per batch by design; a batch larger than any
+# seeded page keeps their statement counts comparable across sizes
+os.environ["STREAM_BATCH_SIZE"] = "5000"
+
+import pytest  # noqa: E402
+from fastapi.routing import APIRoute  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+from sqlalchemy import event, insert  # noqa: E402
+from sqlmodel import SQLModel, Session, select  # noqa: E402
+
+import query_audit  # noqa: E402
+from main import app  # noqa: E402
+from db import engine  # noqa: E402
+from models import User, Tutor, Student, Journal, Attendance, TestRecord, UpcomingTest, QuestionPaper  # noqa: E402
+from rankings import refresh_rankings  # noqa: E402
+
+TUTORS = 2
+# (students per tutor, history rows per student of each kind)
+SMALL = (3, 5)
+LARGE = (12, 40)
+
+DEFAULT_STATEMENTS = 8
+DEFAULT_ROWS = 20
+# Per-route (statements, rows fetched) at the LARGE size, where the default is not enough
+BUDGETS = {
+    "GET /admin-dashboard": (8, 45),
+    "GET /tutor-dashboard": (8, 30),
+    "GET /reports": (4, 30),
+    # every test of every student the caller sees (24 x 40 at LARGE), by design
+    "GET /reports/all/download": (5, 1020),
+    "GET /all_tests": (5, 970),
+    # this month's attendance for every student the caller sees: up to 31 x 24 at LARGE
+    "GET /attendance": (6, 750),
+    "GET /api/v1/attendance/grid": (DEFAULT_STATEMENTS, 750),
+    "GET /attendance-today": (3, 60),
+    "GET /upcoming-tests": (5, 35),
+    "GET /upcoming-tests/add": (4, 40),
+    "GET /api/v1/students": (DEFAULT_STATEMENTS, 30),
+    "GET /api/v1/tests": (DEFAULT_STATEMENTS, 60),
+    "GET /api/v1/upcoming-tests": (DEFAULT_STATEMENTS, 35),
+    "GET /api/v1/students/{student_id}/tests": (DEFAULT_STATEMENTS, 45),
+    "GET /api/v1/students/{student_id}/journals": (DEFAULT_STATEMENTS, 45),
+    "GET /api/v1/students/{student_id}/attendance": (DEFAULT_STATEMENTS, 45),
+    "GET /reports/student/{student_id}": (9, 60),
+    "GET /reports/student/{student_id}/download": (6, 60),
+    "GET /student/{student_id}/tests": (6, 50),
+    "GET /student/{student_id}/journal": (5, 45),
+    "GET /student/{student_id}/attendance-view": (5, 60),
+    "GET /student/{student_id}/insights": (9, 90),
+    "GET /insights/student/{student_id}/{period}/data": (5, 150),
+    "POST /insights/student/{student_id}/{period}/ai": (6, 150),
+    # the insert plus the subject ranking rebuild, scope lookup and data-version upsert
+    "POST /student/{student_id}/tests/add": (9, 20),
+}
+
+SKIPPED = {
+    "/profiles/{name}",  # serves files from disk, no database access
+    "/student/{student_id}/transfer",  # transfer_student.html does not exist yet
+}
+STUDENT_ID = 1
+TUTOR_ID = 1
+JOURNAL_ID = 1
+PAPER_ID = 1
+PATH_VALUES = {"student_id": STUDENT_ID, "tutor_id": TUTOR_ID, "journal_id": JOURNAL_ID, "paper_id": PAPER_ID,
+               "period": "last-6-months"}
+
+POST_CASES = [
+    ("/student/{student_id}/tests/add", {"data": {
+        "subject": "Mathematics", "topic": "Fractions", "test_date": date.today().isoformat(),
+        "total_marks": 25, "marks_attained": 20, "remarks": "Good",
+    }}),
+    ("/student/{student_id}/journal/add", {"data": {
+        "tutor_id": TUTOR_ID, "subject": "Mathematics", "journal": "Revision", "remarks": "On track",
+        "entry_date": date.today().isoformat(),
+    }}),
+    ("/student/{student_id}/edit", {"data": {
+        "name": "Student 1-1", "grade": "8", "school": "School", "syllabus": "CBSE",
+        "focus_subjects": "Mathematics", "subject": "Mathematics", "remarks": "",
+    }}),
+    ("/attendance/update", {"json": {
+        "student_id": STUDENT_ID, "date": date.today().isoformat(), "status": "present",
+    }}),
+    ("/insights/student/{student_id}/{period}/ai", {}),
+]
+
+
+# ---------------- Seeding ----------------
+def _setup_accounts(session: Session) -> None:
+    admin = User(username="budget_admin", password="x", user_type="admin")
+    session.add(admin)
+    session.commit()
+    for t in range(TUTORS):
+        tutor = Tutor(name=f"Tutor {t + 1}", subject="Mathematics", phone="0", user_id=admin.id)
+        session.add(tutor)
+        session.commit()
+        session.add(User(username=f"budget_tutor_{t + 1}", password="x", user_type="tutor", tutor_id=tutor.id))
+    session.commit()
+
+
+def _grow(session: Session, students_per_tutor: int, rows: int) -> None:
+    """Tops the database up to `students_per_tutor` students per tutor and `rows` history rows per student."""
+    today = date.today()
+    for tutor in session.exec(select(Tutor)).all():
+        existing = session.exec(select(Student).where(Student.tutor_id == tutor.id)).all()
+        session.execute(insert(Student), [
+            {"name": f"Student {tutor.id}-{i + 1}", "grade": "8", "school": "School", "syllabus": "CBSE",
+             "focus_subjects": "Mathematics", "subject": "Mathematics", "remarks": "", "tutor_id": tutor.id}
+            for i in range(len(existing), students_per_tutor)
+        ])
+    if session.get(QuestionPaper, PAPER_ID) is None:
+        session.add(QuestionPaper(id=PAPER_ID, student_id=STUDENT_ID, question_type="syllabus",
+                                  subject="Mathematics", topics="Fractions", status="complete", text="Q1."))
+    session.commit()
+
+    for student in session.exec(select(Student)).all():
+        have = len(session.exec(select(TestRecord.id).where(TestRecord.student_id == student.id)).all())
+        days = [today - timedelta(days=d) for d in range(have, rows)]
+        if not days:
+            continue
+        session.execute(insert(Attendance), [
+            {"student_id": student.id, "attendance_date": d, "status": "present"} for d in days])
+        session.execute(insert(TestRecord), [
+            {"student_id": student.id, "subject": "Mathematics", "topic": "Fractions", "test_date": d,
+             "total_marks": 25, "marks_attained": 10 + d.day % 15, "remarks": "Good"} for d in days])
+        session.execute(insert(Journal), [
+            {"student_id": student.id, "tutor_name": "Tutor", "subject": "Mathematics", "journal": "Revision",
+             "remarks": "On track", "entry_date": d} for d in days])
+        session.execute(insert(UpcomingTest), [
+            {"student_id": student.id, "subject": "Mathematics", "topics": "Algebra",
+             "test_date": today + timedelta(days=len(days))}])
+    session.commit()
+    refresh_rankings(session)
+
+
+# ---------------- Measurement ----------------
+def _get_cases() -> list[tuple[str, str]]:
+    cases = []
+    for route in app.routes:
+        if isinstance(route, APIRoute) and "GET" in route.methods and route.path not in SKIPPED:
+            cases.append(("GET", route.path))
+    return cases + [("POST", path) for path, _ in POST_CASES]
+
+
+CASES = _get_cases()
+ROLES = ["budget_admin", "budget_tutor_1"]
+
+# Streamed pages keep querying after the X-DB-* headers are sent, so statements
+# are counted at the engine and rows taken from the finished audit, body included
+_statements = [0]
+_audits = []
+_report = query_audit.QueryAuditMiddleware._report
+
+
+@event.listens_for(engine, "before_cursor_execute")
+def _count_statement(*args):
+    _statements[0] += 1
+
+
+def _keep_audit(self, scope, audit):
+    _audits.append(audit)
+    _report(self, scope, audit)
+
+
+query_audit.QueryAuditMiddleware._report = _keep_audit
+
+
+def _request(client: TestClient, method: str, path: str):
+    url = path.format(**PATH_VALUES)
+    if method == "GET":
+        return client.get(url, follow_redirects=False)
+    return client.post(url, follow_redirects=False, **dict(POST_CASES)[path])
+
+
+def _measure_all() -> dict:
+    results = {}
+    for username in ROLES:
+        client = TestClient(app, cookies={"username": username}, raise_server_exceptions=False)
+        for method, path in CASES:
+            _statements[0] = 0
+            _audits.clear()
+            response = _request(client, method, path)
+            results[(username, method, path)] = (
+                _statements[0],
+                sum(audit.rows for audit in _audits),
+                response.status_code,
+            )
+    return results
+
+
+@pytest.fixture(scope="module")
+def measurements():
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        _setup_accounts(session)
+        _grow(session, *SMALL)
+        small = _measure_all()
+        _grow(session, *LARGE)
+        large = _measure_all()
+    return small, large
+
+
+@pytest.mark.parametrize("username", ROLES)
+@pytest.mark.parametrize("method,path", CASES)
+def test_route_within_budget(measurements, username, method, path):
+    statements, rows, status = measurements[1][(username, method, path)]
+    max_statements, max_rows = BUDGETS.get(f"{method} {path}", (DEFAULT_STATEMENTS, DEFAULT_ROWS))
+    assert status < 500, f"{method} {path} failed with {status}"
+    assert statements <= max_statements, f"{method} {path} issued {statements} statements (budget {max_statements})"
+    assert rows <= max_rows, f"{method} {path} fetched {rows} rows (budget {max_rows})"
+
+
+@pytest.mark.parametrize("username", ROLES)
+@pytest.mark.parametrize("method,path", CASES)
+def test_statements_do_not_grow_with_data(measurements, username, method, path):
+    small, large = measurements
+    before, after = small[(username, method, path)][0], large[(username, method, path)][0]
+    assert before == after, f"{method} {path} went from {before} to {after} statements as the data grew"
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main(["-q", __file__]))
@@ -0,0 +1,84 @@
+"""
+Roster typeahead: lookups running while this process's commits update the cached index.
+
+    python -m pytest -q test_roster.py
+"""
+import os
+import sys
+import tempfile
+import threading
+
+# Scratch database and no Gemini key, set before the app reads its configuration
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='roster-'), 'test.db')}"
+os.environ["GOOGLE_API_KEY"] = ""
+
+import pytest  # noqa: E402
+from sqlmodel import SQLModel, Session  # noqa: E402
+
+from main import roster  # noqa: E402  through the app, which registers roster.track_writes()
+from db import engine  # noqa: E402
+from models import User, Tutor, Student  # noqa: E402
+
+
+@pytest.fixture(scope="module")
+def tenant() -> tuple[int, list[int]]:
+    """One admin with a tutor and 200 students; returns the admin id and the student ids."""
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        admin = User(username="roster_admin", password="x", user_type="admin")
+        session.add(admin)
+        session.commit()
+        tutor = Tutor(name="Meera Iyer", subject="Mathematics", phone="0", user_id=admin.id)
+        session.add(tutor)
+        session.commit()
+        students = [Student(name=f"Priya Nair {i}", grade="8", syllabus="CBSE", tutor_id=tutor.id)
+                    for i in range(200)]
+        session.add_all(students)
+        session.commit()
+        return admin.id, [s.id for s in students]
+
+
+def test_search_while_commits_update_the_index(tenant):
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-5)  # switch threads often, so reads land inside updates
+    tenant_id, student_ids = tenant
+    with Session(engine) as session:
+        index = roster.get_index(session, tenant_id)
+    done = threading.Event()
+    errors = []
+
+    def write():
+        try:
+            with Session(engine) as session:
+                for round_ in range(4):
+                    for student_id in student_ids:  # every rename is a remove and an add in the index
+                        session.get(Student, student_id).name = f"Priya Nair {student_id} {'ab'[round_ % 2]}"
+                    session.commit()
+        finally:
+            done.set()
+
+    def read():
+        while not done.is_set():
+            try:
+                index.search("pri")
+                index.search("priay nar")  # a typo, so the trigram matches are read too
+            except Exception as e:
+                errors.append(e)
+
+    threads = [threading.Thread(target=write)] + [threading.Thread(target=read) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    try:
+        for thread in threads:
+            thread.join()
+    finally:
+        sys.setswitchinterval(interval)
+
+    assert errors == []
+    with Session(engine) as session:
+        assert roster.get_index(session, tenant_id) is index  # updated in place, not rebuilt
+    assert len(index.search("priya", limit=len(student_ids))) == len(student_ids)
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main(["-q", __file__]))
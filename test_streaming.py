@@ -0,0 +1,112 @@
+"""
+Streamed pages: batched row sources and failures part way through a body.
+
+    python -m pytest -q test_streaming.py
+"""
+import asyncio
+import os
+import tempfile
+from datetime import date, timedelta
+
+# Scratch database, set before the app reads its configuration
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='streaming-'), 'test.db')}"
+
+import pytest  # noqa: E402
+from fastapi.templating import Jinja2Templates  # noqa: E402
+from sqlmodel import SQLModel, Session  # noqa: E402
+
+from db import engine  # noqa: E402
+from models import User, Tutor, Student, TestRecord  # noqa: E402
+from read_models import TestRow, select_rows  # noqa: E402
+from streaming import INCOMPLETE_NOTICE, stream_rows, stream_template  # noqa: E402
+
+KEYS = (TestRecord.test_date, TestRecord.id)
+
+
+@pytest.fixture(scope="module")
+def student_id() -> int:
+    """One student with eleven tests, several on the same day, so batches split ties."""
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        admin = User(username="stream_admin", password="x", user_type="admin")
+        session.add(admin)
+        session.commit()
+        tutor = Tutor(name="Tutor", subject="Mathematics", phone="0", user_id=admin.id)
+        session.add(tutor)
+        session.commit()
+        student = Student(name="Streamed", grade="8", syllabus="CBSE", tutor_id=tutor.id)
+        session.add(student)
+        session.commit()
+        for i in range(11):
+            session.add(TestRecord(student_id=student.id, subject="Mathematics", topic=f"Topic {i}",
+                                   test_date=date(2025, 1, 1) + timedelta(days=i // 3),
+                                   total_marks=25, marks_attained=i, remarks=""))
+        session.commit()
+        return student.id
+
+
+def _collect(rows) -> list:
+    async def run():
+        return [row async for row in rows]
+    return asyncio.run(run())
+
+
+def _statement(student_id: int):
+    return select_rows(TestRow).where(TestRecord.student_id == student_id)
+
+
+def test_batches_cover_every_row_in_order(student_id):
+    with Session(engine) as session:
+        expected = [TestRow._make(row) for row in session.execute(
+            _statement(student_id).order_by(*(key.desc() for key in KEYS)))]
+    for batch_size in (1, 2, 3, 11, 50):
+        streamed = _collect(stream_rows(TestRow, _statement(student_id), keys=KEYS, descending=True,
+                                        batch_size=batch_size))
+        assert streamed == expected, f"batch_size={batch_size}"
+
+
+def test_no_connection_is_held_between_batches(student_id):
+    checked_out = []
+
+    async def run():
+        async for _ in stream_rows(TestRow, _statement(student_id), keys=KEYS, batch_size=2):
+            checked_out.append(engine.pool.checkedout())
+    asyncio.run(run())
+    assert len(checked_out) == 11
+    assert set(checked_out) == {0}
+
+
+def test_failure_mid_stream_aborts_the_response(tmp_path, caplog):
+    (tmp_path / "rows.html").write_text("<ul>{% for row in rows %}<li>{{ row }}</li>{% endfor %}</ul>")
+    templates = Jinja2Templates(directory=str(tmp_path))
+
+    async def rows():
+        yield 1
+        yield 2
+        raise RuntimeError("database went away")
+
+    sent = []
+
+    async def receive():
+        await asyncio.Event().wait()  # the client never disconnects
+
+    async def send(message):
+        sent.append(message)
+
+    async def run():
+        response = stream_template(templates, "rows.html", {"rows": rows()})
+        await response({"type": "http", "method": "GET", "path": "/rows", "headers": []}, receive, send)
+
+    with pytest.raises(Exception):
+        asyncio.run(run())  # the server sees the error and drops the connection
+
+    assert sent[0]["type"] == "http.response.start" and sent[0]["status"] == 200
+    body = "".join(m["body"].decode() for m in sent[1:])
+    assert body.startswith("<ul><li>1</li><li>2</li>")
+    assert body.endswith(INCOMPLETE_NOTICE)
+    assert all(m.get("more_body") for m in sent[1:]), "the body must not be ended as if it were complete"
+    assert "Streaming rows.html failed part way through" in caplog.text
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main(["-q", __file__]))
@@ -0,0 +1,128 @@
+"""
+Tenant isolation: an admin can only reach the students of their own tutors.
+
+    python -m pytest -q test_tenant_isolation.py
+"""
+import os
+import tempfile
+from datetime import date
+
+# Scratch database and no Gemini key, set before the app reads its configuration
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='tenants-'), 'test.db')}"
+os.environ["GOOGLE_API_KEY"] = ""
+
+import pytest  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+from sqlmodel import SQLModel, Session, select  # noqa: E402
+
+import main  # noqa: E402
+from main import app  # noqa: E402
+from db import engine  # noqa: E402
+from models import User, Tutor, Student, SubjectRanking, TestRecord  # noqa: E402
+from rankings import get_rankings_by_student, refresh_rankings  # noqa: E402
+
+
+@pytest.fixture(scope="module")
+def tenants() -> dict[str, int]:
+    """Two admins with one tutor and one student each; returns username -> that admin's student id."""
+    SQLModel.metadata.create_all(engine)
+    students = {}
+    with Session(engine) as session:
+        for name in ("tenant_a", "tenant_b"):
+            admin = User(username=name, password="x", user_type="admin")
+            session.add(admin)
+            session.commit()
+            tutor = Tutor(name=f"{name} tutor", subject="Mathematics", phone="0", user_id=admin.id)
+            session.add(tutor)
+            session.commit()
+            student = Student(name=f"{name} student", grade="8", syllabus="CBSE", tutor_id=tutor.id)
+            session.add(student)
+            session.commit()
+            students[name] = student.id
+    return students
+
+
+def _client(username: str) -> TestClient:
+    return TestClient(app, cookies={"username": username}, raise_server_exceptions=False)
+
+
+@pytest.mark.parametrize("path", ["/reports/student/{id}", "/api/v1/students/{id}"])
+def test_admin_reads_own_student(tenants, path):
+    response = _client("tenant_a").get(path.format(id=tenants["tenant_a"]), follow_redirects=False)
+    assert response.status_code == 200
+
+
+@pytest.mark.parametrize("path", ["/reports/student/{id}", "/api/v1/students/{id}"])
+def test_admin_cannot_read_other_tenants_student(tenants, path):
+    response = _client("tenant_a").get(path.format(id=tenants["tenant_b"]), follow_redirects=False)
+    assert response.status_code == 403
+
+
+def test_admin_cannot_delete_other_tenants_student(tenants):
+    response = _client("tenant_a").post(f"/student/{tenants['tenant_b']}/delete", follow_redirects=False)
+    assert response.status_code == 403
+    with Session(engine) as session:
+        assert session.get(Student, tenants["tenant_b"]) is not None
+
+
+def test_all_reports_cover_only_own_students(tenants, monkeypatch):
+    seen = {}
+
+    def build(students, tests_by_student, rankings_by_student):
+        seen["students"] = [s.id for s in students]
+        seen["tests"] = set(tests_by_student)
+        return main.BytesIO(b"%PDF")
+
+    monkeypatch.setattr(main, "build_all_reports_pdf", build)
+    response = _client("tenant_a").get("/reports/all/download", follow_redirects=False)
+    assert response.status_code == 200
+    assert seen == {"students": [tenants["tenant_a"]], "tests": {tenants["tenant_a"]}}
+
+
+def test_rankings_compare_only_own_students(tenants):
+    """Both students are in grade 8 CBSE, but at different centres: each ranks alone."""
+    with Session(engine) as session:
+        for marks, student_id in zip((10, 20), tenants.values()):
+            session.add(TestRecord(student_id=student_id, subject="Mathematics", topic="Ranking",
+                                   test_date=date(2025, 1, 1), total_marks=25, marks_attained=marks, remarks=""))
+        session.commit()
+        refresh_rankings(session)
+        rankings = get_rankings_by_student(session, list(tenants.values()))
+    for student_id in tenants.values():
+        [ranking] = rankings[student_id]
+        assert (ranking.cohort_rank, ranking.cohort_size) == (1, 1)
+
+
+def test_deleting_a_tutor_reranks_the_cohort():
+    """Three grade 9 students of one admin, split over two tutors; the second tutor is deleted."""
+    with Session(engine) as session:
+        admin = User(username="tenant_c", password="x", user_type="admin")
+        session.add(admin)
+        session.commit()
+        tutors = [Tutor(name=f"tenant_c tutor {i}", subject="Science", phone="0", user_id=admin.id) for i in range(2)]
+        session.add_all(tutors)
+        session.commit()
+        students = [Student(name=f"tenant_c student {i}", grade="9", syllabus="ICSE", tutor_id=tutor.id)
+                    for i, tutor in enumerate([tutors[0], tutors[1], tutors[1]])]
+        session.add_all(students)
+        session.commit()
+        for marks, student in zip((10, 20, 15), students):
+            session.add(TestRecord(student_id=student.id, subject="Science", topic="Ranking",
+                                   test_date=date(2025, 1, 1), total_marks=25, marks_attained=marks, remarks=""))
+        session.commit()
+        refresh_rankings(session, admin.id)
+        student_ids = [s.id for s in students]
+        assert [r.cohort_rank for r in session.exec(
+            select(SubjectRanking).where(SubjectRanking.student_id == student_ids[0]))] == [3]
+        tutor_id = tutors[1].id
+
+    response = _client("tenant_c").post(f"/tutor/{tutor_id}/delete", follow_redirects=False)
+    assert response.status_code == 303
+    with Session(engine) as session:
+        rankings = session.exec(select(SubjectRanking).where(SubjectRanking.student_id.in_(student_ids))).all()
+        assert [(r.student_id, r.cohort_rank, r.cohort_size) for r in rankings] == [(student_ids[0], 1, 1)]
+        assert session.exec(select(TestRecord).where(TestRecord.student_id.in_(student_ids[1:]))).all() == []
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main(["-q", __file__]))
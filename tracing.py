@@ -0,0 +1,281 @@
+from __future__ import annotations
+import atexit
+import functools
+import hmac
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+import requests
+from sqlalchemy import event
+
+logger = logging.getLogger("tracing")
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+# Fraction of requests traced
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0"))
+# A request can force tracing with the header "X-Trace: <TRACE_FORCE_SECRET>"; unset, nobody can
+TRACE_FORCE_SECRET = os.getenv("TRACE_FORCE_SECRET", "")
+# "file" writes OTLP/JSON lines to TRACE_FILE, "otlp" posts them to TRACE_OTLP_ENDPOINT, "none" drops them
+TRACE_EXPORTER = os.getenv("TRACE_EXPORTER", "file")
+TRACE_FILE = os.getenv("TRACE_FILE", os.path.join(BASE_DIR, "traces", "traces.jsonl"))
+# TRACE_FILE is rotated to TRACE_FILE.1 past this size, so at most twice this is kept on disk
+TRACE_FILE_MAX_BYTES = int(os.getenv("TRACE_FILE_MAX_BYTES", str(50 * 1024 * 1024)))
+TRACE_OTLP_ENDPOINT = os.getenv("TRACE_OTLP_ENDPOINT", "http://localhost:4318/v1/traces")
+SERVICE_NAME = "tuition_center_fastapi"
+
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_SERVER = 2
+SPAN_KIND_CLIENT = 3
+
+
+# ---------------- Spans ----------------
+class Span:
+    __slots__ = ("trace", "span_id", "parent_id", "name", "kind", "start_ns", "end_ns", "attributes", "error")
+
+    def __init__(self, trace: "Trace", name: str, parent_id: str | None, kind: int, attributes: dict):
+        self.trace = trace
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.start_ns = time.time_ns()
+        self.end_ns = 0
+        self.attributes = attributes
+        self.error = None
+
+    def set(self, key: str, value) -> None:
+        self.attributes[key] = value
+
+    def finish(self) -> None:
+        self.end_ns = time.time_ns()
+        self.trace.spans.append(self)
+
+    def to_otlp(self) -> dict:
+        span = {
+            "traceId": self.trace.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": [_otlp_attribute(k, v) for k, v in self.attributes.items()],
+            "status": {"code": 2, "message": self.error} if self.error else {"code": 1},
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        return span
+
+
+class Trace:
+    """All spans of one request; finished spans are appended from whichever thread ran them."""
+    __slots__ = ("trace_id", "spans")
+
+    def __init__(self):
+        self.trace_id = os.urandom(16).hex()
+        self.spans: list[Span] = []
+
+
+def _otlp_attribute(key: str, value) -> dict:
+    if isinstance(value, bool):
+        return {"key": key, "value": {"boolValue": value}}
+    if isinstance(value, int):
+        return {"key": key, "value": {"intValue": str(value)}}
+    if isinstance(value, float):
+        return {"key": key, "value": {"doubleValue": value}}
+    return {"key": key, "value": {"stringValue": str(value)}}
+
+
+_current: ContextVar[Span | None] = ContextVar("current_span", default=None)
+
+
+def current_span() -> Span | None:
+    return _current.get()
+
+
+@contextmanager
+def span(name: str, kind: int = SPAN_KIND_INTERNAL, **attributes):
+    """
+    Records a child of the current span. Outside a sampled request this does
+    nothing and yields None, so call sites can stay unconditional.
+    """
+    parent = _current.get()
+    if parent is None:
+        yield None
+        return
+    child = Span(parent.trace, name, parent.span_id, kind, attributes)
+    token = _current.set(child)
+    try:
+        yield child
+    except Exception as e:
+        child.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        _current.reset(token)
+        child.finish()
+
+
+def traced(name: str | None = None):
+    """Decorator form of span() for helper functions."""
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name or func.__name__):
+                return func(*args, **kwargs)
+        return wrapper
+
+    return decorator
+
+
+# ---------------- SQL spans ----------------
+def instrument_engine(engine) -> None:
+    """Opens a client span around every SQL statement executed inside a sampled request."""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        parent = _current.get()
+        if parent is None:
+            return
+        sql_span = Span(parent.trace, "db.query", parent.span_id, SPAN_KIND_CLIENT, {
+            "db.system": engine.url.get_backend_name(),
+            "db.statement": " ".join(statement.split())[:500],
+        })
+        conn.info.setdefault("trace_spans", []).append(sql_span)
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        spans = conn.info.get("trace_spans")
+        if spans:
+            sql_span = spans.pop()
+            sql_span.set("db.rowcount", cursor.rowcount)
+            sql_span.finish()
+
+    @event.listens_for(engine, "handle_error")
+    def _error(exception_context):
+        conn = exception_context.connection
+        spans = conn.info.get("trace_spans") if conn is not None else None
+        if spans:
+            sql_span = spans.pop()
+            sql_span.error = str(exception_context.original_exception)
+            sql_span.finish()
+
+
+# ---------------- Export ----------------
+class _Exporter:
+    """Ships finished traces from a background thread so requests never wait on I/O."""
+
+    def __init__(self):
+        self.queue: queue.Queue = queue.Queue(maxsize=1000)
+        self.thread = None
+        self.lock = threading.Lock()
+
+    def submit(self, trace: Trace) -> None:
+        if TRACE_EXPORTER == "none":
+            return
+        if self.thread is None:
+            with self.lock:
+                if self.thread is None:
+                    self.thread = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+                    self.thread.start()
+                    atexit.register(self.flush)
+        try:
+            self.queue.put_nowait(trace)
+        except queue.Full:
+            logger.warning("Trace export queue full; dropping trace %s", trace.trace_id)
+
+    def flush(self) -> None:
+        self.queue.join()
+
+    def _run(self) -> None:
+        while True:
+            trace = self.queue.get()
+            try:
+                self._export(_to_otlp(trace))
+            except Exception as e:
+                logger.warning("Failed to export trace %s: %s", trace.trace_id, e)
+            finally:
+                self.queue.task_done()
+
+    def _export(self, payload: dict) -> None:
+        if TRACE_EXPORTER == "otlp":
+            requests.post(TRACE_OTLP_ENDPOINT, json=payload, timeout=5).raise_for_status()
+        else:
+            os.makedirs(os.path.dirname(TRACE_FILE), exist_ok=True)
+            try:
+                if os.path.getsize(TRACE_FILE) >= TRACE_FILE_MAX_BYTES:
+                    os.replace(TRACE_FILE, TRACE_FILE + ".1")  # only the exporter thread writes here
+            except FileNotFoundError:
+                pass
+            with open(TRACE_FILE, "a") as f:
+                f.write(json.dumps(payload) + "\n")
+
+
+def _to_otlp(trace: Trace) -> dict:
+    return {
+        "resourceSpans": [{
+            "resource": {"attributes": [_otlp_attribute("service.name", SERVICE_NAME)]},
+            "scopeSpans": [{
+                "scope": {"name": "tracing"},
+                "spans": [s.to_otlp() for s in sorted(trace.spans, key=lambda s: s.start_ns)],
+            }],
+        }]
+    }
+
+
+exporter = _Exporter()
+
+
+# ---------------- Middleware ----------------
+def _sampled(scope) -> bool:
+    if TRACE_FORCE_SECRET:
+        for key, value in scope.get("headers", []):
+            if key == b"x-trace" and hmac.compare_digest(value, TRACE_FORCE_SECRET.encode()):
+                return True
+    return TRACE_SAMPLE_RATE > 0 and random.random() < TRACE_SAMPLE_RATE
+
+
+class TracingMiddleware:
+    """Opens a server span per sampled request and exports the finished trace."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not _sampled(scope):
+            await self.app(scope, receive, send)
+            return
+
+        trace = Trace()
+        root = Span(trace, f"{scope['method']} {scope['path']}", None, SPAN_KIND_SERVER, {
+            "http.method": scope["method"],
+            "http.target": scope["path"],
+        })
+        token = _current.set(root)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                root.set("http.status_code", message["status"])
+                message = {**message, "headers": list(message.get("headers", [])) + [
+                    (b"x-trace-id", trace.trace_id.encode())
+                ]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except Exception as e:
+            root.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            _current.reset(token)
+            route = scope.get("route")
+            if route is not None:
+                root.name = f"{scope['method']} {route.path}"
+                root.set("http.route", route.path)
+            root.finish()
+            exporter.submit(trace)